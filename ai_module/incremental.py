@@ -0,0 +1,317 @@
+"""
+Incremental clustering: new feedback is assigned to the clusters found by
+earlier runs instead of re-clustering from scratch.
+
+The state (kept per institute by storage.get/update_cluster_state) holds a
+growing vocabulary with document frequencies, so TF-IDF vectors of new
+items live in the same space as the stored centroids; each cluster's
+centroid and count, updated as a running mean (the nearest-centroid form of
+a MiniBatchKMeans partial_fit); and the last LLM analysis of each cluster.
+
+New items join the most similar centroid when the cosine similarity is at
+least `assign_threshold`. Items far from every centroid are clustered among
+themselves, and groups of at least `min_new_cluster` items become new
+clusters. A cluster is sent to the LLM again only if it is new, has never
+been analyzed, or has grown by `reanalyze_ratio` since its last analysis.
+
+Themes and keywords are the top terms of each centroid relative to the mean
+of all centroids, recomputed whenever a cluster receives feedback.
+"""
+import math
+
+import numpy as np
+from scipy import sparse
+from sklearn.cluster import KMeans
+from sklearn.feature_extraction.text import CountVectorizer
+from sklearn.preprocessing import normalize
+
+from .processor import GENERAL_THEME, theme_from_terms, top_terms
+
+STATE_VERSION = 1
+
+
+class IncrementalClusterer:
+    def __init__(self, processor, state=None, n_clusters='auto', assign_threshold=0.15,
+                 min_new_cluster=3, reanalyze_ratio=0.25, max_vocab=5000, n_keywords=8):
+        self.processor = processor
+        self.n_clusters = n_clusters
+        self.assign_threshold = assign_threshold
+        self.min_new_cluster = min_new_cluster
+        self.reanalyze_ratio = reanalyze_ratio
+        self.max_vocab = max_vocab
+        self.n_keywords = n_keywords
+        self._analyzer = CountVectorizer(stop_words='english').build_analyzer()
+
+        if state and state.get('version') == STATE_VERSION:
+            self.vocabulary = state['vocabulary']
+            self.df = state['df']
+            self.n_docs = state['n_docs']
+            self.next_cluster_id = state['next_cluster_id']
+            self.clusters = state['clusters']
+        else:
+            self.vocabulary, self.df, self.n_docs = [], [], 0
+            self.next_cluster_id = 0
+            self.clusters = []
+        self._index = {term: i for i, term in enumerate(self.vocabulary)}
+
+    # --- Vector space ---
+    def _tokens(self, items):
+        return [self._analyzer(self.processor.preprocess(item['text'])) for item in items]
+
+    def _extended_vocabulary(self, token_lists):
+        """
+        The stored vocabulary plus this batch's new terms, with document
+        frequencies counting the batch, as copies: the state itself only
+        takes a group's terms in apply(). New terms are appended, so stored
+        centroid indices stay valid in the extended space.
+        """
+        vocabulary, index, df = list(self.vocabulary), dict(self._index), list(self.df)
+        for tokens in token_lists:
+            for term in set(tokens):
+                i = index.get(term)
+                if i is None:
+                    if len(vocabulary) >= self.max_vocab:
+                        continue
+                    i = index[term] = len(vocabulary)
+                    vocabulary.append(term)
+                    df.append(0)
+                df[i] += 1
+        return vocabulary, index, df, self.n_docs + len(token_lists)
+
+    @staticmethod
+    def _vectorize(token_lists, index, df, n_docs):
+        rows, cols, vals = [], [], []
+        for r, tokens in enumerate(token_lists):
+            counts = {}
+            for term in tokens:
+                i = index.get(term)
+                if i is not None:
+                    counts[i] = counts.get(i, 0) + 1
+            rows.extend([r] * len(counts))
+            cols.extend(counts.keys())
+            vals.extend(counts.values())
+        tf = sparse.csr_matrix((vals, (rows, cols)), shape=(len(token_lists), len(df)), dtype=np.float64)
+        if not len(df):
+            # Only stop words so far: no features to weight
+            return tf
+        # Same smoothed IDF and L2 norm as TfidfVectorizer's defaults
+        idf = np.log((1 + n_docs) / (1 + np.asarray(df, dtype=np.float64))) + 1
+        return normalize(tf.multiply(idf).tocsr())
+
+    def _centroid(self, cluster, size=None):
+        vec = np.zeros(size or len(self.vocabulary))
+        for i, value in cluster['centroid']:
+            vec[i] = value
+        return vec
+
+    @staticmethod
+    def _sparse_centroid(vec):
+        nz = np.flatnonzero(vec)
+        return [[int(i), round(float(vec[i]), 6)] for i in nz]
+
+    def seed(self, clusters, analyses):
+        """
+        Starts an empty state from clusters found by a full clustering (e.g.
+        the first window of a run) and their analyses, so later feedback is
+        assigned to them instead of forming clusters of its own.
+        """
+        token_lists = [self._tokens(c['items']) for c in clusters]
+        vocabulary, index, df, n_docs = self._extended_vocabulary([t for tokens in token_lists for t in tokens])
+        self.vocabulary, self._index, self.df, self.n_docs = vocabulary, index, df, n_docs
+        for cluster, tokens, analysis in zip(clusters, token_lists, analyses):
+            centroid = np.asarray(self._vectorize(tokens, index, df, n_docs).mean(axis=0)).ravel()
+            self.clusters.append({
+                'cluster_id': self.next_cluster_id, 'theme': cluster['theme'],
+                'keywords': cluster.get('keywords', []), 'count': len(tokens),
+                'centroid': self._sparse_centroid(centroid),
+                'analysis': dict(analysis, analyzed_count=len(tokens))
+            })
+            self.next_cluster_id += 1
+
+    # --- Assignment ---
+    def assign(self, feedback_items):
+        """
+        Groups new items by cluster. Returns a list of groups
+        {'cluster_id', 'theme', 'keywords', 'items', 'is_new', 'reanalyze', 'sum',
+        'terms', 'vocabulary'}, with items nearest the updated centroid first.
+        Nothing is stored yet, not even the batch's vocabulary or new cluster
+        ids: the state only changes when a group is passed to apply(), so a
+        group that is dropped (e.g. degraded) leaves no trace.
+        """
+        if not feedback_items:
+            return []
+        token_lists = self._tokens(feedback_items)
+        vocabulary, index, df, n_docs = self._extended_vocabulary(token_lists)
+        X = self._vectorize(token_lists, index, df, n_docs)
+        size = len(vocabulary)
+
+        labels = np.full(len(feedback_items), -1)
+        # Nearest cluster of each item. Without any terms there is nothing to compare, so the largest one.
+        best = np.full(len(feedback_items), int(np.argmax([c['count'] for c in self.clusters])) if self.clusters else -1)
+        if self.clusters and size:
+            C = normalize(np.vstack([self._centroid(c, size) for c in self.clusters]))
+            sims = np.asarray(X @ C.T)
+            best = sims.argmax(axis=1)
+            near = sims[np.arange(len(best)), best] >= self.assign_threshold
+            labels[near] = best[near]
+
+        groups = {}
+        far = np.flatnonzero(labels < 0)
+        if len(far):
+            cold_start = not self.clusters
+            # Without any terms there is nothing to split on
+            limit = (len(far) if cold_start else len(far) // self.min_new_cluster) if size else 1
+            sub_labels = np.zeros(len(far), dtype=int)
+            next_cluster_id = self.next_cluster_id
+            if self.n_clusters == 'auto':
+                k, centers = self.processor.select_k(X[far], k_max=limit) if limit >= 2 else (1, None)
+                if k > 1:
+                    sub_labels = KMeans(n_clusters=k, init=centers, n_init=1, random_state=42).fit_predict(X[far])
+            else:
+                k = max(1, min(self.n_clusters, limit))
+                if k > 1:
+                    sub_labels = KMeans(n_clusters=k, random_state=42, n_init=10).fit_predict(X[far])
+            for sub in np.unique(sub_labels):
+                members = far[sub_labels == sub]
+                if cold_start or len(members) >= self.min_new_cluster:
+                    cid = next_cluster_id
+                    next_cluster_id += 1
+                    # A first batch that forms one cluster is labelled like cluster_feedback labels it
+                    theme = GENERAL_THEME if cold_start and k == 1 else f'Cluster {cid + 1}'
+                    groups[('new', cid)] = {'cluster_id': cid, 'theme': theme, 'members': members, 'is_new': True}
+                else:
+                    # Too few to stand on their own: join the nearest existing cluster
+                    labels[members] = best[members]
+
+        for pos, cluster in enumerate(self.clusters):
+            members = np.flatnonzero(labels == pos)
+            if len(members):
+                groups[('old', pos)] = {'cluster_id': cluster['cluster_id'], 'theme': cluster['theme'],
+                                        'members': members, 'is_new': False}
+
+        result, centroids, counts = [], [], []
+        for group in groups.values():
+            members = group.pop('members')
+            group['sum'] = np.asarray(X[members].sum(axis=0)).ravel()
+            group['vocabulary'] = vocabulary
+            # Document frequency each in-vocabulary term gains from this group's items
+            terms = {}
+            for m in members:
+                for term in set(token_lists[m]):
+                    if term in index:
+                        terms[term] = terms.get(term, 0) + 1
+            group['terms'] = terms
+            cluster = None if group['is_new'] else self._find(group['cluster_id'])
+            n = cluster['count'] if cluster else 0
+            centroid = ((self._centroid(cluster, size) * n if cluster else 0) + group['sum']) / (n + len(members))
+            # Nearest the centroid first, so they lead the LLM input and the samples
+            nearest = np.argsort(-(X[members] @ centroid), kind='stable')
+            group['items'] = [feedback_items[i] for i in members[nearest]]
+            group['reanalyze'] = self._needs_analysis(group)
+            result.append(group)
+            centroids.append(centroid)
+            counts.append(n + len(members))
+
+        # Label against every cluster, including those that got nothing this time
+        touched = {g['cluster_id'] for g in result}
+        for cluster in self.clusters:
+            if cluster['cluster_id'] not in touched:
+                centroids.append(self._centroid(cluster, size))
+                counts.append(cluster['count'])
+        centroids, counts = np.vstack(centroids), np.asarray(counts, dtype=np.float64)
+        distinct = centroids[:len(result)] - (counts @ centroids) / counts.sum()
+        for group, keywords in zip(result, top_terms(distinct, vocabulary, self.n_keywords)):
+            group['keywords'] = keywords
+            if group['theme'] != GENERAL_THEME:
+                group['theme'] = theme_from_terms(keywords, group['theme'])
+        return result
+
+    def _find(self, cluster_id):
+        return next((c for c in self.clusters if c['cluster_id'] == cluster_id), None)
+
+    def _needs_analysis(self, group):
+        cluster = self._find(group['cluster_id'])
+        if group['is_new'] or cluster is None or not cluster.get('analysis'):
+            return True
+        analyzed = cluster['analysis']['analyzed_count']
+        grown = cluster['count'] + len(group['items']) - analyzed
+        return grown >= math.ceil(self.reanalyze_ratio * max(analyzed, 1))
+
+    def apply(self, group, analysis=None):
+        """
+        Folds a group into its cluster, adding its terms and documents to the
+        vocabulary, and, if given, records its new LLM analysis.
+        """
+        for term, count in group['terms'].items():
+            i = self._index.get(term)
+            if i is None:
+                i = self._index[term] = len(self.vocabulary)
+                self.vocabulary.append(term)
+                self.df.append(0)
+            self.df[i] += count
+        self.n_docs += len(group['items'])
+        self.next_cluster_id = max(self.next_cluster_id, group['cluster_id'] + 1)
+
+        # The group's sum is in assign()'s extended space; move it to the stored indices
+        group_sum = np.zeros(len(self.vocabulary))
+        nz = np.flatnonzero(group['sum'])
+        group_sum[[self._index[group['vocabulary'][i]] for i in nz]] = group['sum'][nz]
+
+        cluster = self._find(group['cluster_id'])
+        if cluster is None:
+            cluster = {'cluster_id': group['cluster_id'], 'theme': group['theme'],
+                       'count': 0, 'centroid': [], 'analysis': None}
+            self.clusters.append(cluster)
+        n, m = cluster['count'], len(group['items'])
+        centroid = (self._centroid(cluster) * n + group_sum) / (n + m)
+        cluster['centroid'] = self._sparse_centroid(centroid)
+        cluster['count'] = n + m
+        cluster['theme'] = group['theme']
+        cluster['keywords'] = group.get('keywords', [])
+        if analysis is not None:
+            cluster['analysis'] = dict(analysis, analyzed_count=cluster['count'])
+
+    def rebased(self, state, applied):
+        """
+        A clusterer over `state` (saved since this one was loaded, e.g. by
+        another worker) with the (group, analysis) pairs this one applied
+        folded in again. Groups that opened a cluster get an id free in state.
+        """
+        other = IncrementalClusterer(self.processor, state, self.n_clusters, self.assign_threshold,
+                                     self.min_new_cluster, self.reanalyze_ratio, self.max_vocab, self.n_keywords)
+        for group, analysis in applied:
+            if group['is_new']:
+                group = dict(group, cluster_id=other.next_cluster_id)
+            other.apply(group, analysis)
+        return other
+
+    def analysis_texts(self, group):
+        """New items first, then the samples the cluster was last analyzed with."""
+        texts = [item['text'] for item in group['items']]
+        cluster = self._find(group['cluster_id'])
+        if cluster and cluster.get('analysis'):
+            texts += [t for t in cluster['analysis'].get('sample_texts', []) if t not in texts]
+        return texts
+
+    # --- Output ---
+    def entries(self):
+        """Result entries for every analyzed cluster, with cumulative counts."""
+        return [{
+            'theme': c['theme'],
+            'keywords': c.get('keywords', []),
+            'count': c['count'],
+            'problem_statement': c['analysis']['problem_statement'],
+            'solutions': c['analysis']['solutions'],
+            'sample_texts': c['analysis']['sample_texts']
+        } for c in self.clusters if c.get('analysis')]
+
+    @property
+    def state(self):
+        return {
+            'version': STATE_VERSION,
+            'vocabulary': self.vocabulary,
+            'df': self.df,
+            'n_docs': self.n_docs,
+            'next_cluster_id': self.next_cluster_id,
+            'clusters': self.clusters
+        }
@@ -0,0 +1,205 @@
+"""
+Disk-backed cache for LLM outputs, so re-running the pipeline over the same
+clusters (e.g. run_analysis_local.py, which resets every processed flag) does
+not pay for identical calls again.
+
+Entries are keyed by a SHA-256 of the model name, PROMPT_VERSION, the method
+and its normalized inputs, and stored in a SQLite file (LLM_CACHE_PATH). When
+the stored values exceed LLM_CACHE_MAX_MB, the least recently used entries are
+evicted. Set LLM_CACHE=off to disable it.
+"""
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from contextlib import closing
+
+from ai_module.llm_client import LLMClient, PROMPT_VERSION, is_error_output
+from ai_module.resilience import LLMUnavailableError
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS llm_cache (
+    key TEXT PRIMARY KEY,
+    method TEXT NOT NULL,
+    value TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    created_at REAL NOT NULL,
+    last_used REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS ix_llm_cache_last_used ON llm_cache (last_used);
+"""
+
+
+def _normalize(text):
+    return re.sub(r'\s+', ' ', str(text)).strip()
+
+
+def cache_key(model_name, method, inputs):
+    """inputs is a list of texts (cluster feedback) or a single string (problem statement)."""
+    if isinstance(inputs, (list, tuple)):
+        # Cluster membership, not fetch order, determines the analysis
+        inputs = sorted(_normalize(t) for t in inputs)
+    else:
+        inputs = _normalize(inputs)
+    payload = json.dumps([model_name, PROMPT_VERSION, method, inputs], ensure_ascii=False)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+class LLMResponseCache:
+    def __init__(self, path, max_bytes=64 * 1024 * 1024):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with closing(self._connect()) as conn:
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.executescript(SCHEMA)
+
+    def _connect(self):
+        return sqlite3.connect(self.path, timeout=30, isolation_level=None)
+
+    def get(self, key):
+        """Returns (hit, value)."""
+        with closing(self._connect()) as conn:
+            row = conn.execute('SELECT value FROM llm_cache WHERE key = ?', (key,)).fetchone()
+            if row is not None:
+                conn.execute('UPDATE llm_cache SET last_used = ? WHERE key = ?', (time.time(), key))
+        with self._lock:
+            if row is None:
+                self.misses += 1
+                return False, None
+            self.hits += 1
+        return True, json.loads(row[0])
+
+    def set(self, key, method, value):
+        data = json.dumps(value, ensure_ascii=False)
+        now = time.time()
+        with closing(self._connect()) as conn:
+            conn.execute(
+                'INSERT OR REPLACE INTO llm_cache (key, method, value, size, created_at, last_used) '
+                'VALUES (?, ?, ?, ?, ?, ?)',
+                (key, method, data, len(data.encode('utf-8')), now, now)
+            )
+            self._evict(conn)
+
+    def _evict(self, conn):
+        total = conn.execute('SELECT COALESCE(SUM(size), 0) FROM llm_cache').fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        # Free down to 90% of the budget so every insert does not trigger eviction
+        excess = total - int(self.max_bytes * 0.9)
+        doomed = []
+        for key, size in conn.execute('SELECT key, size FROM llm_cache ORDER BY last_used'):
+            doomed.append((key,))
+            excess -= size
+            if excess <= 0:
+                break
+        conn.executemany('DELETE FROM llm_cache WHERE key = ?', doomed)
+
+    def clear(self):
+        with closing(self._connect()) as conn:
+            conn.execute('DELETE FROM llm_cache')
+
+    def stats(self):
+        with closing(self._connect()) as conn:
+            entries, size = conn.execute('SELECT COUNT(*), COALESCE(SUM(size), 0) FROM llm_cache').fetchone()
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_ratio': round(self.hits / total, 4) if total else 0.0,
+                'entries': entries,
+                'bytes': size,
+                'max_bytes': self.max_bytes
+            }
+
+
+class CachedLLMClient(LLMClient):
+    """
+    Wraps another client. With bypass=True, lookups are skipped but fresh
+    outputs are still stored, which refreshes the cache. Error placeholders
+    are never stored.
+    """
+
+    def __init__(self, client, cache, bypass=False):
+        self.client = client
+        self.cache = cache
+        self.bypass = bypass
+        self.model_name = client.model_name
+        self.supports_batch = client.supports_batch
+        self.usage = client.usage
+
+    def _cached(self, method, inputs, call):
+        key = cache_key(self.model_name, method, inputs)
+        if not self.bypass:
+            hit, value = self.cache.get(key)
+            if hit:
+                return value
+        value = call()
+        if not is_error_output(value):
+            self.cache.set(key, method, value)
+        return value
+
+    def generate_problem_statement(self, texts):
+        return self._cached('generate_problem_statement', texts,
+                            lambda: self.client.generate_problem_statement(texts))
+
+    def suggest_solutions(self, problem_statement):
+        return self._cached('suggest_solutions', problem_statement,
+                            lambda: self.client.suggest_solutions(problem_statement))
+
+    def analyze_clusters(self, clusters_texts):
+        """
+        Clusters whose problem statement and solutions are both cached are
+        answered locally; only the rest go to the wrapped client's batch call.
+        Entries are shared with the per-cluster methods.
+        """
+        results = [None] * len(clusters_texts)
+        missing = []
+        for idx, texts in enumerate(clusters_texts):
+            if not self.bypass:
+                hit, problem_statement = self.cache.get(cache_key(self.model_name, 'generate_problem_statement', texts))
+                if hit:
+                    hit, solutions = self.cache.get(cache_key(self.model_name, 'suggest_solutions', problem_statement))
+                    if hit:
+                        results[idx] = {'problem_statement': problem_statement, 'solutions': solutions}
+                        continue
+            missing.append(idx)
+
+        if missing:
+            fresh = self.client.analyze_clusters([clusters_texts[idx] for idx in missing])
+            for idx, entry in zip(missing, fresh):
+                results[idx] = entry
+                if isinstance(entry, LLMUnavailableError):
+                    continue
+                ps, solutions = entry['problem_statement'], entry['solutions']
+                if not is_error_output(ps):
+                    self.cache.set(cache_key(self.model_name, 'generate_problem_statement', clusters_texts[idx]),
+                                   'generate_problem_statement', ps)
+                    if not is_error_output(solutions):
+                        self.cache.set(cache_key(self.model_name, 'suggest_solutions', ps), 'suggest_solutions', solutions)
+        return results
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_llm_cache():
+    """Process-wide cache configured from the environment, or None if LLM_CACHE=off."""
+    global _cache
+    if os.environ.get('LLM_CACHE', 'on').lower() in ('off', '0', 'false', 'no'):
+        return None
+    with _cache_lock:
+        if _cache is None:
+            path = os.environ.get('LLM_CACHE_PATH', os.path.join('data', 'llm_cache.db'))
+            max_bytes = int(float(os.environ.get('LLM_CACHE_MAX_MB', 64)) * 1024 * 1024)
+            _cache = LLMResponseCache(path, max_bytes)
+        return _cache
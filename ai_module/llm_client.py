@@ -1,5 +1,9 @@
 import os
 import json
+import threading
+import time
+
+from ai_module.resilience import LLMUnavailableError, get_resilient_caller
 
 # Try importing Vertex AI
 try:
@@ -9,21 +13,231 @@ try:
 except ImportError:
     VERTEX_AVAILABLE = False
 
+# Bump when the prompts below change, so cached outputs from old prompts are not reused
+PROMPT_VERSION = 1
+
+# Placeholders returned when a call fails. They must never be cached.
+PROBLEM_STATEMENT_ERROR = "Error generating problem statement."
+ERROR_SOLUTION_TITLES = ("Error generating solutions.", "AI Service Unavailable")
+
+def is_error_output(value):
+    if isinstance(value, str):
+        return value == PROBLEM_STATEMENT_ERROR
+    if isinstance(value, list):
+        return any(isinstance(s, dict) and s.get('solution_title') in ERROR_SOLUTION_TITLES for s in value)
+    return value is None
+
+# Rough input-token budget per batched request (about 4 characters per token)
+BATCH_TOKEN_BUDGET = int(os.environ.get('LLM_BATCH_TOKEN_BUDGET', 6000))
+# Output tokens reserved per cluster in a batched reply (problem statement and three solutions)
+BATCH_OUTPUT_TOKENS = int(os.environ.get('LLM_BATCH_OUTPUT_TOKENS', 800))
+
+BATCH_PROMPT = """
+You are analyzing student feedback that has already been grouped into clusters.
+{clusters}
+
+For EACH cluster, write:
+- 'problem_statement': a single, concise problem statement (max 2 sentences) summarizing the core issue.
+- 'solutions': a list of 3 concrete, actionable solutions. Each solution has
+  'solution_title' (string), 'steps' (list of strings),
+  'resources' (object with keys 'Investment' (Cost in Rupees), 'Labor', 'Support'),
+  'total_estimated_cost' (string in Rupees, e.g. "₹50,000") and
+  'sentiment' (strictly one of "Positive", "Neutral", "Negative").
+
+Return AS A VALID JSON LIST with one object per cluster:
+[{{"cluster": <cluster number>, "problem_statement": "...", "solutions": [...]}}]
+Do not include markdown formatting (like ```json). Just the raw JSON.
+"""
+
+def estimate_tokens(text):
+    """Rough token count (about 4 characters per token), for budgeting prompts before they are sent."""
+    return len(text) // 4 + 1
+
+def _api_usage(prompt_tokens, output_tokens):
+    """(prompt, output) tokens as counted by the API, or None when the response carried no counts."""
+    return (int(prompt_tokens), int(output_tokens or 0)) if prompt_tokens else None
+
+class TokenUsage:
+    """
+    Tokens of every request a client sends, for the run report: the API's own
+    counts when the response carries them, otherwise estimates (marked
+    'estimated'). Cache hits never reach the client, so they are not counted.
+    """
+
+    def __init__(self):
+        self.calls = []
+        self._lock = threading.Lock()
+
+    def record(self, method, prompt, output, usage=None):
+        if usage is not None:
+            call = {'method': method, 'prompt_tokens': usage[0], 'output_tokens': usage[1], 'estimated': False}
+        else:
+            call = {'method': method, 'prompt_tokens': estimate_tokens(prompt),
+                    'output_tokens': estimate_tokens(output) if isinstance(output, str) else 0, 'estimated': True}
+        with self._lock:
+            self.calls.append(call)
+
+    def report(self):
+        with self._lock:
+            calls = list(self.calls)
+        return {
+            'calls': len(calls),
+            'prompt_tokens': sum(c['prompt_tokens'] for c in calls),
+            'output_tokens': sum(c['output_tokens'] for c in calls),
+            'estimated_calls': sum(c['estimated'] for c in calls),
+            'per_call': calls
+        }
+
+def _parse_json(text):
+    text = text.strip()
+    if text.startswith('```json'):
+        text = text[7:]
+    elif text.startswith('```'):
+        text = text[3:]
+    if text.endswith('```'):
+        text = text[:-3]
+    return json.loads(text.strip())
+
 class LLMClient:
+    model_name = 'unknown'
+    # True when analyze_clusters answers several clusters per request
+    supports_batch = False
+
+    def __init__(self):
+        self.usage = TokenUsage()
+
     def generate_problem_statement(self, texts):
         raise NotImplementedError
 
     def suggest_solutions(self, problem_statement):
         raise NotImplementedError
 
+    def analyze_cluster(self, texts):
+        """Problem statement and solutions for one cluster, with one call per step."""
+        problem_statement = self.generate_problem_statement(texts)
+        return {'problem_statement': problem_statement,
+                'solutions': self.suggest_solutions(problem_statement)}
+
+    def analyze_clusters(self, clusters_texts):
+        """
+        Problem statement and solutions for every cluster (a list of text lists),
+        in the same order. Clients that can answer several clusters in one
+        request override this; by default each cluster is analyzed on its own.
+        Overrides may return a cluster's LLMUnavailableError in place of its
+        analysis when only some of their requests failed.
+        """
+        return [self.analyze_cluster(texts) for texts in clusters_texts]
+
+class BatchingLLMClient(LLMClient):
+    """
+    Sends many clusters in one structured prompt. Clusters are split into
+    several requests when the prompt would exceed BATCH_TOKEN_BUDGET or the
+    answers (BATCH_OUTPUT_TOKENS each) would exceed the model's
+    max_output_tokens, and any cluster missing from (or malformed in) the
+    reply is retried on its own. A batch that fails with LLMUnavailableError
+    returns that error for each of its clusters instead of raising, so the
+    other batches' answers survive. Subclasses implement
+    _generate(prompt) -> (text, usage), where usage is the API's
+    (prompt, output) token counts or None, routing the API call through
+    ai_module.resilience so failures raise LLMUnavailableError, and send
+    prompts through _request, which records their token usage.
+    """
+    token_budget = BATCH_TOKEN_BUDGET
+    # Most output tokens the model returns per request
+    max_output_tokens = 8192
+    supports_batch = True
+
+    def _generate(self, prompt):
+        raise NotImplementedError
+
+    def _request(self, method, prompt, **kwargs):
+        text, usage = self._generate(prompt, **kwargs)
+        self.usage.record(method, prompt, text, usage)
+        return text
+
+    def _batch_options(self, n_clusters):
+        """Extra _generate arguments for a batch of n_clusters, e.g. an output cap sized to it."""
+        return {}
+
+    def _split_batches(self, clusters_texts):
+        base = estimate_tokens(BATCH_PROMPT)
+        per_batch = max(1, self.max_output_tokens // BATCH_OUTPUT_TOKENS)
+        batches, current, used = [], [], base
+        for idx, texts in enumerate(clusters_texts):
+            cost = sum(estimate_tokens(t) + 2 for t in texts) + 10
+            if current and (used + cost > self.token_budget or len(current) >= per_batch):
+                batches.append(current)
+                current, used = [], base
+            current.append(idx)
+            used += cost
+        if current:
+            batches.append(current)
+        return batches
+
+    def _analyze_batch(self, clusters_texts, indices):
+        blocks = []
+        for n, idx in enumerate(indices, 1):
+            lines = "\n".join(f"- {t}" for t in clusters_texts[idx])
+            blocks.append(f"Cluster {n}:\n{lines}")
+        prompt = BATCH_PROMPT.format(clusters="\n\n".join(blocks))
+        try:
+            reply = _parse_json(self._request('analyze_clusters', prompt, **self._batch_options(len(indices))))
+        except LLMUnavailableError:
+            raise
+        except Exception as e:
+            print(f"{self.model_name} batch error: {e}")
+            return {}
+
+        parsed = {}
+        for entry in reply if isinstance(reply, list) else []:
+            try:
+                idx = indices[int(entry['cluster']) - 1]
+                problem_statement = str(entry['problem_statement']).strip()
+                solutions = entry['solutions']
+            except (KeyError, TypeError, ValueError, IndexError):
+                continue
+            if problem_statement and isinstance(solutions, list) and solutions:
+                parsed[idx] = {'problem_statement': problem_statement, 'solutions': solutions}
+        return parsed
+
+    def analyze_clusters(self, clusters_texts):
+        results = {}
+        for indices in self._split_batches(clusters_texts):
+            try:
+                results.update(self._analyze_batch(clusters_texts, indices))
+            except LLMUnavailableError as e:
+                # Only this batch's clusters are lost; the answers of earlier batches are kept
+                results.update((idx, e) for idx in indices)
+        for idx, texts in enumerate(clusters_texts):
+            if idx not in results:
+                # Fall back to the per-cluster prompts
+                try:
+                    results[idx] = self.analyze_cluster(texts)
+                except LLMUnavailableError as e:
+                    results[idx] = e
+        return [results[idx] for idx in range(len(clusters_texts))]
+
 class MockLLMClient(LLMClient):
+    model_name = 'mock'
+
+    def __init__(self, latency=0.0):
+        super().__init__()
+        # Simulated seconds per call, for benchmarking (MOCK_LLM_LATENCY_MS)
+        self.latency = latency
+
     def generate_problem_statement(self, texts):
+        if self.latency:
+            time.sleep(self.latency)
         # ROI: Return a generic statement based on first text
         summary = "Students are expressing concerns regarding: " + texts[0][:50] + "..."
-        return f"Mock Problem Statement: {summary}"
+        statement = f"Mock Problem Statement: {summary}"
+        self.usage.record('generate_problem_statement', "\n".join(f"- {t}" for t in texts), statement)
+        return statement
 
     def suggest_solutions(self, problem_statement):
         # ROI: Return detailed, high-impact solutions with Indian context (Rupees)
+        if self.latency:
+            time.sleep(self.latency)
         text = problem_statement.lower()
         
         if "internet" in text or "wifi" in text:
@@ -89,20 +303,39 @@ class MockLLMClient(LLMClient):
             total_cost = "₹1,00,000"
             sentiment = "Neutral"
             
-        return [{
+        solutions = [{
             "solution_title": solution_title,
             "steps": steps,
             "resources": resources,
             "total_estimated_cost": total_cost,
             "sentiment": sentiment
         }]
+        self.usage.record('suggest_solutions', problem_statement, json.dumps(solutions, ensure_ascii=False))
+        return solutions
+
+class VertexLLMClient(BatchingLLMClient):
+    # text-bison's output limit
+    max_output_tokens = 2048
 
-class VertexLLMClient(LLMClient):
     def __init__(self, project_id, location='us-central1'):
         if not VERTEX_AVAILABLE:
             raise RuntimeError("Vertex AI SDK not installed.")
+        super().__init__()
         vertexai.init(project=project_id, location=location)
-        self.model = TextGenerationModel.from_pretrained("text-bison")
+        self.model_name = "text-bison"
+        self.model = TextGenerationModel.from_pretrained(self.model_name)
+        self.resilience = get_resilient_caller('vertex')
+
+    def _generate(self, prompt, temperature=0.3, max_output_tokens=2048):
+        response = self.resilience.call(self.model.predict, prompt,
+                                        temperature=temperature, max_output_tokens=max_output_tokens)
+        metadata = getattr(getattr(response, 'raw_prediction_response', None), 'metadata', None) or {}
+        tokens = metadata.get('tokenMetadata', {})
+        return response.text, _api_usage(tokens.get('inputTokenCount', {}).get('totalTokens'),
+                                         tokens.get('outputTokenCount', {}).get('totalTokens'))
+
+    def _batch_options(self, n_clusters):
+        return {'max_output_tokens': min(self.max_output_tokens, n_clusters * BATCH_OUTPUT_TOKENS)}
 
     def generate_problem_statement(self, texts):
         combined_text = "\n".join([f"- {t}" for t in texts])
@@ -114,11 +347,12 @@ class VertexLLMClient(LLMClient):
         Problem Statement:
         """
         try:
-            response = self.model.predict(prompt, temperature=0.2, max_output_tokens=256)
-            return response.text.strip()
+            return self._request('generate_problem_statement', prompt, temperature=0.2, max_output_tokens=256).strip()
+        except LLMUnavailableError:
+            raise
         except Exception as e:
             print(f"Vertex AI Error: {e}")
-            return "Error generating problem statement."
+            return PROBLEM_STATEMENT_ERROR
 
     def suggest_solutions(self, problem_statement):
         prompt = f"""
@@ -136,18 +370,19 @@ class VertexLLMClient(LLMClient):
         Do not acknowledge or wrap in markdown. Just the raw JSON.
         """
         try:
-            response = self.model.predict(prompt, temperature=0.4, max_output_tokens=1024)
             # Parse JSON
-            text = response.text.strip()
+            text = self._request('suggest_solutions', prompt, temperature=0.4, max_output_tokens=1024).strip()
             if text.startswith('```json'):
                 text = text[7:]
             if text.endswith('```'):
                 text = text[:-3]
             return json.loads(text.strip())
+        except LLMUnavailableError:
+            raise
         except Exception as e:
             print(f"Vertex AI Error: {e}")
             return [{
-                "solution_title": "Error generating solutions.",
+                "solution_title": ERROR_SOLUTION_TITLES[0],
                 "steps": [],
                 "resources": {},
                 "total_estimated_cost": "Unknown"
@@ -160,13 +395,27 @@ try:
 except ImportError:
     GEMINI_AVAILABLE = False
 
-class GeminiLLMClient(LLMClient):
+class GeminiLLMClient(BatchingLLMClient):
     def __init__(self, api_key):
         if not GEMINI_AVAILABLE:
             raise RuntimeError("google-generativeai not installed.")
-        genai.configure(api_key=api_key)
+        super().__init__()
+        endpoint = os.environ.get('GEMINI_API_ENDPOINT')
+        if endpoint:
+            # Alternate endpoint, e.g. fake_llm_server.py. The REST transport accepts http:// URLs.
+            genai.configure(api_key=api_key, transport='rest', client_options={'api_endpoint': endpoint})
+        else:
+            genai.configure(api_key=api_key)
         # Use valid model name (gemini-1.5-flash is stable)
-        self.model = genai.GenerativeModel('gemini-1.5-flash')
+        self.model_name = 'gemini-1.5-flash'
+        self.model = genai.GenerativeModel(self.model_name)
+        self.resilience = get_resilient_caller('gemini')
+
+    def _generate(self, prompt):
+        response = self.resilience.call(self.model.generate_content, prompt)
+        metadata = getattr(response, 'usage_metadata', None)
+        return response.text, _api_usage(getattr(metadata, 'prompt_token_count', None),
+                                         getattr(metadata, 'candidates_token_count', None))
 
     def generate_problem_statement(self, texts):
         combined_text = "\n".join([f"- {t}" for t in texts])
@@ -178,11 +427,12 @@ class GeminiLLMClient(LLMClient):
         Problem Statement:
         """
         try:
-            response = self.model.generate_content(prompt)
-            return response.text.strip()
+            return self._request('generate_problem_statement', prompt).strip()
+        except LLMUnavailableError:
+            raise
         except Exception as e:
             print(f"Gemini Error: {e}")
-            return "Error generating problem statement."
+            return PROBLEM_STATEMENT_ERROR
 
     def suggest_solutions(self, problem_statement):
         prompt = f"""
@@ -200,18 +450,19 @@ class GeminiLLMClient(LLMClient):
         Do not include markdown formatting (like ```json). Just the raw JSON.
         """
         try:
-            response = self.model.generate_content(prompt)
-            text = response.text.strip()
+            text = self._request('suggest_solutions', prompt).strip()
             # Cleanup potential markdown
             if text.startswith('```json'):
                 text = text[7:]
             if text.endswith('```'):
                 text = text[:-3]
             return json.loads(text.strip())
+        except LLMUnavailableError:
+            raise
         except Exception as e:
             print(f"Gemini Error: {e}")
             return [{
-                "solution_title": "AI Service Unavailable",
+                "solution_title": ERROR_SOLUTION_TITLES[1],
                 "steps": ["Check API Key"],
                 "resources": {},
                 "total_estimated_cost": "N/A"
@@ -232,4 +483,4 @@ def get_llm_client():
         
     # 3. Fallback
     print("Using Mock LLM (Set GEMINI_API_KEY or GOOGLE_CLOUD_PROJECT to use AI)")
-    return MockLLMClient()
+    return MockLLMClient(latency=float(os.environ.get('MOCK_LLM_LATENCY_MS', 0)) / 1000)
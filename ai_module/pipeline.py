@@ -1,62 +1,726 @@
+import multiprocessing
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
+
 from ai_module.processor import TextProcessor
-from ai_module.llm_client import get_llm_client
+from ai_module.incremental import IncrementalClusterer
+from ai_module.vector_store import get_vector_store
+from ai_module.llm_client import get_llm_client, is_error_output
+from ai_module.llm_cache import CachedLLMClient, get_llm_cache
+from ai_module.resilience import LLMUnavailableError
+from ai_module.summarize import condense
+
+# Clusters analyzed at once. LLM calls are network-bound, so threads overlap the round trips.
+LLM_CONCURRENCY = int(os.environ.get('LLM_CONCURRENCY', 4))
+# Send all clusters in one structured prompt when the client supports it (Gemini, Vertex)
+LLM_BATCH = os.environ.get('LLM_BATCH', 'on').lower() not in ('off', '0', 'false', 'no')
+# 'full' re-clusters each run's new feedback from scratch; 'incremental' assigns it to saved clusters
+CLUSTER_MODE = os.environ.get('CLUSTER_MODE', 'full')
+# Number of clusters, or 'auto' to choose it per run (see TextProcessor.select_k)
+CLUSTER_COUNT = os.environ.get('CLUSTER_COUNT', 'auto')
+CLUSTER_COUNT = CLUSTER_COUNT if CLUSTER_COUNT == 'auto' else int(CLUSTER_COUNT)
+# Worker processes clustering institutes in parallel when a run covers all of them (0 = one per core)
+PIPELINE_PROCESSES = int(os.environ.get('PIPELINE_PROCESSES', 0)) or os.cpu_count() or 1
+# Most feedback items read, clustered and marked processed at a time; memory grows with the
+# window, not the backlog. In full mode an institute's first window is clustered from scratch
+# and later windows are merged into its clusters. A window of CLUSTER_LARGE_THRESHOLD items or
+# more is clustered by the large-scale engine, so keep this above that threshold to use it.
+PIPELINE_WINDOW = int(os.environ.get('PIPELINE_WINDOW', 100000))
+# How long a claimed window stays reserved for its worker; a crashed worker's rows are reclaimed after this.
+# A running worker renews its leases every third of this.
+FEEDBACK_LEASE_SECONDS = int(os.environ.get('FEEDBACK_LEASE_SECONDS', 900))
+
+def _cluster_count(n_items):
+    return CLUSTER_COUNT if CLUSTER_COUNT == 'auto' else min(CLUSTER_COUNT, n_items)
+
+def _no_progress(stage, **info):
+    pass
+
+def _cluster_texts(cluster):
+    return [item['text'] for item in cluster['items']]
+
+def _cluster_entry(cluster, analysis):
+    texts = _cluster_texts(cluster)
+    # Items nearest the centroid when the clusterer provides them
+    samples = [item['text'] for item in cluster.get('representatives', [])] or texts[:3]
+    return {
+        'theme': cluster['theme'],
+        'keywords': cluster.get('keywords', []),
+        'count': len(texts),
+        'problem_statement': analysis['problem_statement'],
+        'solutions': analysis['solutions'],
+        'sample_texts': samples # Store a few for reference
+    }
+
+def _degraded_entry(cluster, error):
+    # The LLM could not be reached; nothing is generated so nothing misleading is saved
+    print(f"Pipeline: Cluster {cluster['cluster_id']} degraded: {error}")
+    entry = _cluster_entry(cluster, {'problem_statement': None, 'solutions': []})
+    entry.update(degraded=True, error=str(error))
+    return entry
+
+def _analyzed_entry(cluster, analysis):
+    """
+    Result entry for an LLM analysis. The clients' parse-failure placeholders
+    (e.g. "Error generating problem statement.") are not analyses: such a
+    cluster is degraded, so its feedback stays unprocessed and is retried.
+    """
+    if is_error_output(analysis['problem_statement']) or is_error_output(analysis['solutions']):
+        return _degraded_entry(cluster, 'LLM returned an error placeholder instead of an analysis')
+    return _cluster_entry(cluster, analysis)
+
+def analyze_cluster(llm, cluster):
+    """Runs the LLM steps for one cluster and builds its result entry."""
+    print(f"Pipeline: Analyzing cluster {cluster['cluster_id']} with {len(cluster['items'])} items...")
+
+    # LLM Generation
+    try:
+        return _analyzed_entry(cluster, llm.analyze_cluster(condense(llm, _cluster_texts(cluster))))
+    except LLMUnavailableError as e:
+        return _degraded_entry(cluster, e)
+
+def _condensed_texts(llm, cluster):
+    # The error stands in for the texts, so one cluster's failed map step only degrades that cluster
+    try:
+        return condense(llm, _cluster_texts(cluster))
+    except LLMUnavailableError as e:
+        return e
+
+def analyze_clusters(llm, clusters, concurrency=None, progress=None, batch=None, on_entry=None):
+    """
+    Analyzes clusters with up to `concurrency` LLM calls in flight, or, in
+    batch mode, with as few multi-cluster requests as the client can manage.
+    Results come back in the same order as `clusters`. on_entry(index, entry)
+    is called in the calling thread as each entry is ready (for checkpoints).
+
+    Each cluster's texts are first condensed to the prompt token budget
+    (ai_module.summarize), so huge clusters send a representative sample or
+    map-reduced summaries rather than every text.
+    """
+    progress = progress or _no_progress
+    on_entry = on_entry or (lambda index, entry: None)
+    batch = LLM_BATCH if batch is None else batch
+    concurrency = max(1, min(concurrency or LLM_CONCURRENCY, len(clusters) or 1))
+    progress('analyze', clusters_done=0, clusters_total=len(clusters))
+    if batch and llm.supports_batch:
+        print(f"Pipeline: Analyzing {len(clusters)} clusters in batch mode...")
+        with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix='llm') as pool:
+            condensed = list(pool.map(lambda c: _condensed_texts(llm, c), clusters))
+        ready = [i for i, texts in enumerate(condensed) if not isinstance(texts, LLMUnavailableError)]
+        results = [_degraded_entry(c, texts) if isinstance(texts, LLMUnavailableError) else None
+                   for c, texts in zip(clusters, condensed)]
+        try:
+            analyses = llm.analyze_clusters([condensed[i] for i in ready]) if ready else []
+        except LLMUnavailableError as e:
+            return [_degraded_entry(c, e) for c in clusters]
+        for i, analysis in zip(ready, analyses):
+            # A batch that failed returns its error per cluster; the other batches' answers are kept
+            results[i] = (_degraded_entry(clusters[i], analysis) if isinstance(analysis, LLMUnavailableError)
+                          else _analyzed_entry(clusters[i], analysis))
+        for index, entry in enumerate(results):
+            on_entry(index, entry)
+        progress('analyze', clusters_done=len(clusters), clusters_total=len(clusters))
+        return results
+
+    if concurrency == 1:
+        results = []
+        for cluster in clusters:
+            results.append(analyze_cluster(llm, cluster))
+            on_entry(len(results) - 1, results[-1])
+            progress('analyze', clusters_done=len(results), clusters_total=len(clusters))
+        return results
+
+    results = []
+    with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix='llm') as pool:
+        # map() yields in submission order, whatever order the calls finish in
+        for entry in pool.map(lambda c: analyze_cluster(llm, c), clusters):
+            results.append(entry)
+            on_entry(len(results) - 1, entry)
+            progress('analyze', clusters_done=len(results), clusters_total=len(clusters))
+    return results
+
+def _incremental_clusterer(processor, state, n_items):
+    return IncrementalClusterer(
+        processor, state,
+        n_clusters=_cluster_count(n_items),
+        assign_threshold=float(os.environ.get('CLUSTER_ASSIGN_THRESHOLD', 0.15)),
+        reanalyze_ratio=float(os.environ.get('CLUSTER_REANALYZE_RATIO', 0.25))
+    )
+
+def incremental_update(storage, llm, processor, institute_id, unprocessed, concurrency=None, progress=None, batch=None,
+                       clusterer=None):
+    """
+    Assigns new feedback to the institute's saved clusters (or to those of
+    `clusterer`, if given) and re-analyzes only the clusters that changed
+    materially. Returns (entries for all analyzed clusters, ids of feedback
+    folded in, degraded entries, clusterer).
+
+    The saved state is updated here, under storage.update_cluster_state's row
+    lock: this batch's groups are folded into the state as it is by then, so
+    a worker that saved in the meantime does not lose its update.
+    """
+    saved_state = clusterer is None
+    if saved_state:
+        clusterer = _incremental_clusterer(processor, storage.get_cluster_state(institute_id), len(unprocessed))
+    groups = clusterer.assign(unprocessed)
+    stale = [g for g in groups if g['reanalyze']]
+    print(f"Pipeline: {len(groups)} clusters received feedback, {len(stale)} need analysis...")
+
+    to_analyze = [{'cluster_id': g['cluster_id'], 'theme': g['theme'], 'keywords': g['keywords'],
+                   'items': [{'text': t} for t in clusterer.analysis_texts(g)]} for g in stale]
+    analyses = {g['cluster_id']: e for g, e in zip(stale, analyze_clusters(llm, to_analyze, concurrency, progress, batch))}
 
-def run_pipeline(storage, institute_id=None):
+    feedback_ids, degraded, applied = [], [], []
+    for group in groups:
+        entry = analyses.get(group['cluster_id'])
+        if entry is not None and entry.get('degraded'):
+            # Left out of the state and unprocessed, so the next run retries it
+            degraded.append(dict(entry, count=len(group['items'])))
+            continue
+        analysis = None
+        if entry is not None:
+            analysis = {k: entry[k] for k in ('problem_statement', 'solutions', 'sample_texts')}
+        clusterer.apply(group, analysis)
+        applied.append((group, analysis))
+        feedback_ids.extend(item['id'] for item in group['items'])
+    if saved_state and applied:
+        state = storage.update_cluster_state(institute_id, lambda latest: clusterer.rebased(latest, applied).state)
+        clusterer = _incremental_clusterer(processor, state, len(unprocessed))
+    return clusterer.entries(), feedback_ids, degraded, clusterer
+
+def _llm_for_run(bypass_cache=False):
+    llm = get_llm_client()
+    llm_cache = get_llm_cache()
+    if llm_cache is not None:
+        llm = CachedLLMClient(llm, llm_cache, bypass=bypass_cache)
+    return llm, llm_cache
+
+def _analyze_full(llm, clusters, concurrency=None, progress=None, batch=None, analyzed=None, on_entry=None):
+    """
+    Analyzes freshly clustered feedback. Entries in `analyzed` ({cluster index:
+    entry}, from a checkpoint) are reused instead of calling the LLM again;
+    on_entry(index, entry) is called for each new entry that succeeded.
+    Returns (entries, ids of feedback covered, degraded entries).
+    """
+    analyzed = dict(analyzed or {})
+    missing = [i for i, c in enumerate(clusters) if i not in analyzed and c['items']]
+
+    def record(pos, entry):
+        if not entry.get('degraded') and on_entry is not None:
+            on_entry(missing[pos], entry)
+
+    analyzed.update(zip(missing, analyze_clusters(llm, [clusters[i] for i in missing], concurrency, progress,
+                                                  batch, on_entry=record)))
+
+    # Clusters the LLM could not analyze are left unprocessed, so the next run retries them
+    done = [i for i in range(len(clusters)) if i in analyzed]
+    processed_clusters = [analyzed[i] for i in done if not analyzed[i].get('degraded')]
+    degraded = [analyzed[i] for i in done if analyzed[i].get('degraded')]
+    feedback_ids = [item['id'] for i in done if not analyzed[i].get('degraded') for item in clusters[i]['items']]
+    return processed_clusters, feedback_ids, degraded
+
+def _save_run(storage, institute_id, processed_clusters, feedback_ids, degraded, progress=None, owner=None,
+              run_id=None):
+    """Saves the Result, marks feedback processed and builds the run's result dict."""
+    progress = progress or _no_progress
+    # Sort clusters by count (frequency) descending
+    processed_clusters.sort(key=lambda x: x['count'], reverse=True)
+
+    # Save Results
+    print(f"Pipeline: Saving results for institute: {institute_id}...")
+    progress('save', clusters_done=len(processed_clusters), clusters_total=len(processed_clusters) + len(degraded))
+    if processed_clusters:
+        storage.save_clusters(institute_id, processed_clusters, run_id=run_id)
+
+    # Mark as processed
+    if feedback_ids:
+        storage.mark_processed(feedback_ids, owner=owner)
+
+    result = {'run_id': run_id, 'clusters': processed_clusters}
+    if degraded:
+        result.update(status='degraded', degraded_clusters=[
+            {'theme': e['theme'], 'keywords': e['keywords'], 'count': e['count'], 'error': e['error']} for e in degraded
+        ])
+    return result
+
+def _claimed_windows(storage, owner, institute_id=None, window_size=None):
+    """
+    Leases the backlog to `owner` one window at a time. Rows this run leaves
+    unprocessed (degraded clusters, failed shards) stay leased, so the run
+    does not claim them again, until the run releases them as it ends.
+    """
+    while True:
+        window = storage.claim_feedback(owner, institute_id=institute_id, limit=window_size or PIPELINE_WINDOW,
+                                        lease_seconds=FEEDBACK_LEASE_SECONDS)
+        if not window:
+            return
+        yield window
+
+def _release_leases(storage, owner):
+    try:
+        storage.release_feedback(owner)
+    except Exception as e:
+        # The leases still expire after FEEDBACK_LEASE_SECONDS
+        print(f"Pipeline: Could not release leases of {owner}: {e}")
+
+def _keep_leases(renew, stop, interval):
+    """
+    Heartbeat thread of a run: extends its leases until `stop` is set, so a
+    window whose LLM analysis is slow (rate limits, backoff) is not reclaimed
+    by another worker while it is still being processed.
+    """
+    while not stop.wait(interval):
+        try:
+            renew()
+        except Exception as e:
+            # The next beat tries again; the leases only lapse if beats keep failing
+            print(f"Pipeline: Could not renew leases: {e}")
+
+def cluster_shard(institute_id, items, vectors=None):
+    """
+    Process-pool entry point for run_sharded: clusters one institute's
+    feedback. Returns (institute_id, clusters, seconds).
+    """
+    start = time.perf_counter()
+    clusters = TextProcessor().cluster_feedback(items, n_clusters=_cluster_count(len(items)), vectors=vectors)
+    return institute_id, clusters, time.perf_counter() - start
+
+def _shard_progress(progress, institute_id):
+    def report(stage, **info):
+        progress(stage, institute_id=institute_id, **info)
+    return report
+
+def _compact_clusters(clusters):
+    """Cluster assignments as feedback ids, for a checkpoint."""
+    return [{
+        'cluster_id': c['cluster_id'], 'theme': c['theme'], 'keywords': c.get('keywords', []),
+        'item_ids': [item['id'] for item in c['items']],
+        'representative_ids': [item['id'] for item in c.get('representatives', [])]
+    } for c in clusters]
+
+def _restore_clusters(compact, items):
+    """Inverse of _compact_clusters. Rows no longer held by the run are dropped; cluster positions are kept."""
+    by_id = {item['id']: item for item in items}
+    return [{
+        'cluster_id': c['cluster_id'], 'theme': c['theme'], 'keywords': c['keywords'],
+        'items': [by_id[i] for i in c['item_ids'] if i in by_id],
+        'representatives': [by_id[i] for i in c['representative_ids'] if i in by_id]
+    } for c in compact]
+
+class _PipelineRun:
+    """
+    One checkpointed run over a single institute or, with institute_id None,
+    every institute (one shard per institute per window).
+
+    Checkpoints (storage.save_checkpoint) follow each window and institute
+    through claimed -> clustered -> saved, and record every cluster's LLM
+    analysis as soon as it arrives. Started again with the same run_id, a run
+    first finishes the windows its checkpoints left open: it re-leases their
+    feedback, reuses the saved cluster assignments, and only calls the LLM
+    for clusters that have no analysis yet. Windows already saved are not
+    redone, and their clusters carry over into the cumulative Result.
+    Incremental mode checkpoints claimed and saved windows only; an open
+    window is assigned again, with the LLM cache covering paid-for calls.
+
+    In full mode only an institute's first window is clustered from scratch.
+    Its clusters seed a run-local IncrementalClusterer, and later windows are
+    assigned to those centroids (new clusters form only from items far from
+    all of them), so the Result has one entry per theme with the counts of
+    every window. That state is kept in each saved checkpoint for resume, and
+    never written to the institute's incremental ClusterState. Later windows
+    are checkpointed like incremental ones.
+    """
+
+    def __init__(self, storage, institute_id=None, run_id=None, owner=None, progress=None, concurrency=None,
+                 bypass_cache=False, batch=None, incremental=None, window_size=None, processes=None):
+        self.storage = storage
+        self.institute_id = institute_id
+        self.run_id = run_id or str(uuid.uuid4())
+        self.owner = owner or self.run_id
+        self.progress = progress or _no_progress
+        self.concurrency = concurrency
+        self.batch = batch
+        self.window_size = window_size
+        self.processes = processes
+        self.incremental = CLUSTER_MODE == 'incremental' if incremental is None else incremental
+        self.processor = TextProcessor()
+        self.llm, self.llm_cache = _llm_for_run(bypass_cache)
+        self.vector_store = None if self.incremental else get_vector_store(self.processor.preprocess)
+        # Per institute: latest result, report entry, and clusters / degraded entries over all windows
+        self.results, self.report, self.saved, self.skipped = {}, {}, {}, {}
+        # Full mode: per institute, the clusters found so far in this run
+        self.clusterers = {}
+        self.items_done, self.pool, self.workers = 0, None, 1
+        # The stored run, if run_id names one that already completed
+        self.completed = None
+
+    # --- Checkpoints ---
+    def _checkpoint(self, window, institute_id, **fields):
+        self.storage.save_checkpoint(self.run_id, window, institute_id, **fields)
+
+    def _resume_state(self):
+        """Cumulative clusters of saved windows, and open checkpoints grouped by window."""
+        run, resumed = self.storage.start_pipeline_run(self.run_id, self.institute_id, self.owner)
+        self.attempt = run['attempts']
+        if run['status'] == 'completed':
+            # Nothing to redo; run_pipeline / run_sharded return what it recorded
+            self.completed = run
+            return {}, 0
+        if not resumed:
+            return {}, 0
+        open_windows, last = {}, 0
+        for cp in self.storage.get_checkpoints(self.run_id):
+            last = max(last, cp['window'])
+            if cp['stage'] == 'saved':
+                if not self.incremental and cp['state']:
+                    # Checkpoints come in window order, so the latest state wins
+                    clusterer = _incremental_clusterer(self.processor, cp['state'], self.window_size or PIPELINE_WINDOW)
+                    self.clusterers[cp['institute_id']] = clusterer
+                    self.saved[cp['institute_id']] = clusterer.entries()
+            else:
+                open_windows.setdefault(cp['window'], {})[cp['institute_id']] = cp
+        if open_windows or last:
+            print(f"Pipeline: Resuming run {self.run_id} (attempt {self.attempt}), "
+                  f"{len(open_windows)} open windows after window {last}...")
+        return open_windows, last
+
+    # --- Shards ---
+    def _report_entry(self, institute_id):
+        return self.report.setdefault(institute_id, {
+            'institute_id': institute_id, 'items': 0, 'windows': 0,
+            'cluster_seconds': None if self.incremental else 0.0, 'analyze_seconds': 0.0, 'save_seconds': 0.0,
+            'clusters': 0, 'degraded_clusters': 0
+        })
+
+    def _failed(self, institute_id, items, error):
+        """A shard whose clustering failed in a worker process."""
+        print(f"Pipeline: Institute {institute_id} failed: {error}")
+        self.results[institute_id] = {'run_id': self.run_id, 'status': 'failed', 'error': str(error)}
+        entry = self._report_entry(institute_id)
+        entry['items'] += len(items)
+        entry['windows'] += 1
+        entry.update(status='failed', error=str(error))
+
+    def _finish(self, window, institute_id, items, clusters, cluster_seconds, checkpoint=None):
+        """Analyzes and saves one institute's part of a window."""
+        entry = self._report_entry(institute_id)
+        if entry.get('status') == 'failed':
+            # Its feedback stays leased until the run ends, then goes back to the queue
+            return
+        entry['items'] += len(items)
+        entry['windows'] += 1
+        if cluster_seconds is not None:
+            entry['cluster_seconds'] += cluster_seconds
+        progress = _shard_progress(self.progress, institute_id) if self.institute_id is None else self.progress
+        start = time.perf_counter()
+        try:
+            run_clusterer = None
+            if self.incremental:
+                # Assignment and analysis together; there is no separate clustering step
+                processed_clusters, feedback_ids, degraded, _ = incremental_update(
+                    self.storage, self.llm, self.processor, institute_id, items, self.concurrency, progress, self.batch)
+            elif institute_id in self.clusterers:
+                # A later window: merged into the clusters this run already found
+                run_clusterer = self.clusterers[institute_id]
+                processed_clusters, feedback_ids, degraded, _ = incremental_update(
+                    self.storage, self.llm, self.processor, institute_id, items, self.concurrency, progress,
+                    self.batch, clusterer=run_clusterer)
+            else:
+                analyses = dict(checkpoint['analyses']) if checkpoint else {}
+                if not (checkpoint and checkpoint['clusters']):
+                    self._checkpoint(window, institute_id, stage='clustered', clusters=_compact_clusters(clusters))
+
+                def record(index, result_entry):
+                    analyses[index] = result_entry
+                    self._checkpoint(window, institute_id, analyses=analyses)
+
+                _, feedback_ids, degraded = _analyze_full(
+                    self.llm, clusters, self.concurrency, progress, self.batch, analyzed=analyses, on_entry=record)
+                # Degraded clusters have no analysis; their feedback stays unprocessed
+                done = sorted(analyses)
+                run_clusterer = _incremental_clusterer(self.processor, None, len(items))
+                run_clusterer.seed([clusters[i] for i in done], [
+                    {k: analyses[i][k] for k in ('problem_statement', 'solutions', 'sample_texts')} for i in done
+                ])
+                self.clusterers[institute_id] = run_clusterer
+                processed_clusters = run_clusterer.entries()
+            entry['analyze_seconds'] += time.perf_counter() - start
+            degraded = self.skipped.get(institute_id, []) + degraded
+            self.saved[institute_id], self.skipped[institute_id] = processed_clusters, degraded
+            start = time.perf_counter()
+            self.results[institute_id] = _save_run(self.storage, institute_id, processed_clusters, feedback_ids,
+                                                   degraded, progress, self.owner, self.run_id)
+            self._checkpoint(window, institute_id, stage='saved',
+                             **({'state': run_clusterer.state} if run_clusterer is not None else {}))
+            entry['save_seconds'] += time.perf_counter() - start
+            entry.update(status=self.results[institute_id].get('status', 'success'), clusters=len(processed_clusters),
+                         degraded_clusters=len(degraded))
+        except Exception as e:
+            if self.institute_id is not None:
+                raise
+            # One institute failing does not stop the others
+            if hasattr(self.storage, 'db'):
+                self.storage.db.session.rollback()
+            print(f"Pipeline: Institute {institute_id} failed: {e}")
+            self.results[institute_id] = {'run_id': self.run_id, 'status': 'failed', 'error': str(e)}
+            entry.update(status='failed', error=str(e))
+
+    def _process_window(self, window, shards, checkpoints):
+        # Largest first, so the longest shard does not start last
+        order = sorted(shards, key=lambda i: len(shards[i]), reverse=True)
+        if self.incremental:
+            for institute_id in order:
+                self._finish(window, institute_id, shards[institute_id], None, None, checkpoints.get(institute_id))
+            return
+
+        to_cluster = []
+        for institute_id in order:
+            cp = checkpoints.get(institute_id)
+            if institute_id in self.clusterers:
+                # Assigned to the run's clusters here; like incremental shards, no worker needed
+                self._finish(window, institute_id, shards[institute_id], None, None, cp)
+            elif cp and cp['clusters']:
+                clusters = _restore_clusters(cp['clusters'], shards[institute_id])
+                self._finish(window, institute_id, shards[institute_id], clusters, 0.0, cp)
+            else:
+                to_cluster.append(institute_id)
+        if not to_cluster:
+            return
+
+        if self.pool is None and self.institute_id is None and self.workers == 1:
+            self.workers = max(1, min(self.processes or PIPELINE_PROCESSES, len(to_cluster)))
+            if self.workers > 1:
+                self._new_pool()
+        # Vectors are looked up here, where the store's file lock and id index already live
+        vectors = {i: self.vector_store.vectors_for(shards[i]) if self.vector_store is not None else None
+                   for i in to_cluster}
+        if self.pool is None:
+            for institute_id in to_cluster:
+                _, clusters, seconds = cluster_shard(institute_id, shards[institute_id], vectors[institute_id])
+                self._finish(window, institute_id, shards[institute_id], clusters, seconds, checkpoints.get(institute_id))
+            return
+        futures = {self._submit(i, shards[i], vectors[i]): i for i in to_cluster}
+        broken = []
+        for future in as_completed(futures):
+            institute_id = futures[future]
+            try:
+                _, clusters, seconds = future.result()
+            except BrokenProcessPool:
+                broken.append(institute_id)
+                continue
+            except Exception as e:
+                self._failed(institute_id, shards[institute_id], e)
+                continue
+            self._finish(window, institute_id, shards[institute_id], clusters, seconds, checkpoints.get(institute_id))
+
+        # A worker died (e.g. killed for memory) and took every pending shard with it. Each
+        # is retried alone in a fresh pool, so only a shard that kills a worker again fails.
+        for institute_id in broken:
+            print(f"Pipeline: Worker process lost; retrying institute {institute_id}...")
+            try:
+                _, clusters, seconds = self._submit(institute_id, shards[institute_id], vectors[institute_id]).result()
+            except Exception as e:
+                self._failed(institute_id, shards[institute_id], e)
+                continue
+            self._finish(window, institute_id, shards[institute_id], clusters, seconds, checkpoints.get(institute_id))
+
+    def _new_pool(self):
+        if self.pool is not None:
+            self.pool.shutdown(wait=False, cancel_futures=True)
+        # spawn: forking a process that runs job-queue and LLM threads can copy held locks
+        self.pool = ProcessPoolExecutor(max_workers=self.workers, mp_context=multiprocessing.get_context('spawn'))
+
+    def _submit(self, institute_id, items, vectors):
+        """Submits a shard to the pool, replacing the pool first if a dead worker broke it."""
+        try:
+            return self.pool.submit(cluster_shard, institute_id, items, vectors)
+        except BrokenProcessPool:
+            self._new_pool()
+            return self.pool.submit(cluster_shard, institute_id, items, vectors)
+
+    def _partition(self, items):
+        shards = {}
+        for item in items:
+            shards.setdefault(item['institute_id'], []).append(item)
+        return shards
+
+    # --- Run ---
+    def execute(self):
+        """Returns (results per institute, report entries per institute, items processed)."""
+        if self.institute_id is None:
+            print("Pipeline: Fetching feedback for all institutes...")
+        else:
+            print(f"Pipeline: Fetching feedback for institute: {self.institute_id}...")
+        self.progress('fetch', run_id=self.run_id)
+        open_windows, last = self._resume_state()
+        if self.completed is not None:
+            return self.results, self.report, 0
+        windows = _claimed_windows(self.storage, self.owner, self.institute_id, self.window_size)
+        stop = threading.Event()
+        beat = threading.Thread(target=_keep_leases, name=f"lease-heartbeat-{self.run_id[:8]}", daemon=True, args=(
+            self.storage.lease_renewer(self.owner, FEEDBACK_LEASE_SECONDS), stop, max(1.0, FEEDBACK_LEASE_SECONDS / 3)))
+        beat.start()
+        try:
+            for window, checkpoints in sorted(open_windows.items()):
+                ids = [fid for cp in checkpoints.values() for fid in cp['feedback_ids']]
+                items = self.storage.claim_feedback(self.owner, feedback_ids=ids, lease_seconds=FEEDBACK_LEASE_SECONDS)
+                print(f"Pipeline: Resuming window {window} ({len(items)} of {len(ids)} items still held)...")
+                self.progress('cluster', items=len(items), window=window, items_done=self.items_done, resumed=True)
+                self._process_window(window, self._partition(items), checkpoints)
+                self.items_done += len(items)
+
+            for window, items in enumerate(windows, start=last + 1):
+                shards = self._partition(items)
+                for institute_id, shard in shards.items():
+                    self._checkpoint(window, institute_id, stage='claimed', feedback_ids=[i['id'] for i in shard])
+                print(f"Pipeline: Processing {len(items)} items"
+                      f"{f' from {len(shards)} institutes' if self.institute_id is None else ''} (window {window})...")
+                self.progress('cluster', items=len(items), window=window, items_done=self.items_done,
+                              shards_total=len(shards))
+                self._process_window(window, shards, {})
+                self.items_done += len(items)
+        except Exception as e:
+            # Checkpoints are kept, so running the same run_id again resumes here
+            self.storage.finish_pipeline_run(self.run_id, 'failed', {'error': str(e)}, keep_checkpoints=True)
+            raise
+        finally:
+            stop.set()
+            beat.join()
+            # Also when resuming failed before the generator started, whose own cleanup would never run
+            _release_leases(self.storage, self.owner)
+            if self.pool is not None:
+                self.pool.shutdown()
+        for entry in self.report.values():
+            for key in ('cluster_seconds', 'analyze_seconds', 'save_seconds'):
+                if entry.get(key) is not None:
+                    entry[key] = round(entry[key], 3)
+        return self.results, self.report, self.items_done
+
+def _completed_result(run):
+    print(f"Pipeline: Run {run.run_id} already completed.")
+    return {'status': 'already_completed', 'run_id': run.run_id, 'summary': run.completed['summary']}
+
+def run_pipeline(storage, institute_id=None, progress=None, concurrency=None, bypass_cache=False, batch=None,
+                 incremental=None, window_size=None, owner=None, run_id=None):
     """
     1. Fetch unprocessed feedback
     2. Cluster it
     3. Generate Insights (Problem Statement + Solutions)
     4. Save Results
     5. Mark feedback as processed
+
+    progress(stage, **info) is called as the run moves through its stages
+    (used by backend/jobs.py to report status). concurrency overrides
+    LLM_CONCURRENCY and batch overrides LLM_BATCH for this run. bypass_cache
+    skips LLM cache lookups (fresh outputs still refresh the cache).
+    incremental overrides CLUSTER_MODE; in incremental mode the saved result
+    covers every cluster seen so far, not just this run's feedback.
+
+    The backlog is read and processed in windows of at most window_size
+    items (PIPELINE_WINDOW), so memory stays bounded however much feedback
+    is pending. Each window is marked processed as soon as it is saved, and
+    the saved Result covers every window so far. In full mode the first
+    window is clustered and later windows are merged into its clusters;
+    incremental mode folds windows into the institute's saved clusters.
+
+    Windows are leased to `owner` (default: the run_id) rather than just
+    read, so overlapping runs work on disjoint feedback. The leases are
+    renewed while the run is alive, and whatever the run leaves unprocessed
+    is released when it ends (see claim_feedback).
+
+    The run is checkpointed under run_id (a new id if not given), which also
+    ties it to its Result; calling again with the same run_id resumes an
+    interrupted run (see _PipelineRun). For a run that already completed,
+    nothing is redone: the result is {'status': 'already_completed',
+    'run_id', 'summary'}, with the summary the run recorded.
+
+    The result's llm_tokens reports the prompt and output tokens of every
+    LLM request the run made (cache hits excluded), as counted by the API
+    where it reports usage and estimated otherwise.
+
+    Without an institute_id every institute is processed, each on its own
+    (see run_sharded).
     """
-    processor = TextProcessor()
-    llm = get_llm_client()
+    if institute_id is None:
+        return run_sharded(storage, progress=progress, concurrency=concurrency, bypass_cache=bypass_cache,
+                           batch=batch, incremental=incremental, window_size=window_size, owner=owner, run_id=run_id)
 
-    print(f"Pipeline: Fetching feedback for institute: {institute_id}...")
-    unprocessed = storage.get_unprocessed_feedback(institute_id=institute_id)
-    
-    # In a real scenario, we might want to maintain existing clusters and add to them,
-    # or re-cluster everything to spot emerging trends.
-    # For this prototype, we'll re-process specific batches or just everything available.
-    if not unprocessed:
+    run = _PipelineRun(storage, institute_id, run_id, owner, progress, concurrency, bypass_cache, batch,
+                       incremental, window_size)
+    results, report, _ = run.execute()
+    if run.completed is not None:
+        return _completed_result(run)
+    result = results.get(institute_id)
+    if result is None:
         print("Pipeline: No new feedback to process.")
-        return {'status': 'no_data'}
-
-    print(f"Pipeline: Processing {len(unprocessed)} items...")
-    
-    # Clustering
-    clusters = processor.cluster_feedback(unprocessed, n_clusters=min(3, len(unprocessed)))
-    
-    processed_clusters = []
-    
-    for cluster in clusters:
-        items = cluster['items']
-        texts = [item['text'] for item in items]
-        
-        print(f"Pipeline: Analyzing cluster {cluster['cluster_id']} with {len(items)} items...")
-        
-        # LLM Generation
-        problem_statement = llm.generate_problem_statement(texts)
-        solutions = llm.suggest_solutions(problem_statement)
-        
-        processed_clusters.append({
-            'theme': cluster['theme'],
-            'count': len(items),
-            'problem_statement': problem_statement,
-            'solutions': solutions,
-            'sample_texts': texts[:3] # Store a few for reference
-        })
+        storage.finish_pipeline_run(run.run_id, 'completed', {'status': 'no_data'})
+        return {'status': 'no_data', 'run_id': run.run_id}
+    result['llm_tokens'] = run.llm.usage.report()
+    degraded = result.get('degraded_clusters', [])
+    print("Pipeline: Done." if not degraded else f"Pipeline: Done (degraded, {len(degraded)} clusters skipped).")
+    storage.finish_pipeline_run(run.run_id, 'completed', report[institute_id])
+    if run.llm_cache is not None:
+        result['llm_cache'] = run.llm_cache.stats()
+    return result
 
-    # Sort clusters by count (frequency) descending
-    processed_clusters.sort(key=lambda x: x['count'], reverse=True)
+def run_sharded(storage, progress=None, concurrency=None, bypass_cache=False, batch=None, incremental=None,
+                processes=None, window_size=None, owner=None, run_id=None):
+    """
+    Multi-tenant run over every institute with unprocessed feedback. Feedback
+    is partitioned by institute and each shard is clustered in its own worker
+    process (up to `processes`, default PIPELINE_PROCESSES). As shards finish,
+    this process analyzes them with the LLM, so all shards share one rate
+    limit and cache, and saves one Result per institute. A shard that fails
+    leaves its feedback unprocessed without affecting the others.
 
-    # Save Results
-    print("Pipeline: Saving results...")
-    storage.save_clusters(institute_id, processed_clusters)
-    
-    # Mark as processed
-    feedback_ids = [item['id'] for item in unprocessed]
-    storage.mark_processed(feedback_ids)
-    
-    print("Pipeline: Done.")
-    return {'clusters': processed_clusters}
+    Incremental shards are assigned here rather than in workers: they only
+    compare new items against saved centroids.
+
+    The backlog is leased in windows as in run_pipeline; every window is
+    partitioned and saved before the next is claimed. Checkpoints and resume
+    work per window and institute.
+
+    Returns {'mode': 'sharded', 'institutes': {institute_id: result},
+    'report': {...per-shard timings...}, 'llm_tokens': {...}} plus status 'degraded' and the
+    degraded clusters (tagged with their institute) if any shard fell short.
+    """
+    run_start = time.perf_counter()
+    run = _PipelineRun(storage, None, run_id, owner, progress, concurrency, bypass_cache, batch,
+                       incremental, window_size, processes)
+    results, report, items_done = run.execute()
+    if run.completed is not None:
+        return _completed_result(run)
+
+    if not report:
+        print("Pipeline: No new feedback to process.")
+        storage.finish_pipeline_run(run.run_id, 'completed', {'status': 'no_data'})
+        return {'status': 'no_data', 'run_id': run.run_id}
+
+    degraded = [dict(c, institute_id=i) for i, r in results.items() for c in r.get('degraded_clusters', [])]
+    failed_ids = [e['institute_id'] for e in report.values() if e['status'] == 'failed']
+    print(f"Pipeline: Done, {len(results)} institutes"
+          f"{f', {len(failed_ids)} failed' if failed_ids else ''}{f', {len(degraded)} clusters skipped' if degraded else ''}.")
+
+    result = {
+        'mode': 'sharded',
+        'run_id': run.run_id,
+        'institutes': results,
+        'report': {
+            'shards': list(report.values()),
+            'processes': run.workers,
+            'items': items_done,
+            'clusters': sum(e.get('clusters', 0) for e in report.values()),
+            'wall_seconds': round(time.perf_counter() - run_start, 3)
+        },
+        'llm_tokens': run.llm.usage.report()
+    }
+    if degraded or failed_ids:
+        result.update(status='degraded', degraded_clusters=degraded, failed_institutes=failed_ids)
+    storage.finish_pipeline_run(run.run_id, 'completed', result['report'])
+    if run.llm_cache is not None:
+        result['llm_cache'] = run.llm_cache.stats()
+    return result
@@ -1,14 +1,63 @@
+import os
 import re
 try:
-    from sklearn.feature_extraction.text import TfidfVectorizer
-    from sklearn.cluster import KMeans
+    import numpy as np
+    from scipy import sparse
+    from sklearn.feature_extraction.text import HashingVectorizer, TfidfTransformer, TfidfVectorizer
+    from joblib import Parallel, delayed
+    from sklearn.cluster import KMeans, MiniBatchKMeans, kmeans_plusplus
+    from sklearn.decomposition import TruncatedSVD
+    from sklearn.metrics import davies_bouldin_score, silhouette_score
+    from sklearn.preprocessing import normalize
     SKLEARN_AVAILABLE = True
 except ImportError:
     SKLEARN_AVAILABLE = False
     print("Warning: scikit-learn not found. Clustering will be mocked.")
 
+# Batches at least this large use the fixed-memory large-scale engine. The pipeline clusters
+# at most PIPELINE_WINDOW items at a time (100000 by default), which must exceed this to use it.
+LARGE_SCALE_THRESHOLD = int(os.environ.get('CLUSTER_LARGE_THRESHOLD', 20000))
+
+# Automatic cluster count (n_clusters='auto'): candidates, sample size, score and parallelism
+K_MIN = int(os.environ.get('CLUSTER_K_MIN', 2))
+K_MAX = int(os.environ.get('CLUSTER_K_MAX', 12))
+K_SAMPLE = int(os.environ.get('CLUSTER_K_SAMPLE', 2000))
+K_METRIC = os.environ.get('CLUSTER_K_METRIC', 'silhouette')  # or 'davies_bouldin'
+K_JOBS = int(os.environ.get('CLUSTER_K_JOBS', -1))
+
+# Theme of a batch that forms a single cluster
+GENERAL_THEME = 'General Feedback'
+
+def top_terms(centroids, feature_names, n_terms=8):
+    """
+    Highest-weighted terms of each centroid row, in one vectorized pass.
+    Returns a list (one per row) of term lists; zero-weight terms are dropped.
+    """
+    centroids = np.asarray(centroids)
+    n_terms = min(n_terms, centroids.shape[1])
+    if not n_terms:
+        return [[] for _ in range(centroids.shape[0])]
+    # argpartition finds the top n per row in linear time; only those n get sorted
+    part = np.argpartition(-centroids, n_terms - 1, axis=1)[:, :n_terms]
+    order = np.take_along_axis(part, np.argsort(-np.take_along_axis(centroids, part, axis=1), axis=1), axis=1)
+    weights = np.take_along_axis(centroids, order, axis=1)
+    names = np.asarray(feature_names)
+    return [names[row][w > 0].tolist() for row, w in zip(order, weights)]
+
+def theme_from_terms(terms, fallback):
+    return ' / '.join(t.title() for t in terms[:3]) if terms else fallback
+
 class TextProcessor:
-    def __init__(self):
+    def __init__(self, chunk_size=10000, svd_components=64, svd_sample=20000,
+                 n_keywords=8, n_representatives=3, label_sample=20000):
+        # Settings for the large-scale engine (cluster_feedback_large)
+        self.chunk_size = chunk_size
+        self.svd_components = svd_components
+        self.svd_sample = svd_sample
+        # Settings for cluster labels (describe_clusters)
+        self.n_keywords = n_keywords
+        self.n_representatives = n_representatives
+        self.label_sample = label_sample
         self.vectorizer = None
         if SKLEARN_AVAILABLE:
             self.vectorizer = TfidfVectorizer(
@@ -23,44 +72,233 @@ class TextProcessor:
         text = re.sub(r'[^a-z0-9\s]', '', text) # remove special chars
         return text
 
-    def cluster_feedback(self, feedback_items, n_clusters=3):
+    def select_k(self, vectors, k_min=None, k_max=None, sample_size=None, metric=None, n_jobs=None):
+        """
+        Picks the number of clusters for `vectors` (dense or sparse rows).
+
+        Candidates k_min..k_max are fitted on a random sample, so the cost does
+        not grow with the data. One k-means++ seeding for k_max is shared: its
+        first k centers are a valid k-means++ seeding for k, so each candidate
+        is a single warm-started fit. Candidates are evaluated in parallel and
+        scored by silhouette (higher is better) or Davies-Bouldin (lower).
+        Returns (k, centers) where centers are the chosen fit's centroids,
+        usable as the init of the full fit.
+        """
+        k_min = max(2, k_min or K_MIN)
+        metric = metric or K_METRIC
+        n = vectors.shape[0]
+        rng = np.random.RandomState(42)
+        sample = vectors[np.sort(rng.choice(n, size=min(n, sample_size or K_SAMPLE), replace=False))]
+        k_max = min(k_max or K_MAX, sample.shape[0] - 1)
+        if k_max < k_min:
+            return 1, None
+
+        seeds, _ = kmeans_plusplus(sample, n_clusters=k_max, random_state=42)
+        dense = sample.toarray() if sparse.issparse(sample) else sample
+
+        def evaluate(k):
+            km = KMeans(n_clusters=k, init=seeds[:k], n_init=1, random_state=42).fit(sample)
+            if len(np.unique(km.labels_)) < 2:
+                return k, None, km.cluster_centers_
+            if metric == 'davies_bouldin':
+                score = -davies_bouldin_score(dense, km.labels_)
+            else:
+                score = silhouette_score(sample, km.labels_)
+            return k, score, km.cluster_centers_
+
+        # KMeans and the scores run in native code, so threads overlap well
+        results = Parallel(n_jobs=n_jobs or K_JOBS, prefer='threads')(
+            delayed(evaluate)(k) for k in range(k_min, k_max + 1)
+        )
+        scored = [r for r in results if r[1] is not None]
+        if not scored:
+            return 1, None
+        k, score, centers = max(scored, key=lambda r: r[1])
+        print(f"Auto k: {k} ({metric} {abs(score):.3f}) from {k_min}-{k_max} on {sample.shape[0]} samples")
+        return k, centers
+
+    def cluster_feedback(self, feedback_items, n_clusters=3, vectors=None, large=None):
         """
         Groups feedback items into clusters.
         Returns a list of dicts: {'id': cluster_id, 'items': [feedback_item, ...]}
+        vectors, if given, are precomputed rows (e.g. from ai_module.vector_store)
+        and replace the TF-IDF fit. Batches of LARGE_SCALE_THRESHOLD items or more
+        go to cluster_feedback_large unless large is given explicitly.
+        n_clusters='auto' picks the count with select_k.
         """
         if not feedback_items:
             return []
         
         # If we don't have enough items for clustering, just return one group
-        if len(feedback_items) < n_clusters:
-            return [{'cluster_id': 0, 'items': feedback_items, 'theme': 'General Feedback'}]
+        if len(feedback_items) < (K_MIN + 1 if n_clusters == 'auto' else n_clusters):
+            return [{'cluster_id': 0, 'items': feedback_items, 'theme': GENERAL_THEME}]
 
         if not SKLEARN_AVAILABLE:
             # Mock clustering
             return [{'cluster_id': 0, 'items': feedback_items, 'theme': 'Mock Cluster'}]
 
-        texts = [self.preprocess(item['text']) for item in feedback_items]
-        
+        if large if large is not None else len(feedback_items) >= LARGE_SCALE_THRESHOLD:
+            return self.cluster_feedback_large(feedback_items, n_clusters, vectors)
+
+        try:
+            tfidf = None
+            if vectors is None:
+                texts = [self.preprocess(item['text']) for item in feedback_items]
+                vectors = tfidf = self.vectorizer.fit_transform(texts)
+            params = {}
+            if n_clusters == 'auto':
+                n_clusters, centers = self.select_k(vectors)
+                if n_clusters == 1:
+                    return [{'cluster_id': 0, 'items': feedback_items, 'theme': GENERAL_THEME}]
+                # Warm start from the sample fit
+                params = {'init': centers, 'n_init': 1}
+            kmeans = KMeans(n_clusters=n_clusters, random_state=42, **params)
+            kmeans.fit(vectors)
+            distances = self._own_distances(kmeans, vectors, kmeans.labels_)
+            if tfidf is not None:
+                # The clustering space is the TF-IDF space, so its centroids name the terms
+                labels = self.describe_clusters(feedback_items, kmeans.labels_, distances,
+                                                kmeans.cluster_centers_, self.vectorizer.get_feature_names_out())
+            else:
+                labels = self.describe_clusters(feedback_items, kmeans.labels_, distances)
+            return self._group(feedback_items, kmeans.labels_, labels)
+        except Exception as e:
+            print(f"Clustering failed: {e}")
+            # Fallback
+            return [{'cluster_id': 0, 'items': feedback_items, 'theme': 'General'}]
+
+    def _group(self, feedback_items, labels, descriptions=None):
+        clusters = {}
+        for idx, label in enumerate(labels):
+            if label not in clusters:
+                clusters[label] = []
+            clusters[label].append(feedback_items[idx])
+
+        result = []
+        for label, items in clusters.items():
+            cluster = {
+                'cluster_id': int(label),
+                'items': items,
+                'theme': f'Cluster {label + 1}' # Placeholder theme
+            }
+            if descriptions and label in descriptions:
+                cluster.update(descriptions[label])
+            result.append(cluster)
+        return result
+
+    def _own_distances(self, kmeans, vectors, labels):
+        """Distance of each row to its own cluster's centroid, chunked for large inputs."""
+        labels = np.asarray(labels)
+        distances = np.empty(vectors.shape[0])
+        for a, b in self._chunks(vectors.shape[0]):
+            distances[a:b] = kmeans.transform(vectors[a:b])[np.arange(b - a), labels[a:b]]
+        return distances
+
+    def describe_clusters(self, feedback_items, labels, distances, centroids=None, feature_names=None):
+        """
+        Extractive labels, no LLM needed. For each cluster label returns
+        {'theme', 'keywords', 'representatives'}: keywords are the top terms of
+        the cluster's TF-IDF centroid, the theme joins the first three, and
+        representatives are the items closest to the centroid.
+
+        Terms are scored as cluster mean minus overall mean, so words common
+        to every cluster do not label any of them. When the clustering ran in
+        a space without term names (vector store, LSA), the term centroids
+        come from a TF-IDF fit on a sample of label_sample texts.
+        """
+        labels = np.asarray(labels)
+        label_ids = np.unique(labels)
+        if centroids is None:
+            n = len(feedback_items)
+            rng = np.random.RandomState(42)
+            idx = np.sort(rng.choice(n, size=min(n, self.label_sample), replace=False))
+            vec = TfidfVectorizer(stop_words='english', max_features=5000, preprocessor=self.preprocess)
+            tfidf = vec.fit_transform([feedback_items[i]['text'] for i in idx])
+            feature_names = vec.get_feature_names_out()
+            rows = np.searchsorted(label_ids, labels[idx])
+            onehot = sparse.csr_matrix((np.ones(len(idx)), (rows, np.arange(len(idx)))),
+                                       shape=(len(label_ids), len(idx)))
+            sizes = np.maximum(np.asarray(onehot.sum(axis=1)).ravel(), 1)
+            centroids = (onehot @ tfidf).toarray() / sizes[:, None]
+            centroids -= np.asarray(tfidf.mean(axis=0)).ravel()
+        else:
+            sizes = np.bincount(labels)[label_ids]
+            centroids = np.asarray(centroids)[label_ids]
+            centroids = centroids - (sizes @ centroids) / sizes.sum()
+        keywords = top_terms(centroids, feature_names, self.n_keywords)
+
+        # Sort by (label, distance) once; each cluster's nearest items are then at the front of its run
+        order = np.lexsort((distances, labels))
+        starts = np.searchsorted(labels[order], label_ids)
+        descriptions = {}
+        for pos, label in enumerate(label_ids):
+            nearest = order[starts[pos]:starts[pos] + self.n_representatives]
+            nearest = nearest[labels[nearest] == label]
+            descriptions[label] = {
+                'theme': theme_from_terms(keywords[pos], f'Cluster {label + 1}'),
+                'keywords': keywords[pos],
+                'representatives': [feedback_items[i] for i in nearest]
+            }
+        return descriptions
+
+    def _chunks(self, n):
+        for start in range(0, n, self.chunk_size):
+            yield start, min(start + self.chunk_size, n)
+
+    def reduce_large(self, texts):
+        """
+        Dense, L2-normalized LSA vectors (float32, svd_components wide) for many
+        texts. HashingVectorizer needs no vocabulary fit, so memory stays fixed
+        per chunk; IDF comes from a first pass over the hashed counts and the
+        SVD basis is fitted on a random sample of svd_sample rows.
+        """
+        hasher = HashingVectorizer(n_features=2 ** 18, stop_words='english', alternate_sign=False,
+                                   norm=None, preprocessor=self.preprocess)
+        n = len(texts)
+        counts = sparse.vstack([hasher.transform(texts[a:b]) for a, b in self._chunks(n)], format='csr')
+        # Keep only hash buckets that occur, so the SVD basis is not 2**18 columns wide
+        counts = counts[:, np.unique(counts.indices)]
+        tfidf = TfidfTransformer().fit(counts)
+
+        rng = np.random.RandomState(42)
+        sample = np.sort(rng.choice(n, size=min(n, self.svd_sample), replace=False))
+        components = max(1, min(self.svd_components, len(sample) - 1, counts.shape[1] - 1))
+        svd = TruncatedSVD(n_components=components, random_state=42).fit(tfidf.transform(counts[sample]))
+
+        reduced = np.empty((n, components), dtype=np.float32)
+        for a, b in self._chunks(n):
+            reduced[a:b] = normalize(svd.transform(tfidf.transform(counts[a:b])))
+        return reduced
+
+    def cluster_feedback_large(self, feedback_items, n_clusters=3, vectors=None):
+        """
+        Large-batch engine: hashed TF-IDF -> TruncatedSVD -> MiniBatchKMeans,
+        fitted and assigned chunk by chunk. Precomputed vectors (already
+        reduced, e.g. from the vector store) skip straight to MiniBatchKMeans.
+        """
         try:
-            tfidf_matrix = self.vectorizer.fit_transform(texts)
-            kmeans = KMeans(n_clusters=n_clusters, random_state=42)
-            kmeans.fit(tfidf_matrix)
-            
-            clusters = {}
-            for idx, label in enumerate(kmeans.labels_):
-                if label not in clusters:
-                    clusters[label] = []
-                clusters[label].append(feedback_items[idx])
-            
-            result = []
-            for label, items in clusters.items():
-                result.append({
-                    'cluster_id': int(label),
-                    'items': items,
-                    'theme': f'Cluster {label + 1}' # Placeholder theme
-                })
-            
-            return result
+            if vectors is None:
+                vectors = self.reduce_large([item['text'] for item in feedback_items])
+            n = len(feedback_items)
+            params = {'n_init': 3}
+            if n_clusters == 'auto':
+                n_clusters, centers = self.select_k(vectors)
+                if n_clusters == 1:
+                    return [{'cluster_id': 0, 'items': feedback_items, 'theme': GENERAL_THEME}]
+                # Warm start from the sample fit
+                params = {'init': centers, 'n_init': 1}
+            kmeans = MiniBatchKMeans(n_clusters=n_clusters, random_state=42,
+                                     batch_size=min(self.chunk_size, 4096), **params)
+            # Two passes over the chunks; the first chunk seeds the centroids
+            for _ in range(2):
+                for a, b in self._chunks(n):
+                    if b - a >= n_clusters:
+                        kmeans.partial_fit(vectors[a:b])
+            labels = np.empty(n, dtype=np.int64)
+            for a, b in self._chunks(n):
+                labels[a:b] = kmeans.predict(vectors[a:b])
+            distances = self._own_distances(kmeans, vectors, labels)
+            return self._group(feedback_items, labels, self.describe_clusters(feedback_items, labels, distances))
         except Exception as e:
             print(f"Clustering failed: {e}")
             # Fallback
@@ -0,0 +1,177 @@
+"""
+Shared protection for calls to hosted LLM APIs (Gemini, Vertex):
+
+  TokenBucket    - client-side rate limit matched to the API quota
+  backoff_delay  - exponential backoff with full jitter for 429/5xx and network errors
+  CircuitBreaker - after repeated failures, fails fast for a cool-down period
+                   instead of hammering an endpoint that is down
+
+ResilientCaller combines the three. When a call still fails it raises
+LLMUnavailableError, which run_pipeline turns into a degraded run rather than
+saving placeholder text.
+"""
+import os
+import random
+import threading
+import time
+
+RETRYABLE_STATUS = (429, 500, 502, 503, 504)
+
+
+class LLMUnavailableError(Exception):
+    """The LLM service could not produce an answer (after retries, or circuit open)."""
+
+
+class CircuitOpenError(LLMUnavailableError):
+    pass
+
+
+def status_code(exc):
+    """HTTP status of an API error, if it carries one (google.api_core, urllib, requests)."""
+    for attr in ('code', 'status_code'):
+        value = getattr(exc, attr, None)
+        if isinstance(value, int):
+            return value
+    response = getattr(exc, 'response', None)
+    value = getattr(response, 'status_code', None)
+    return value if isinstance(value, int) else None
+
+
+def is_retryable(exc):
+    code = status_code(exc)
+    if code is not None:
+        return code in RETRYABLE_STATUS
+    return isinstance(exc, (ConnectionError, TimeoutError))
+
+
+def backoff_delay(attempt, base=1.0, max_delay=30.0):
+    """Full jitter: uniform between 0 and base * 2**attempt, capped at max_delay."""
+    return random.uniform(0, min(max_delay, base * (2 ** attempt)))
+
+
+class TokenBucket:
+    def __init__(self, rate_per_sec, capacity):
+        self.rate = rate_per_sec
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self, tokens=1):
+        """Blocks until `tokens` are available."""
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= tokens:
+                    self.tokens -= tokens
+                    return
+                wait = (tokens - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+class CircuitBreaker:
+    """
+    closed    - calls go through; consecutive failures are counted
+    open      - calls fail immediately until reset_timeout has passed
+    half_open - one trial call is let through; success closes, failure re-opens
+    """
+
+    def __init__(self, failure_threshold=5, reset_timeout=60.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = 'closed'
+        self.failures = 0
+        self.opened_at = 0.0
+        self._trial_running = False
+        self._lock = threading.Lock()
+
+    def allow(self):
+        with self._lock:
+            if self.state == 'closed':
+                return True
+            if self.state == 'open' and time.monotonic() - self.opened_at >= self.reset_timeout:
+                self.state = 'half_open'
+                self._trial_running = False
+            if self.state == 'half_open' and not self._trial_running:
+                self._trial_running = True
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.state = 'closed'
+            self.failures = 0
+            self._trial_running = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.state == 'half_open' or self.failures >= self.failure_threshold:
+                if self.state != 'open':
+                    print(f"LLM circuit breaker opened after {self.failures} failures")
+                self.state = 'open'
+                self.opened_at = time.monotonic()
+                self._trial_running = False
+
+
+class ResilientCaller:
+    def __init__(self, name, limiter=None, breaker=None, max_retries=4, base_delay=1.0, max_delay=30.0):
+        self.name = name
+        self.limiter = limiter
+        self.breaker = breaker or CircuitBreaker()
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+    def call(self, fn, *args, **kwargs):
+        attempt = 0
+        while True:
+            if not self.breaker.allow():
+                raise CircuitOpenError(f"{self.name}: circuit open, not calling the API")
+            if self.limiter is not None:
+                self.limiter.acquire()
+            try:
+                result = fn(*args, **kwargs)
+            except Exception as e:
+                if not is_retryable(e):
+                    # The service answered (e.g. 400), so it is not down
+                    self.breaker.record_success()
+                    raise LLMUnavailableError(f"{self.name}: {e}") from e
+                self.breaker.record_failure()
+                if attempt < self.max_retries:
+                    delay = backoff_delay(attempt, self.base_delay, self.max_delay)
+                    print(f"{self.name}: {e} (retry {attempt + 1}/{self.max_retries} in {delay:.1f}s)")
+                    time.sleep(delay)
+                    attempt += 1
+                    continue
+                raise LLMUnavailableError(f"{self.name}: {e}") from e
+            self.breaker.record_success()
+            return result
+
+
+_callers = {}
+_callers_lock = threading.Lock()
+
+
+def get_resilient_caller(name):
+    """
+    One caller per API per process, so all pipeline threads share the rate
+    limit and the breaker. Configured by LLM_RATE_PER_MIN, LLM_BURST,
+    LLM_MAX_RETRIES, LLM_BACKOFF_BASE, LLM_BACKOFF_MAX, LLM_BREAKER_FAILURES
+    and LLM_BREAKER_RESET.
+    """
+    with _callers_lock:
+        if name not in _callers:
+            rate = float(os.environ.get('LLM_RATE_PER_MIN', 15)) / 60
+            limiter = TokenBucket(rate, float(os.environ.get('LLM_BURST', 5))) if rate > 0 else None
+            breaker = CircuitBreaker(int(os.environ.get('LLM_BREAKER_FAILURES', 5)),
+                                     float(os.environ.get('LLM_BREAKER_RESET', 60)))
+            _callers[name] = ResilientCaller(
+                name, limiter, breaker,
+                max_retries=int(os.environ.get('LLM_MAX_RETRIES', 4)),
+                base_delay=float(os.environ.get('LLM_BACKOFF_BASE', 1.0)),
+                max_delay=float(os.environ.get('LLM_BACKOFF_MAX', 30))
+            )
+        return _callers[name]
@@ -0,0 +1,130 @@
+"""
+Token-budgeted input for cluster analysis. A cluster's texts go into the
+problem-statement prompt, so a cluster of 20k items would otherwise produce
+a prompt far beyond what the model accepts.
+
+Clusters within LLM_PROMPT_TOKEN_BUDGET are sent whole. Larger clusters are
+sampled: the texts nearest the cluster's centroid first, then outliers picked
+farthest-first from everything already chosen, so minority complaints inside
+the cluster still reach the model. When a sample of up to
+LLM_MAP_REDUCE_FANOUT budgets is larger than one prompt, it is summarized
+map-reduce style: each budget-sized chunk becomes a partial problem statement
+(map) and the partials are analyzed in place of the texts (reduce), condensed
+again if they still exceed the budget.
+
+Token counts are estimates (llm_client.estimate_tokens, about 4 characters
+per token); similarity uses hashed term frequencies, so no fitted state is
+needed.
+"""
+import os
+
+import numpy as np
+from sklearn.feature_extraction.text import HashingVectorizer
+
+from ai_module.llm_client import estimate_tokens, is_error_output
+
+# Estimated tokens of feedback text per problem-statement prompt
+PROMPT_TOKEN_BUDGET = int(os.environ.get('LLM_PROMPT_TOKEN_BUDGET', 3000))
+# Most prompts' worth of sampled text summarized per cluster (1 = sample one prompt, no map-reduce)
+MAP_REDUCE_FANOUT = int(os.environ.get('LLM_MAP_REDUCE_FANOUT', 4))
+# Share of a sample taken from the cluster's core; the rest goes to outliers
+CORE_SHARE = float(os.environ.get('LLM_SAMPLE_CORE_SHARE', 0.7))
+# Longer texts are clipped so one essay cannot crowd out the rest of the sample
+MAX_TEXT_TOKENS = 250
+
+_hasher = HashingVectorizer(n_features=2 ** 18, stop_words='english', alternate_sign=False, norm='l2')
+
+
+def _cost(text):
+    # Each text is one "- text" line in the prompt
+    return estimate_tokens(text) + 2
+
+
+def prompt_tokens(texts):
+    return sum(_cost(t) for t in texts)
+
+
+def _clip(text):
+    limit = MAX_TEXT_TOKENS * 4
+    return text if len(text) <= limit else text[:limit].rsplit(' ', 1)[0] + '...'
+
+
+def sample_texts(texts, budget, core_share=CORE_SHARE, max_candidates=5000):
+    """
+    Representative texts whose estimated tokens fit `budget`, nearest the
+    centroid first and outliers after. Duplicates count once; above
+    max_candidates texts, an evenly spaced subset is considered.
+    """
+    pool = list(dict.fromkeys(_clip(t) for t in texts))
+    if prompt_tokens(pool) <= budget:
+        return pool
+    if len(pool) > max_candidates:
+        pool = [pool[i] for i in np.linspace(0, len(pool) - 1, max_candidates).astype(int)]
+
+    X = _hasher.transform(pool)
+    costs = np.array([_cost(t) for t in pool])
+    centroid = np.asarray(X.mean(axis=0)).ravel()
+    picked = np.zeros(len(pool), dtype=bool)
+    order, used = [], 0
+
+    for i in np.argsort(-(X @ centroid), kind='stable'):
+        if order and used + costs[i] > budget * core_share:
+            break
+        picked[i] = True
+        order.append(i)
+        used += costs[i]
+
+    # Farthest-first: each outlier is the text least similar to any text picked so far
+    nearest = np.asarray((X @ X[order].T).max(axis=1).todense()).ravel()
+    while True:
+        fits = ~picked & (costs <= budget - used)
+        if not fits.any():
+            break
+        i = np.flatnonzero(fits)[np.argmin(nearest[fits])]
+        picked[i] = True
+        order.append(i)
+        used += costs[i]
+        nearest = np.maximum(nearest, (X @ X[i].T).toarray().ravel())
+    return [pool[i] for i in order]
+
+
+def _chunks(texts, budget):
+    chunk, used = [], 0
+    for text in texts:
+        if chunk and used + _cost(text) > budget:
+            yield chunk
+            chunk, used = [], 0
+        chunk.append(text)
+        used += _cost(text)
+    if chunk:
+        yield chunk
+
+
+def condense(llm, texts, budget=None, fanout=None):
+    """
+    Texts to analyze a cluster with, within `budget` estimated tokens (see the
+    module docstring). The map step calls llm.generate_problem_statement once
+    per chunk, so it is cached and metered like any other call; chunks whose
+    call fails are dropped, and if all fail a single-prompt sample is used.
+    """
+    budget = budget or PROMPT_TOKEN_BUDGET
+    fanout = MAP_REDUCE_FANOUT if fanout is None else fanout
+    if prompt_tokens(texts) <= budget:
+        return texts
+    if fanout <= 1:
+        return sample_texts(texts, budget)
+
+    # Greedy chunking leaves less than one text unused per chunk, so the sample packs into `fanout` prompts
+    slack = min(budget // 2, _cost('x' * MAX_TEXT_TOKENS * 4))
+    sample = sample_texts(texts, (budget - slack) * fanout)
+    if prompt_tokens(sample) <= budget:
+        return sample
+    partials = [llm.generate_problem_statement(chunk) for chunk in _chunks(sample, budget)]
+    partials = [p for p in partials if not is_error_output(p)]
+    if not partials:
+        return sample_texts(texts, budget)
+    if prompt_tokens(partials) >= prompt_tokens(sample):
+        # The summaries are no shorter than their input; stop recursing
+        return sample_texts(partials, budget)
+    print(f"Summarize: {len(texts)} texts condensed to {len(partials)} partial problem statements")
+    return condense(llm, partials, budget, fanout)
@@ -0,0 +1,186 @@
+"""
+Memory-mapped store of one vector per feedback item, keyed by feedback id.
+
+Vectors are computed once, the first time an item is processed, and read back
+on later runs instead of re-tokenizing the text. They must mean the same thing
+on every run, so they come from a stateless transform rather than a fitted
+TF-IDF vocabulary: hashed term frequencies (HashingVectorizer, no vocabulary)
+projected to `dim` dimensions by a fixed sparse random projection, then
+L2-normalized. Cosine similarity between stored vectors approximates cosine
+similarity of the term-frequency vectors.
+
+Files in the store directory (VECTOR_STORE_PATH, default data/vectors):
+  vectors.f32  rows of `dim` float32 values, row i belongs to line i of ids.txt
+  ids.txt      one feedback id per line; its line count is the row count
+  meta.json    dim, n_features and seed, checked when the store is opened
+
+Several processes can share a store: appends take an exclusive flock, and
+readers pick up rows appended by others when ids.txt grows.
+
+The store is opt-in (VECTOR_STORE=on). Its vectors carry no IDF weighting,
+which cannot be applied after the projection, so clustering on them is not
+equivalent to the TF-IDF clustering used otherwise; enable it only where
+that trade is acceptable.
+"""
+import fcntl
+import json
+import os
+import threading
+
+import numpy as np
+from scipy import sparse
+from sklearn.feature_extraction.text import HashingVectorizer
+from sklearn.preprocessing import normalize
+
+
+class FeedbackVectorizer:
+    def __init__(self, preprocessor=None, dim=256, n_features=2 ** 18, seed=42, nnz_per_feature=4):
+        self.dim = dim
+        self.n_features = n_features
+        self.seed = seed
+        self.hasher = HashingVectorizer(
+            n_features=n_features, stop_words='english', alternate_sign=False,
+            norm='l2', preprocessor=preprocessor
+        )
+        # Each hashed feature maps to a few random output columns with random signs.
+        # np.random.RandomState streams are stable across numpy versions.
+        rng = np.random.RandomState(seed)
+        rows = np.repeat(np.arange(n_features), nnz_per_feature)
+        cols = rng.randint(0, dim, size=rows.size)
+        signs = rng.choice(np.array([-1.0, 1.0], dtype=np.float32), size=rows.size) / np.sqrt(nnz_per_feature)
+        self.projection = sparse.csr_matrix((signs, (rows, cols)), shape=(n_features, dim), dtype=np.float32)
+
+    def transform(self, texts):
+        projected = (self.hasher.transform(texts) @ self.projection).toarray()
+        return normalize(projected.astype(np.float32, copy=False))
+
+
+class VectorStore:
+    def __init__(self, path, vectorizer):
+        self.path = path
+        self.vectorizer = vectorizer
+        self.dim = vectorizer.dim
+        self._vectors_path = os.path.join(path, 'vectors.f32')
+        self._ids_path = os.path.join(path, 'ids.txt')
+        self._lock_path = os.path.join(path, '.lock')
+        self._ids = []
+        self._rows = {}
+        self._ids_offset = 0
+        self._matrix = None
+        self._lock = threading.Lock()
+
+        os.makedirs(path, exist_ok=True)
+        meta = {'dim': vectorizer.dim, 'n_features': vectorizer.n_features, 'seed': vectorizer.seed}
+        meta_path = os.path.join(path, 'meta.json')
+        if os.path.exists(meta_path):
+            with open(meta_path) as f:
+                stored = json.load(f)
+            if stored != meta:
+                raise ValueError(f"Vector store {path} was built with {stored}, not {meta}")
+        else:
+            with open(meta_path, 'w') as f:
+                json.dump(meta, f)
+        for name in ('vectors.f32', 'ids.txt'):
+            open(os.path.join(path, name), 'ab').close()
+
+    def __len__(self):
+        self._refresh()
+        return len(self._ids)
+
+    def _refresh(self):
+        """Reads ids appended since the last refresh (by this or another process)."""
+        with open(self._ids_path, 'rb') as f:
+            f.seek(self._ids_offset)
+            data = f.read()
+        # Ignore a trailing line another process is still writing
+        end = data.rfind(b'\n') + 1
+        if not end:
+            return
+        for line in data[:end].decode().splitlines():
+            self._rows[line] = len(self._ids)
+            self._ids.append(line)
+        self._ids_offset += end
+        self._matrix = None
+
+    def _memmap(self):
+        if self._matrix is None:
+            if not self._ids:
+                return np.zeros((0, self.dim), dtype=np.float32)
+            self._matrix = np.memmap(self._vectors_path, dtype=np.float32, mode='r', shape=(len(self._ids), self.dim))
+        return self._matrix
+
+    def _append(self, ids, vectors):
+        with open(self._lock_path, 'w') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            self._refresh()
+            fresh = [i for i, fid in enumerate(ids) if fid not in self._rows]
+            if fresh:
+                with open(self._vectors_path, 'r+b') as f:
+                    f.seek(len(self._ids) * self.dim * 4)
+                    f.write(np.ascontiguousarray(vectors[fresh], dtype=np.float32).tobytes())
+                    f.flush()
+                    os.fsync(f.fileno())
+                # ids.txt defines the row count, so it is written after the vectors
+                with open(self._ids_path, 'ab') as f:
+                    f.write(''.join(f"{ids[i]}\n" for i in fresh).encode())
+                self._refresh()
+
+    def vectors_for(self, items):
+        """
+        Matrix of vectors for feedback items (dicts with 'id' and 'text'), in
+        order. Items not stored yet are vectorized and appended.
+        """
+        with self._lock:
+            self._refresh()
+            missing = [item for item in items if item['id'] not in self._rows]
+            if missing:
+                # Items repeated in `items` are vectorized once
+                unique = list({item['id']: item for item in missing}.values())
+                vectors = self.vectorizer.transform([item['text'] for item in unique])
+                self._append([item['id'] for item in unique], vectors)
+            rows = np.fromiter((self._rows[item['id']] for item in items), dtype=np.int64, count=len(items))
+            return np.asarray(self._memmap()[rows])
+
+    def get(self, feedback_ids):
+        """Stored vectors for ids (zeros where missing) and a mask of which were found."""
+        with self._lock:
+            self._refresh()
+            found = np.array([fid in self._rows for fid in feedback_ids], dtype=bool)
+            out = np.zeros((len(feedback_ids), self.dim), dtype=np.float32)
+            if found.any():
+                rows = [self._rows[fid] for fid, ok in zip(feedback_ids, found) if ok]
+                out[found] = self._memmap()[rows]
+            return out, found
+
+    def search(self, query, k=10, chunk_rows=65536):
+        """Top-k (feedback_id, cosine similarity) for a query text or vector, scanning in chunks."""
+        if isinstance(query, str):
+            query = self.vectorizer.transform([query])[0]
+        with self._lock:
+            self._refresh()
+            matrix, ids = self._memmap(), list(self._ids)
+        best_ids, best_scores = np.array([], dtype=np.int64), np.array([], dtype=np.float32)
+        for start in range(0, len(ids), chunk_rows):
+            scores = matrix[start:start + chunk_rows] @ query
+            top = np.argsort(scores)[::-1][:k]
+            best_ids = np.concatenate([best_ids, top + start])
+            best_scores = np.concatenate([best_scores, scores[top]])
+            keep = np.argsort(best_scores)[::-1][:k]
+            best_ids, best_scores = best_ids[keep], best_scores[keep]
+        return [(ids[i], float(s)) for i, s in zip(best_ids, best_scores)]
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_vector_store(preprocessor=None):
+    """Process-wide store from VECTOR_STORE_PATH, or None unless VECTOR_STORE=on."""
+    global _store
+    if os.environ.get('VECTOR_STORE', 'off').lower() not in ('on', '1', 'true', 'yes'):
+        return None
+    with _store_lock:
+        if _store is None:
+            path = os.environ.get('VECTOR_STORE_PATH', os.path.join('data', 'vectors'))
+            _store = VectorStore(path, FeedbackVectorizer(preprocessor, dim=int(os.environ.get('VECTOR_DIM', 256))))
+        return _store
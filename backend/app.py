@@ -14,7 +14,13 @@ load_dotenv()
 
 from flask_sqlalchemy import SQLAlchemy
 from backend.storage import db, SQLAlchemyStorage
+from backend.write_buffer import FeedbackWriteBuffer
+from backend.dedup import NearDuplicateIndex
+from backend import migrations
+from backend.cache import create_cache
+from backend.jobs import PipelineJobQueue
 from ai_module.pipeline import run_pipeline
+from ai_module.llm_cache import get_llm_cache
 
 app = Flask(__name__, static_folder='..', static_url_path='/')
 CORS(app)
@@ -33,88 +39,257 @@ db.init_app(app)
 # Create Tables (Local Dev)
 with app.app_context():
     db.create_all()
-
-storage = SQLAlchemyStorage(db)
+    migrations.upgrade(db.engine)
+
+# Response cache for GET endpoints.
+# CACHE_BACKEND: 'memory' (default), 'socket' (shared across workers) or 'none'
+response_cache = create_cache()
+storage = SQLAlchemyStorage(db, cache=response_cache)
+
+def cached(name, institute_id, loader):
+    """Serves a GET response from the cache, keyed on the query string."""
+    if response_cache is None:
+        return loader()
+    return response_cache.get_or_set(name, institute_id, request.args.to_dict(), loader)
+
+# Near-duplicate detection for /api/feedback. DEDUP_MAX_DISTANCE=-1 disables it.
+DEDUP_MAX_DISTANCE = int(os.environ.get('DEDUP_MAX_DISTANCE', 4))
+dedup_index = NearDuplicateIndex(
+    max_distance=max(DEDUP_MAX_DISTANCE, 0),
+    window=int(os.environ.get('DEDUP_WINDOW', 5000))
+)
+if DEDUP_MAX_DISTANCE >= 0:
+    with app.app_context():
+        dedup_index.warm(storage)
+
+# Group-commit buffer for /api/feedback.
+# FEEDBACK_WRITE_MODE: 'buffered' (default), 'sync' (wait for the group commit) or 'direct'
+write_buffer = FeedbackWriteBuffer(
+    app, storage,
+    mode=os.environ.get('FEEDBACK_WRITE_MODE', 'buffered'),
+    max_batch=int(os.environ.get('FEEDBACK_FLUSH_BATCH', 500)),
+    max_delay_ms=float(os.environ.get('FEEDBACK_FLUSH_MS', 5)),
+    # A dropped record must not stay in the index, or its near-duplicates would collapse into nothing
+    on_reject=lambda data, reason: dedup_index.discard(data['institute_id'], data['id'])
+)
 
 @app.route('/')
 def index():
     return app.send_static_file('index.html')
 
-@app.route('/api/feedback', methods=['POST'])
-def submit_feedback():
-    data = request.json
-    if not data or 'text' not in data:
-        return jsonify({'error': 'Invalid data'}), 400
-    
-    # Extract extended metadata
-    feedback_data = {
+# Upper bound on records accepted by a single bulk request
+BULK_FEEDBACK_MAX = int(os.environ.get('BULK_FEEDBACK_MAX', 10000))
+
+def build_feedback_data(data):
+    """Extracts the extended feedback metadata from a submitted JSON object."""
+    return {
         'text': data.get('text'),
         'category': data.get('category', 'general'),
         'role': data.get('role', 'Anonymous'),
         'is_verified': data.get('is_verified', False),
         'user_id': data.get('user_id', 'Anonymous'),
         'user_name': data.get('user_name', 'Anonymous'),
-        'user_name': data.get('user_name', 'Anonymous'),
         'institute_id': data.get('institute_id', 'Default'),
-        'timestamp': datetime.now().isoformat()
+        'timestamp': datetime.now()
     }
+
+@app.route('/api/feedback', methods=['POST'])
+def submit_feedback():
+    data = request.json
+    if not data or 'text' not in data:
+        return jsonify({'error': 'Invalid data'}), 400
     
-    record = storage.add_feedback(feedback_data)
+    feedback_data = build_feedback_data(data)
+    feedback_data['id'] = str(uuid.uuid4())
+
+    try:
+        write_buffer.validate(feedback_data)
+        if DEDUP_MAX_DISTANCE >= 0:
+            duplicate_of, fp = dedup_index.check_and_add(
+                feedback_data['institute_id'], feedback_data['text'], feedback_data['id']
+            )
+            if duplicate_of:
+                # Collapse into the original submission instead of storing a new row
+                write_buffer.submit_duplicate(duplicate_of)
+                return jsonify({'status': 'duplicate', 'id': duplicate_of, 'duplicate_of': duplicate_of}), 200
+            feedback_data['fingerprint'] = NearDuplicateIndex.to_hex(fp)
+
+        try:
+            record = write_buffer.submit(feedback_data)
+        except Exception:
+            dedup_index.discard(feedback_data['institute_id'], feedback_data['id'])
+            raise
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
     
     return jsonify({'status': 'success', 'id': record['id']}), 201
 
+@app.route('/api/feedback/bulk', methods=['POST'])
+def submit_feedback_bulk():
+    """
+    Accepts a list of feedback objects (or {'feedback': [...]}) and stores
+    them in one transaction. Reports accepted and rejected rows by index.
+    """
+    data = request.json
+    records = data.get('feedback') if isinstance(data, dict) else data
+    if not isinstance(records, list) or not records:
+        return jsonify({'error': 'Expected a non-empty list of feedback'}), 400
+    if len(records) > BULK_FEEDBACK_MAX:
+        return jsonify({'error': f'Too many records (max {BULK_FEEDBACK_MAX})'}), 413
+
+    batch = [build_feedback_data(r) if isinstance(r, dict) else r for r in records]
+    outcome = storage.add_feedback_batch(batch)
+
+    return jsonify({
+        'status': 'success' if outcome['accepted'] else 'failed',
+        'accepted_count': len(outcome['accepted']),
+        'rejected_count': len(outcome['rejected']),
+        'accepted': outcome['accepted'],
+        'rejected': outcome['rejected']
+    }), 201 if outcome['accepted'] else 400
+
+def _run_pipeline_job(institute_id, progress, job_id, **options):
+    # The job id names the run, so a job re-queued after a crash resumes from its checkpoints
+    return run_pipeline(storage, institute_id=institute_id, progress=progress, run_id=job_id, **options)
+
+# Background pipeline runs. PIPELINE_WORKERS threads per process share the JOBS_DB queue.
+job_queue = PipelineJobQueue(
+    app, _run_pipeline_job,
+    path=os.environ.get('JOBS_DB', os.path.join(app.instance_path, 'jobs.db')),
+    workers=int(os.environ.get('PIPELINE_WORKERS', 2)),
+    stale_seconds=float(os.environ.get('JOB_STALE_SECONDS', 600)),
+    max_attempts=int(os.environ.get('JOB_MAX_ATTEMPTS', 3))
+)
+
 @app.route('/api/process', methods=['POST'])
 def trigger_processing():
     """
-    Manually trigger the AI pipeline for a specific institute.
+    Queues an AI pipeline run for a specific institute and returns its job id.
+    Without an institute_id every institute is processed as its own shard,
+    with one Result each. Poll /api/process/<job_id> for progress. Pass
+    {"wait": true} to run it inside the request instead (scripts, local
+    debugging); with "run_id" as well, an interrupted run of that id resumes
+    and a completed one returns its recorded summary.
     """
     data = request.json or {}
     institute_id = data.get('institute_id')
-    
-    try:
-        # We need to update run_pipeline signature too, but assuming it takes storage and ID, or just storage 
-        # and we pass ID to storage methods?
-        # Actually pipeline.py usually calls `storage.get_unprocessed_feedback()`.
-        # I need to verify pipeline.py. Assuming I can pass kwargs or update it.
-        # For now, let's pass institute_id to run_pipeline if it accepts it, OR 
-        # if run_pipeline is blackbox, I might need to update it.
-        # Let's assume run_pipeline needs update or we pass it as arg.
-        
-        # Let's check pipeline import. `from ai_module.pipeline import run_pipeline`
-        # I'll pass institute_id and check if I need to update pipeline.py next.
-        result = run_pipeline(storage, institute_id=institute_id)
-        return jsonify({'status': 'success', 'result': result}), 200
-    except Exception as e:
-        print(f"Error in pipeline: {e}")
-        return jsonify({'error': str(e)}), 500
+
+    if data.get('wait'):
+        try:
+            result = run_pipeline(storage, institute_id=institute_id, run_id=data.get('run_id'))
+            return jsonify({'status': 'success', 'result': result}), 200
+        except Exception as e:
+            print(f"Error in pipeline: {e}")
+            return jsonify({'error': str(e)}), 500
+
+    job_id = job_queue.submit(institute_id)
+    return jsonify({
+        'status': 'queued',
+        'job_id': job_id,
+        'status_url': f'/api/process/{job_id}'
+    }), 202
+
+@app.route('/api/process/<job_id>', methods=['GET'])
+def get_processing_status(job_id):
+    """Status, per-stage progress and timings, and the final result of a pipeline job."""
+    job = job_queue.get(job_id)
+    if job is None:
+        return jsonify({'error': 'Job not found'}), 404
+    return jsonify(job)
 
 @app.route('/api/results', methods=['GET'])
 @app.route('/api/results', methods=['GET'])
 def get_results():
+    """
+    Latest clusters, served from the stored JSON text. The ETag is the Result id
+    and version, so dashboards polling with If-None-Match get a 304 until the
+    pipeline saves a new result or another window into the same one.
+    """
     institute_id = request.args.get('institute_id')
-    results = storage.get_latest_results(institute_id=institute_id)
-    return jsonify(results)
+    latest = cached('results', institute_id, lambda: storage.get_latest_result_raw(institute_id))
+    etag = f"{latest['id']}.{latest['version']}" if latest['id'] else 'none'
+
+    if request.if_none_match.contains(etag):
+        response = app.response_class(status=304)
+    else:
+        response = app.response_class('{"clusters": ' + latest['clusters'] + '}', mimetype='application/json')
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
 
 @app.route('/api/stats', methods=['GET'])
 def get_stats():
+    """Feedback statistics. Optional start/end (ISO dates) restrict counts to a time window."""
     institute_id = request.args.get('institute_id')
     if not institute_id or institute_id == 'Default':
-        return jsonify(storage.get_feedback_stats())
-    return jsonify(storage.get_feedback_stats(institute_id))
+        institute_id = None
+
+    try:
+        start = request.args.get('start')
+        end = request.args.get('end')
+        start = datetime.fromisoformat(start) if start else None
+        end = datetime.fromisoformat(end) if end else None
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    return jsonify(cached('stats', institute_id,
+                          lambda: storage.get_feedback_stats(institute_id, start=start, end=end)))
 
 @app.route('/api/stats/global', methods=['GET'])
 def get_global_stats():
     """Returns global platform statistics for the landing page."""
-    return jsonify(storage.get_global_stats())
+    return jsonify(cached('global_stats', None, storage.get_global_stats))
+
+@app.route('/api/cache/stats', methods=['GET'])
+def get_cache_stats():
+    """Hit/miss counters of the response cache."""
+    if response_cache is None:
+        return jsonify({'enabled': False})
+    return jsonify(dict(response_cache.stats(), enabled=True))
+
+@app.route('/api/cache/llm', methods=['GET'])
+def get_llm_cache_stats():
+    """Hit ratio and size of the LLM output cache (this process's counters)."""
+    llm_cache = get_llm_cache()
+    if llm_cache is None:
+        return jsonify({'enabled': False})
+    return jsonify(dict(llm_cache.stats(), enabled=True))
 
 @app.route('/api/feedback/list', methods=['GET'])
 def get_all_feedback_list():
+    """
+    Paginated feedback listing, newest first.
+    Query params: limit, cursor, category, role, processed (true/false),
+    start and end (ISO dates). Returns {'items': [...], 'next_cursor': ...}.
+    """
     institute_id = request.args.get('institute_id')
-    if not institute_id or institute_id == 'Default':
-        # Optional: Decide if we want to show ALL feedback if no ID, or restricted. 
-        # For now, consistent with stats, return all if no ID provided (or handle as 'Default')
-        return jsonify(storage.get_all_feedback())
-    return jsonify(storage.get_all_feedback(institute_id))
+    if institute_id == 'Default':
+        # Consistent with stats: 'Default' (or no ID) lists all feedback
+        institute_id = None
+
+    try:
+        limit = min(max(int(request.args.get('limit', 50)), 1), 500)
+        processed = request.args.get('processed')
+        if processed is not None:
+            processed = processed.lower() in ('1', 'true', 'yes')
+        start = request.args.get('start')
+        end = request.args.get('end')
+        page = cached('feedback_list', institute_id, lambda: storage.list_feedback(
+            institute_id=institute_id,
+            limit=limit,
+            cursor=request.args.get('cursor'),
+            category=request.args.get('category'),
+            role=request.args.get('role'),
+            processed=processed,
+            start=datetime.fromisoformat(start) if start else None,
+            end=datetime.fromisoformat(end) if end else None
+        ))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    return jsonify(page)
 
 @app.route('/api/export/pdf', methods=['POST'])
 def export_pdf():
@@ -309,5 +484,8 @@ if __name__ == '__main__':
         except Exception as e:
             print(f"Startup Seeding Failed: {e}")
 
+    # With the reloader, only the serving child runs jobs
+    if os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+        job_queue.start()
     port = int(os.environ.get('PORT', 5000))
     app.run(host='0.0.0.0', port=port, debug=True)
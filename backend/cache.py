@@ -0,0 +1,216 @@
+"""
+Read-through cache for GET endpoints, with invalidation driven by storage writes.
+
+Backends:
+  MemoryCache - in-process LRU with TTL (default). Each gunicorn worker has its own.
+  SocketCache - client for a shared cache server on a local Unix socket, so all
+                workers see the same entries and the same invalidations. Start it with
+                    python -m backend.cache serve --socket /tmp/nexus-cache.sock
+
+Keys are prefixed with the institute they belong to ('*' for cross-institute
+data such as global stats), so a write to one institute drops exactly that
+institute's entries plus the cross-institute ones.
+"""
+import argparse
+import json
+import os
+import socket
+import socketserver
+import threading
+import time
+from collections import OrderedDict
+
+ALL_INSTITUTES = '*'
+
+
+class MemoryCache:
+    def __init__(self, max_entries=1024, ttl=30):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._data = OrderedDict()  # key -> (expires_at, value)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        """Returns (hit, value)."""
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None or entry[0] < time.monotonic():
+                if entry is not None:
+                    del self._data[key]
+                self.misses += 1
+                return False, None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return True, entry[1]
+
+    def set(self, key, value, ttl=None):
+        with self._lock:
+            self._data[key] = (time.monotonic() + (ttl or self.ttl), value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+    def delete_prefix(self, prefix):
+        with self._lock:
+            for key in [k for k in self._data if k.startswith(prefix)]:
+                del self._data[key]
+
+    def stats(self):
+        with self._lock:
+            return {'hits': self.hits, 'misses': self.misses, 'entries': len(self._data)}
+
+
+class SocketCache:
+    """Client for the shared cache server. Fails open: errors count as misses."""
+
+    def __init__(self, path, ttl=30, timeout=0.5):
+        self.path = path
+        self.ttl = ttl
+        self.timeout = timeout
+        self._local = threading.local()
+
+    def _call(self, request):
+        for attempt in range(2):
+            conn = getattr(self._local, 'conn', None)
+            try:
+                if conn is None:
+                    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+                    sock.settimeout(self.timeout)
+                    sock.connect(self.path)
+                    conn = self._local.conn = sock.makefile('rwb')
+                conn.write(json.dumps(request).encode() + b'\n')
+                conn.flush()
+                line = conn.readline()
+                if not line:
+                    raise ConnectionError('cache server closed the connection')
+                return json.loads(line)
+            except (OSError, ValueError) as e:
+                self._local.conn = None
+                if attempt:
+                    print(f"Cache server unavailable: {e}")
+        return None
+
+    def get(self, key):
+        reply = self._call({'op': 'get', 'key': key})
+        if not reply or not reply.get('hit'):
+            return False, None
+        return True, reply['value']
+
+    def set(self, key, value, ttl=None):
+        self._call({'op': 'set', 'key': key, 'value': value, 'ttl': ttl or self.ttl})
+
+    def delete_prefix(self, prefix):
+        self._call({'op': 'delete_prefix', 'prefix': prefix})
+
+    def stats(self):
+        return self._call({'op': 'stats'}) or {'error': 'cache server unavailable'}
+
+
+class ResponseCache:
+    """Keyed by endpoint name, institute and request params, with hit/miss counters."""
+
+    def __init__(self, backend):
+        self.backend = backend
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def make_key(name, institute_id, params=None):
+        inst = institute_id or ALL_INSTITUTES
+        suffix = json.dumps(sorted((params or {}).items()), default=str)
+        return f"{inst}|{name}|{suffix}"
+
+    def get_or_set(self, name, institute_id, params, loader):
+        key = self.make_key(name, institute_id, params)
+        hit, value = self.backend.get(key)
+        with self._lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+        if hit:
+            return value
+        value = loader()
+        self.backend.set(key, value)
+        return value
+
+    def invalidate(self, institute_ids):
+        """Drops entries for the given institutes and all cross-institute entries."""
+        for inst in set(institute_ids or ()):
+            if inst:
+                self.backend.delete_prefix(f"{inst}|")
+        self.backend.delete_prefix(f"{ALL_INSTITUTES}|")
+
+    def stats(self):
+        with self._lock:
+            total = self.hits + self.misses
+            local = {'hits': self.hits, 'misses': self.misses,
+                     'hit_ratio': round(self.hits / total, 4) if total else 0.0}
+        return {'worker': local, 'backend': self.backend.stats()}
+
+
+def create_cache(kind=None):
+    """Builds the cache configured by CACHE_BACKEND ('memory', 'socket' or 'none')."""
+    kind = kind or os.environ.get('CACHE_BACKEND', 'memory')
+    ttl = float(os.environ.get('CACHE_TTL', 30))
+    if kind == 'none':
+        return None
+    if kind == 'socket':
+        return ResponseCache(SocketCache(os.environ.get('CACHE_SOCKET', '/tmp/nexus-cache.sock'), ttl=ttl))
+    return ResponseCache(MemoryCache(int(os.environ.get('CACHE_MAX_ENTRIES', 1024)), ttl=ttl))
+
+
+# --- Shared cache server ---
+class _CacheRequestHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        cache = self.server.cache
+        for line in self.rfile:
+            try:
+                req = json.loads(line)
+                op = req.get('op')
+                if op == 'get':
+                    hit, value = cache.get(req['key'])
+                    reply = {'hit': hit, 'value': value}
+                elif op == 'set':
+                    cache.set(req['key'], req.get('value'), req.get('ttl'))
+                    reply = {'ok': True}
+                elif op == 'delete_prefix':
+                    cache.delete_prefix(req['prefix'])
+                    reply = {'ok': True}
+                elif op == 'stats':
+                    reply = cache.stats()
+                else:
+                    reply = {'error': f'unknown op {op}'}
+            except (ValueError, KeyError) as e:
+                reply = {'error': str(e)}
+            self.wfile.write(json.dumps(reply).encode() + b'\n')
+            self.wfile.flush()
+
+
+class CacheServer(socketserver.ThreadingUnixStreamServer):
+    daemon_threads = True
+
+    def __init__(self, path, cache):
+        if os.path.exists(path):
+            os.unlink(path)
+        self.cache = cache
+        super().__init__(path, _CacheRequestHandler)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Shared response cache server for Nexus workers.')
+    parser.add_argument('command', choices=['serve'])
+    parser.add_argument('--socket', default=os.environ.get('CACHE_SOCKET', '/tmp/nexus-cache.sock'))
+    parser.add_argument('--max-entries', type=int, default=int(os.environ.get('CACHE_MAX_ENTRIES', 4096)))
+    parser.add_argument('--ttl', type=float, default=float(os.environ.get('CACHE_TTL', 30)))
+    args = parser.parse_args()
+
+    server = CacheServer(args.socket, MemoryCache(args.max_entries, args.ttl))
+    print(f"Cache server listening on {args.socket}")
+    try:
+        server.serve_forever()
+    finally:
+        os.unlink(args.socket)
@@ -0,0 +1,127 @@
+import hashlib
+import re
+import threading
+from collections import deque
+
+import numpy as np
+
+_BIT_WEIGHTS = np.left_shift(np.uint64(1), np.arange(64, dtype=np.uint64))
+
+
+def _features(text):
+    words = re.findall(r'[a-z0-9]+', (text or '').lower())
+    # Unigrams plus bigrams, so reordered sentences still differ a little
+    return words + [f"{a} {b}" for a, b in zip(words, words[1:])]
+
+
+def simhash(text):
+    """64-bit SimHash of a feedback text. Near-identical texts differ in few bits."""
+    feats = _features(text)
+    if not feats:
+        return 0
+    hashes = np.array(
+        [int.from_bytes(hashlib.blake2b(f.encode(), digest_size=8).digest(), 'big') for f in feats],
+        dtype=np.uint64
+    )
+    bits = (hashes[:, None] >> np.arange(64, dtype=np.uint64)) & np.uint64(1)
+    votes = bits.sum(axis=0, dtype=np.int64) * 2 - len(feats)
+    return int(np.dot((votes > 0).astype(np.uint64), _BIT_WEIGHTS))
+
+
+class NearDuplicateIndex:
+    """
+    In-memory SimHash index of recent feedback, one per institute.
+
+    A fingerprint is split into `bands` equal slices. By the pigeonhole
+    principle, two fingerprints within `max_distance` (< bands) bits share at
+    least one slice exactly, so a lookup only compares against candidates from
+    `bands` dict probes instead of scanning the window.
+
+    Fingerprints are stored on the Feedback rows, and the index is rebuilt from
+    the most recent rows when the app starts (warm). An id whose write is
+    rejected is taken out again with discard(), so later near-duplicates do
+    not collapse into a row that was never stored.
+    """
+
+    def __init__(self, max_distance=4, window=5000, min_features=6, bands=5):
+        if max_distance >= bands:
+            raise ValueError("max_distance must be smaller than the number of bands")
+        self.max_distance = max_distance
+        self.window = window
+        self.min_features = min_features
+        self.bands = bands
+        self.band_bits = 64 // bands
+        self._recent = {}   # institute_id -> deque of (feedback_id, fingerprint)
+        self._buckets = {}  # (institute_id, band, value) -> {feedback_id: fingerprint}
+        self._lock = threading.Lock()
+        self._warmed = False
+
+    def _band_keys(self, institute_id, fp):
+        mask = (1 << self.band_bits) - 1
+        return [(institute_id, b, (fp >> (b * self.band_bits)) & mask) for b in range(self.bands)]
+
+    def _lookup(self, institute_id, fp, max_distance):
+        best = None
+        for key in self._band_keys(institute_id, fp):
+            for fid, other in self._buckets.get(key, {}).items():
+                dist = bin(fp ^ other).count('1')
+                if dist <= max_distance and (best is None or dist < best[1]):
+                    best = (fid, dist)
+        return best[0] if best else None
+
+    def _unbucket(self, institute_id, fp, feedback_id):
+        for key in self._band_keys(institute_id, fp):
+            bucket = self._buckets.get(key)
+            if bucket is not None:
+                bucket.pop(feedback_id, None)
+                if not bucket:
+                    del self._buckets[key]
+
+    def _add(self, institute_id, fp, feedback_id):
+        recent = self._recent.setdefault(institute_id, deque())
+        recent.append((feedback_id, fp))
+        for key in self._band_keys(institute_id, fp):
+            self._buckets.setdefault(key, {})[feedback_id] = fp
+        while len(recent) > self.window:
+            old_id, old_fp = recent.popleft()
+            self._unbucket(institute_id, old_fp, old_id)
+
+    def check_and_add(self, institute_id, text, feedback_id):
+        """
+        Returns (duplicate_of, fingerprint). If the text is a near-duplicate of a
+        recent submission, duplicate_of is that submission's id and nothing is
+        added; otherwise duplicate_of is None and feedback_id is indexed.
+        """
+        fp = simhash(text)
+        # Very short texts collide too easily, so they only match exactly
+        max_distance = self.max_distance if len(_features(text)) >= self.min_features else 0
+        with self._lock:
+            original = self._lookup(institute_id, fp, max_distance)
+            if original is None:
+                self._add(institute_id, fp, feedback_id)
+        return original, fp
+
+    def discard(self, institute_id, feedback_id):
+        """Removes an indexed submission whose write failed. Rare, so a scan of the window is fine."""
+        with self._lock:
+            recent = self._recent.get(institute_id, ())
+            for entry in recent:
+                if entry[0] == feedback_id:
+                    recent.remove(entry)
+                    self._unbucket(institute_id, entry[1], feedback_id)
+                    return
+
+    def warm(self, storage):
+        """Loads recent fingerprints from the database. Only runs once."""
+        if self._warmed:
+            return
+        with self._lock:
+            if self._warmed:
+                return
+            for feedback_id, institute_id, fp in storage.get_recent_fingerprints(self.window):
+                self._add(institute_id, fp, feedback_id)
+            self._warmed = True
+
+    @staticmethod
+    def to_hex(fp):
+        return f"{fp:016x}"
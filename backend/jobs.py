@@ -0,0 +1,220 @@
+"""
+Background execution of pipeline runs for /api/process.
+
+Jobs are stored in a small SQLite database (no external broker needed) and
+picked up by a bounded pool of worker threads. Several gunicorn workers can
+share the same queue file: a job is claimed with an IMMEDIATE transaction, so
+exactly one thread runs it. A job whose heartbeat stops (its process died) is
+re-queued after JOB_STALE_SECONDS, up to JOB_MAX_ATTEMPTS times. While a job
+runs, a background thread refreshes its heartbeat, so a long stage is never
+mistaken for a dead worker.
+
+Workers are started by start(), which the server calls once each process is
+ready (see gunicorn.conf.py), so jobs queued before a restart are picked up
+without waiting for a new submission.
+"""
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from contextlib import closing
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    institute_id TEXT,
+    options TEXT,
+    status TEXT NOT NULL,
+    stage TEXT,
+    stages TEXT,
+    result TEXT,
+    error TEXT,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    created_at REAL NOT NULL,
+    started_at REAL,
+    finished_at REAL,
+    heartbeat REAL
+);
+CREATE INDEX IF NOT EXISTS ix_jobs_status_created ON jobs (status, created_at);
+"""
+
+
+class JobProgress:
+    """
+    Progress callback handed to run_pipeline. Each call marks the start of a
+    stage (closing the previous one) and records its timing and details.
+    """
+
+    def __init__(self, queue, job_id):
+        self.queue = queue
+        self.job_id = job_id
+        self.stages = []
+
+    def __call__(self, stage, **info):
+        now = time.time()
+        current = self.stages[-1] if self.stages else None
+        if current and current['name'] == stage:
+            current.update(info)
+        else:
+            self.finish_stage(now)
+            self.stages.append(dict(info, name=stage, started_at=now))
+        self.queue._update(self.job_id, stage=stage, stages=json.dumps(self.stages), heartbeat=now)
+
+    def finish_stage(self, now=None):
+        now = now or time.time()
+        if self.stages and 'finished_at' not in self.stages[-1]:
+            last = self.stages[-1]
+            last['finished_at'] = now
+            last['seconds'] = round(now - last['started_at'], 3)
+
+
+class PipelineJobQueue:
+    def __init__(self, app, runner, path, workers=2, poll_interval=0.5,
+                 stale_seconds=600, max_attempts=3):
+        """
+        runner(institute_id, progress, job_id, **options) runs one pipeline inside
+        an app context. A re-queued job runs again under the same job_id.
+        """
+        self.app = app
+        self.runner = runner
+        self.path = path
+        self.workers = workers
+        self.poll_interval = poll_interval
+        self.stale_seconds = stale_seconds
+        self.max_attempts = max_attempts
+        self._threads = []
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with closing(self._connect()) as conn:
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.executescript(SCHEMA)
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    def _update(self, job_id, **fields):
+        cols = ', '.join(f'{k} = ?' for k in fields)
+        with closing(self._connect()) as conn:
+            conn.execute(f'UPDATE jobs SET {cols} WHERE id = ?', (*fields.values(), job_id))
+
+    # --- Public API ---
+    def submit(self, institute_id=None, options=None):
+        job_id = str(uuid.uuid4())
+        with closing(self._connect()) as conn:
+            conn.execute(
+                'INSERT INTO jobs (id, institute_id, options, status, created_at) VALUES (?, ?, ?, ?, ?)',
+                (job_id, institute_id, json.dumps(options or {}), 'queued', time.time())
+            )
+        self.start()
+        self._wakeup.set()
+        return job_id
+
+    def get(self, job_id):
+        with closing(self._connect()) as conn:
+            row = conn.execute('SELECT * FROM jobs WHERE id = ?', (job_id,)).fetchone()
+        if row is None:
+            return None
+        job = dict(row)
+        job['options'] = json.loads(job['options'] or '{}')
+        job['stages'] = json.loads(job['stages'] or '[]')
+        job['result'] = json.loads(job['result']) if job['result'] else None
+        if job['started_at']:
+            job['elapsed_seconds'] = round((job['finished_at'] or time.time()) - job['started_at'], 3)
+        return job
+
+    def start(self):
+        """Starts the worker threads (once per process)."""
+        with self._lock:
+            self._threads = [t for t in self._threads if t.is_alive()]
+            while len(self._threads) < self.workers:
+                t = threading.Thread(target=self._work_loop, name=f'pipeline-worker-{len(self._threads)}', daemon=True)
+                t.start()
+                self._threads.append(t)
+
+    # --- Workers ---
+    def _requeue_stale(self, conn):
+        cutoff = time.time() - self.stale_seconds
+        conn.execute(
+            "UPDATE jobs SET status = 'failed', error = 'Worker lost too many times', finished_at = ? "
+            "WHERE status = 'running' AND heartbeat < ? AND attempts >= ?",
+            (time.time(), cutoff, self.max_attempts)
+        )
+        conn.execute(
+            "UPDATE jobs SET status = 'queued' WHERE status = 'running' AND heartbeat < ?",
+            (cutoff,)
+        )
+
+    def _claim(self):
+        conn = self._connect()
+        try:
+            conn.execute('BEGIN IMMEDIATE')
+            self._requeue_stale(conn)
+            row = conn.execute(
+                "SELECT * FROM jobs WHERE status = 'queued' ORDER BY created_at LIMIT 1"
+            ).fetchone()
+            if row is None:
+                conn.execute('COMMIT')
+                return None
+            now = time.time()
+            conn.execute(
+                "UPDATE jobs SET status = 'running', started_at = COALESCE(started_at, ?), "
+                "heartbeat = ?, attempts = attempts + 1 WHERE id = ?",
+                (now, now, row['id'])
+            )
+            conn.execute('COMMIT')
+            return dict(row)
+        except Exception:
+            # BEGIN itself may have failed (database is locked); then there is nothing to roll back
+            if conn.in_transaction:
+                conn.execute('ROLLBACK')
+            raise
+        finally:
+            conn.close()
+
+    def _work_loop(self):
+        while True:
+            try:
+                job = self._claim()
+            except sqlite3.Error as e:
+                print(f"Job queue error: {e}")
+                job = None
+            if job is None:
+                self._wakeup.wait(self.poll_interval)
+                self._wakeup.clear()
+                continue
+            self._run(job)
+
+    def _heartbeat(self, job_id, stop):
+        interval = max(1.0, min(30.0, self.stale_seconds / 4))
+        while not stop.wait(interval):
+            try:
+                self._update(job_id, heartbeat=time.time())
+            except sqlite3.Error as e:
+                print(f"Job queue heartbeat error: {e}")
+
+    def _run(self, job):
+        progress = JobProgress(self, job['id'])
+        stop = threading.Event()
+        beat = threading.Thread(target=self._heartbeat, args=(job['id'], stop),
+                                name=f"job-heartbeat-{job['id'][:8]}", daemon=True)
+        beat.start()
+        try:
+            with self.app.app_context():
+                result = self.runner(job['institute_id'], progress, job['id'], **json.loads(job['options'] or '{}'))
+            progress.finish_stage()
+            self._update(job['id'], status='succeeded', stage='done', stages=json.dumps(progress.stages),
+                         result=json.dumps(result), finished_at=time.time())
+        except Exception as e:
+            print(f"Pipeline job {job['id']} failed: {e}")
+            progress.finish_stage()
+            self._update(job['id'], status='failed', stages=json.dumps(progress.stages),
+                         error=str(e), finished_at=time.time())
+        finally:
+            stop.set()
+            beat.join()
@@ -0,0 +1,163 @@
+"""
+Versioned schema migrations for databases created by earlier releases.
+
+db.create_all() only creates missing tables; it never changes existing ones.
+Each migration below upgrades an existing SQLite or Postgres database in
+place and is written so that it is a no-op on a freshly created schema.
+Applied versions are recorded in the schema_version table.
+
+Runs automatically on app startup, or manually:
+    python -m backend.migrations          # upgrade
+    python -m backend.migrations status   # show applied versions
+"""
+import sys
+from datetime import datetime
+
+from sqlalchemy import inspect, text
+
+MIGRATIONS = []
+
+# Arbitrary key for pg_advisory_xact_lock, so concurrent workers migrate one at a time
+PG_LOCK_KEY = 7305001
+
+
+def migration(version, description):
+    def register(fn):
+        MIGRATIONS.append((version, description, fn))
+        MIGRATIONS.sort(key=lambda m: m[0])
+        return fn
+    return register
+
+
+def _columns(conn, table):
+    return {c['name']: c for c in inspect(conn).get_columns(table)}
+
+
+def _add_column(conn, table, name, ddl):
+    if name not in _columns(conn, table):
+        conn.execute(text(f'ALTER TABLE {table} ADD COLUMN {name} {ddl}'))
+
+
+@migration(1, 'Add fingerprint and duplicate_count to feedback')
+def add_dedup_columns(conn, dialect):
+    _add_column(conn, 'feedback', 'fingerprint', 'VARCHAR(16)')
+    _add_column(conn, 'feedback', 'duplicate_count', 'INTEGER DEFAULT 0')
+
+
+@migration(2, 'Convert feedback and results timestamps to DateTime')
+def typed_timestamps(conn, dialect):
+    for table in ('feedback', 'results'):
+        if dialect == 'postgresql':
+            col_type = str(_columns(conn, table)['timestamp']['type']).upper()
+            if col_type.startswith('TIMESTAMP'):
+                continue
+            conn.execute(text(
+                f'ALTER TABLE {table} ALTER COLUMN "timestamp" TYPE TIMESTAMP WITHOUT TIME ZONE '
+                f'USING NULLIF("timestamp", \'\')::timestamp'
+            ))
+        else:
+            # SQLite has no column types to change. DateTime values are stored as
+            # 'YYYY-MM-DD HH:MM:SS[.ffffff]' text, so rewrite ISO 'T' separators to
+            # keep ORDER BY and range comparisons consistent.
+            conn.execute(text(f'UPDATE {table} SET "timestamp" = NULL WHERE "timestamp" = \'\''))
+            conn.execute(text(
+                f'UPDATE {table} SET "timestamp" = replace("timestamp", \'T\', \' \') '
+                f'WHERE "timestamp" LIKE \'____-__-__T%\''
+            ))
+
+
+@migration(3, 'Add composite indexes on feedback and results')
+def composite_indexes(conn, dialect):
+    conn.execute(text('CREATE INDEX IF NOT EXISTS ix_feedback_institute_processed ON feedback (institute_id, processed)'))
+    conn.execute(text('CREATE INDEX IF NOT EXISTS ix_feedback_institute_timestamp ON feedback (institute_id, "timestamp")'))
+    conn.execute(text('CREATE INDEX IF NOT EXISTS ix_feedback_processed ON feedback (processed)'))
+    conn.execute(text('CREATE INDEX IF NOT EXISTS ix_feedback_timestamp ON feedback ("timestamp")'))
+    conn.execute(text('CREATE INDEX IF NOT EXISTS ix_results_institute_timestamp ON results (institute_id, "timestamp")'))
+
+
+@migration(4, 'Backfill feedback_stats counters')
+def backfill_feedback_stats(conn, dialect):
+    # The table itself is created by db.create_all()
+    conn.execute(text('DELETE FROM feedback_stats'))
+    conn.execute(text(
+        'INSERT INTO feedback_stats (institute_id, day, role, category, total, processed) '
+        'SELECT institute_id, date("timestamp"), COALESCE(role, \'Unknown\'), COALESCE(category, \'Other\'), '
+        'COUNT(*), SUM(CASE WHEN processed THEN 1 ELSE 0 END) '
+        'FROM feedback WHERE "timestamp" IS NOT NULL '
+        'GROUP BY institute_id, date("timestamp"), COALESCE(role, \'Unknown\'), COALESCE(category, \'Other\')'
+    ))
+
+
+@migration(5, 'Add lease columns to feedback')
+def feedback_leases(conn, dialect):
+    timestamp = 'TIMESTAMP WITHOUT TIME ZONE' if dialect == 'postgresql' else 'DATETIME'
+    _add_column(conn, 'feedback', 'lease_owner', 'VARCHAR(64)')
+    _add_column(conn, 'feedback', 'lease_expires', timestamp)
+    conn.execute(text('CREATE INDEX IF NOT EXISTS ix_feedback_processed_lease ON feedback (processed, lease_expires)'))
+
+
+@migration(6, 'Add run_id to results')
+def result_run_ids(conn, dialect):
+    # pipeline_runs and pipeline_checkpoints are created by db.create_all()
+    _add_column(conn, 'results', 'run_id', 'VARCHAR(50)')
+    conn.execute(text('CREATE INDEX IF NOT EXISTS ix_results_run_institute ON results (run_id, institute_id)'))
+
+
+@migration(7, 'Add clustering state to pipeline checkpoints')
+def checkpoint_state(conn, dialect):
+    _add_column(conn, 'pipeline_checkpoints', 'state', 'TEXT')
+
+
+@migration(8, 'Add version to results')
+def result_versions(conn, dialect):
+    _add_column(conn, 'results', 'version', 'INTEGER DEFAULT 1')
+
+
+def _ensure_version_table(conn):
+    conn.execute(text(
+        'CREATE TABLE IF NOT EXISTS schema_version ('
+        'version INTEGER PRIMARY KEY, description VARCHAR(200), applied_at VARCHAR(50))'
+    ))
+
+
+def applied_versions(engine):
+    with engine.begin() as conn:
+        _ensure_version_table(conn)
+        return {row[0] for row in conn.execute(text('SELECT version FROM schema_version'))}
+
+
+def upgrade(engine):
+    """Applies pending migrations in order. Returns the versions applied."""
+    dialect = engine.dialect.name
+    applied = []
+    for version, description, fn in MIGRATIONS:
+        with engine.begin() as conn:
+            if dialect == 'postgresql':
+                conn.execute(text('SELECT pg_advisory_xact_lock(:key)'), {'key': PG_LOCK_KEY})
+            _ensure_version_table(conn)
+            done = conn.execute(
+                text('SELECT 1 FROM schema_version WHERE version = :v'), {'v': version}
+            ).first()
+            if done:
+                continue
+            print(f"Migration {version}: {description}...")
+            fn(conn, dialect)
+            conn.execute(
+                text('INSERT INTO schema_version (version, description, applied_at) VALUES (:v, :d, :t)'),
+                {'v': version, 'd': description, 't': datetime.now().isoformat()}
+            )
+            applied.append(version)
+    return applied
+
+
+if __name__ == '__main__':
+    from backend.app import app, db
+
+    with app.app_context():
+        if len(sys.argv) > 1 and sys.argv[1] == 'status':
+            done = applied_versions(db.engine)
+            for version, description, _ in MIGRATIONS:
+                print(f"{version:>3} [{'x' if version in done else ' '}] {description}")
+        else:
+            upgrade(db.engine)
+            print(f"Schema at version {max(applied_versions(db.engine), default=0)}.")
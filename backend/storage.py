@@ -1,7 +1,10 @@
+import base64
 import json
 import uuid
-from datetime import datetime
+from datetime import date, datetime, time, timedelta
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import and_, bindparam, case, func, insert, or_, select, update
+from sqlalchemy.dialects import postgresql, sqlite
 from sqlalchemy.orm import joinedload
 
 db = SQLAlchemy()
@@ -23,6 +26,14 @@ class Institute(db.Model):
 
 class Feedback(db.Model):
     __tablename__ = 'feedback'
+    # Keep in sync with backend/migrations.py
+    __table_args__ = (
+        db.Index('ix_feedback_institute_processed', 'institute_id', 'processed'),
+        db.Index('ix_feedback_institute_timestamp', 'institute_id', 'timestamp'),
+        db.Index('ix_feedback_processed', 'processed'),
+        db.Index('ix_feedback_timestamp', 'timestamp'),
+        db.Index('ix_feedback_processed_lease', 'processed', 'lease_expires'),
+    )
     id = db.Column(db.String(50), primary_key=True)
     institute_id = db.Column(db.String(50), db.ForeignKey('institutes.id'), nullable=False)
     text = db.Column(db.Text)
@@ -31,35 +42,163 @@ class Feedback(db.Model):
     user_id = db.Column(db.String(50))
     user_name = db.Column(db.String(100))
     is_verified = db.Column(db.Boolean, default=False)
-    timestamp = db.Column(db.String(50))
+    timestamp = db.Column(db.DateTime)
     processed = db.Column(db.Boolean, default=False)
     status = db.Column(db.String(20))
     session = db.Column(db.String(50))
+    fingerprint = db.Column(db.String(16)) # SimHash hex, see backend/dedup.py
+    duplicate_count = db.Column(db.Integer, default=0, server_default='0')
+    # Set while a pipeline worker holds the row (see claim_feedback)
+    lease_owner = db.Column(db.String(64))
+    lease_expires = db.Column(db.DateTime)
 
 class Result(db.Model):
     __tablename__ = 'results'
+    __table_args__ = (
+        db.Index('ix_results_institute_timestamp', 'institute_id', 'timestamp'),
+        db.Index('ix_results_run_institute', 'run_id', 'institute_id'),
+    )
     id = db.Column(db.String(50), primary_key=True)
     institute_id = db.Column(db.String(50), db.ForeignKey('institutes.id'), nullable=False)
     clusters = db.Column(db.Text) # JSON String
-    timestamp = db.Column(db.String(50))
+    timestamp = db.Column(db.DateTime)
+    run_id = db.Column(db.String(50)) # PipelineRun that produced it
+    version = db.Column(db.Integer, default=1) # Bumped on every save, so the ETag changes with the content
+
+class FeedbackStat(db.Model):
+    """
+    Precomputed feedback counters per institute, day, role and category.
+    Maintained in the same transaction as feedback inserts and mark_processed;
+    rebuild with rebuild_stats.py after out-of-band writes.
+    """
+    __tablename__ = 'feedback_stats'
+    institute_id = db.Column(db.String(50), primary_key=True)
+    day = db.Column(db.Date, primary_key=True)
+    role = db.Column(db.String(50), primary_key=True)
+    category = db.Column(db.String(50), primary_key=True)
+    total = db.Column(db.Integer, nullable=False, default=0)
+    processed = db.Column(db.Integer, nullable=False, default=0)
+
+class ClusterState(db.Model):
+    """
+    Incremental clustering state per institute ('*' for all institutes):
+    vocabulary and document frequencies, cluster centroids and counts, and
+    the last LLM analysis of each cluster. See ai_module/incremental.py.
+    """
+    __tablename__ = 'cluster_states'
+    institute_id = db.Column(db.String(50), primary_key=True)
+    state = db.Column(db.Text, nullable=False) # JSON String
+    updated_at = db.Column(db.DateTime)
+
+class PipelineRun(db.Model):
+    """
+    One pipeline run (the job id when queued). A run that dies is resumed
+    from its checkpoints when started again with the same id.
+    """
+    __tablename__ = 'pipeline_runs'
+    id = db.Column(db.String(50), primary_key=True)
+    institute_id = db.Column(db.String(50)) # None for an all-institute run
+    owner = db.Column(db.String(64))
+    status = db.Column(db.String(20), nullable=False) # running / completed / failed
+    attempts = db.Column(db.Integer, nullable=False, default=1)
+    summary = db.Column(db.Text) # JSON String
+    created_at = db.Column(db.DateTime)
+    updated_at = db.Column(db.DateTime)
+
+class PipelineCheckpoint(db.Model):
+    """
+    Progress of one window of a run for one institute: the feedback it
+    claimed, its cluster assignments and each cluster's LLM analysis as they
+    complete. stage is claimed / clustered / saved. A saved full-mode window
+    also keeps the run's clustering state for the institute, which later
+    windows are merged into.
+    """
+    __tablename__ = 'pipeline_checkpoints'
+    run_id = db.Column(db.String(50), db.ForeignKey('pipeline_runs.id'), primary_key=True)
+    window = db.Column(db.Integer, primary_key=True)
+    institute_id = db.Column(db.String(50), primary_key=True)
+    stage = db.Column(db.String(20), nullable=False)
+    feedback_ids = db.Column(db.Text, nullable=False) # JSON String
+    clusters = db.Column(db.Text) # JSON String
+    analyses = db.Column(db.Text) # JSON String, {cluster index: result entry}
+    state = db.Column(db.Text) # JSON String, IncrementalClusterer state
+    updated_at = db.Column(db.DateTime)
+
+class ImportCheckpoint(db.Model):
+    """
+    Position of an import_feedback.py run in its source file. Written in the
+    same transaction as each chunk, so a resumed import never repeats one.
+    """
+    __tablename__ = 'import_checkpoints'
+    source = db.Column(db.String(512), primary_key=True) # Absolute path of the source file
+    records = db.Column(db.Integer, nullable=False, default=0)
+    inserted = db.Column(db.Integer, nullable=False, default=0)
+    rejected = db.Column(db.Integer, nullable=False, default=0)
+    updated_at = db.Column(db.DateTime)
+
+def parse_timestamp(value):
+    """Accepts a datetime or an ISO 8601 string; raises ValueError otherwise."""
+    if value is None or value == '':
+        return datetime.now()
+    if isinstance(value, datetime):
+        return value
+    return datetime.fromisoformat(str(value).strip())
+
+def _as_date(value):
+    # func.date() returns a string on SQLite and a date on Postgres
+    return value if isinstance(value, date) else date.fromisoformat(str(value))
+
+def _is_day_aligned(value):
+    return value is None or value.time() == time(0)
+
+def to_iso(value):
+    return value.isoformat() if value else None
+
+def encode_cursor(timestamp, row_id):
+    raw = json.dumps([to_iso(timestamp), row_id]).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+def decode_cursor(token):
+    """Inverse of encode_cursor (timestamp None for a row without one); raises ValueError on a malformed token."""
+    try:
+        raw = base64.urlsafe_b64decode(token + '=' * (-len(token) % 4))
+        ts, row_id = json.loads(raw)
+        return datetime.fromisoformat(ts) if ts is not None else None, str(row_id)
+    except Exception:
+        raise ValueError('Invalid cursor')
 
 # --- Abstract Base ---
 class StorageBase:
     def add_feedback(self, data): raise NotImplementedError
-    def get_unprocessed_feedback(self, institute_id=None): raise NotImplementedError
-    def mark_processed(self, feedback_ids): raise NotImplementedError
-    def save_clusters(self, institute_id, clusters): raise NotImplementedError
-    def get_latest_results(self, institute_id=None): raise NotImplementedError
+    def add_feedback_batch(self, records, duplicate_counts=None): raise NotImplementedError
+    def mark_processed(self, feedback_ids, owner=None): raise NotImplementedError
+    def claim_feedback(self, owner, institute_id=None, limit=1000, lease_seconds=900, feedback_ids=None): raise NotImplementedError
+    def release_feedback(self, owner, feedback_ids=None): raise NotImplementedError
+    def lease_renewer(self, owner, lease_seconds=900): raise NotImplementedError
+    def save_clusters(self, institute_id, clusters, run_id=None): raise NotImplementedError
+    def get_latest_result_raw(self, institute_id=None): raise NotImplementedError
     def register_institute(self, data): raise NotImplementedError
     def verify_institute(self, institute_id): raise NotImplementedError
     def register_admin(self, institute_id, admin_id, password): raise NotImplementedError
     def verify_admin(self, admin_id, password): raise NotImplementedError
-    def get_feedback_stats(self, institute_id=None): raise NotImplementedError
+    def get_feedback_stats(self, institute_id=None, start=None, end=None): raise NotImplementedError
+    def get_cluster_state(self, institute_id=None): raise NotImplementedError
+    def update_cluster_state(self, institute_id, update_fn): raise NotImplementedError
+    def start_pipeline_run(self, run_id, institute_id=None, owner=None): raise NotImplementedError
+    def finish_pipeline_run(self, run_id, status, summary=None, keep_checkpoints=False): raise NotImplementedError
+    def get_checkpoints(self, run_id): raise NotImplementedError
+    def save_checkpoint(self, run_id, window, institute_id, **fields): raise NotImplementedError
 
 # --- Implementation ---
 class SQLAlchemyStorage(StorageBase):
-    def __init__(self, db_instance):
+    def __init__(self, db_instance, cache=None):
         self.db = db_instance
+        # Optional backend.cache.ResponseCache, invalidated after writes
+        self.cache = cache
+
+    def _invalidate(self, institute_ids):
+        if self.cache is not None:
+            self.cache.invalidate(institute_ids)
 
     def register_institute(self, data):
         code = data.get('code')
@@ -81,6 +220,7 @@ class SQLAlchemyStorage(StorageBase):
         )
         self.db.session.add(new_inst)
         self.db.session.commit()
+        self._invalidate([code])
         return code
 
     def verify_institute(self, institute_id):
@@ -103,123 +243,551 @@ class SQLAlchemyStorage(StorageBase):
             return {'valid': True, 'institute_name': inst.name, 'institute_id': inst.id}
         return {'valid': False}
 
+    def _feedback_row(self, data):
+        """Builds the column values for a new Feedback row from a submission dict."""
+        return {
+            'id': data.get('id') or str(uuid.uuid4()),
+            'institute_id': data.get('institute_id', 'Default'),
+            'text': data.get('text'),
+            'category': data.get('category'),
+            'role': data.get('role', 'Anonymous'),
+            'user_id': data.get('user_id', 'N/A'),
+            'user_name': data.get('user_name', 'Anonymous'),
+            'is_verified': data.get('is_verified', False),
+            'timestamp': parse_timestamp(data.get('timestamp')),
+            'processed': False,
+            'status': 'pending',
+            'session': data.get('session', 'Default Session'),
+            'fingerprint': data.get('fingerprint'),
+            'duplicate_count': 0
+        }
+
     def add_feedback(self, data):
-        inst_id = data.get('institute_id', 'Default')
-        # Ensure institute exists if strict, but let's be loose or ensure Default exists?
-        # For SQL, foreign key fails if not exists.
+        # For SQL, foreign key fails if the institute does not exist.
         # We assume Institute is registered properly.
-        
-        new_id = str(uuid.uuid4())
-        fb = Feedback(
-            id=new_id,
-            institute_id=inst_id,
-            text=data.get('text'),
-            category=data.get('category'),
-            role=data.get('role', 'Anonymous'),
-            user_id=data.get('user_id', 'N/A'),
-            user_name=data.get('user_name', 'Anonymous'),
-            is_verified=data.get('is_verified', False),
-            timestamp=data.get('timestamp') or datetime.now().isoformat(),
-            processed=False,
-            status='pending',
-            session=data.get('session', 'Default Session')
+        row = self._feedback_row(data)
+        self.db.session.add(Feedback(**row))
+        self._bump_counters(self.counter_deltas([row]))
+        self.db.session.commit()
+        self._invalidate([row['institute_id']])
+        return {'id': row['id'], 'institute_id': row['institute_id'], 'status': 'pending'}
+
+    def add_feedback_batch(self, records, duplicate_counts=None):
+        """
+        Inserts many feedback records in a single transaction.
+        Invalid records are skipped rather than failing the whole batch.
+        duplicate_counts ({feedback_id: n}) are added to existing rows in the
+        same transaction (near-duplicates collapsed at ingestion).
+        Returns {'accepted': [{'index', 'id'}], 'rejected': [{'index', 'reason'}], 'error'}.
+        """
+        accepted, rejected, rows = [], [], []
+
+        inst_ids = {r.get('institute_id', 'Default') for r in records if isinstance(r, dict)}
+        known = set()
+        if inst_ids:
+            known = {i for (i,) in self.db.session.query(Institute.id).filter(Institute.id.in_(inst_ids))}
+
+        for idx, data in enumerate(records):
+            if not isinstance(data, dict):
+                rejected.append({'index': idx, 'reason': 'Record must be an object'})
+                continue
+            text = data.get('text')
+            if not isinstance(text, str) or not text.strip():
+                rejected.append({'index': idx, 'reason': 'Missing text'})
+                continue
+            try:
+                row = self._feedback_row(data)
+            except ValueError:
+                rejected.append({'index': idx, 'reason': 'Invalid timestamp'})
+                continue
+            if row['institute_id'] not in known:
+                rejected.append({'index': idx, 'reason': f"Unknown institute: {row['institute_id']}"})
+                continue
+            rows.append(row)
+            accepted.append({'index': idx, 'id': row['id']})
+
+        error = None
+        if rows or duplicate_counts:
+            try:
+                # A list of parameter dicts makes SQLAlchemy use executemany
+                if rows:
+                    self.db.session.execute(insert(Feedback), rows)
+                    self._bump_counters(self.counter_deltas(rows))
+                if duplicate_counts:
+                    self._increment_duplicates(duplicate_counts)
+                self.db.session.commit()
+                touched = {r['institute_id'] for r in rows}
+                if duplicate_counts:
+                    touched |= self._institutes_of(list(duplicate_counts))
+                self._invalidate(touched)
+            except Exception as e:
+                self.db.session.rollback()
+                error = str(e)
+                rejected.extend({'index': a['index'], 'reason': f'Database error: {e}'} for a in accepted)
+                rejected.sort(key=lambda r: r['index'])
+                accepted = []
+
+        return {'accepted': accepted, 'rejected': rejected, 'error': error}
+
+    def _increment_duplicates(self, duplicate_counts):
+        table = Feedback.__table__
+        stmt = table.update().where(table.c.id == bindparam('b_id')).values(
+            duplicate_count=table.c.duplicate_count + bindparam('b_n')
         )
-        self.db.session.add(fb)
+        self.db.session.execute(stmt, [{'b_id': fid, 'b_n': n} for fid, n in duplicate_counts.items()])
+
+    def increment_duplicates(self, duplicate_counts):
+        self._increment_duplicates(duplicate_counts)
         self.db.session.commit()
-        return {'id': new_id, 'institute_id': inst_id, 'status': 'pending'}
+        self._invalidate(self._institutes_of(list(duplicate_counts)))
 
-    def get_unprocessed_feedback(self, institute_id=None):
-        query = Feedback.query.filter_by(processed=False)
-        if institute_id:
-            query = query.filter_by(institute_id=institute_id)
-        results = query.all()
-        
-        # Convert to dicts
-        return [{
+    def _institutes_of(self, feedback_ids):
+        return {i for (i,) in self.db.session.query(Feedback.institute_id)
+                .filter(Feedback.id.in_(feedback_ids)).distinct()}
+
+    def get_recent_fingerprints(self, limit):
+        """Returns (id, institute_id, fingerprint) for the newest rows, oldest first."""
+        rows = (self.db.session.query(Feedback.id, Feedback.institute_id, Feedback.fingerprint)
+                .filter(Feedback.fingerprint.isnot(None))
+                .order_by(Feedback.timestamp.desc())
+                .limit(limit).all())
+        return [(fid, inst, int(fp, 16)) for fid, inst, fp in reversed(rows)]
+
+    @staticmethod
+    def _pipeline_dict(r):
+        return {
             'id': r.id, 'text': r.text, 'category': r.category, 
-            'role': r.role, 'timestamp': r.timestamp, 'institute_id': r.institute_id
-        } for r in results]
+            'role': r.role, 'timestamp': to_iso(r.timestamp), 'institute_id': r.institute_id
+        }
 
-    def get_all_feedback(self, institute_id=None):
+    def list_feedback(self, institute_id=None, limit=50, cursor=None, category=None,
+                      role=None, processed=None, start=None, end=None):
+        """
+        Returns one page of feedback, newest first, as {'items': [...], 'next_cursor': token}.
+        Pages are keyset-paginated on (timestamp, id); pass next_cursor back to
+        get the following page. next_cursor is None on the last page. Legacy
+        rows without a timestamp come last, by id.
+        """
         query = Feedback.query
         if institute_id:
-            query = query.filter_by(institute_id=institute_id)
-        
-        # Sort by timestamp desc (if possible, but string timestamp needs care, assuming ISO format sorts okay or just reverse list)
-        feedbacks = query.all()
-        
-        return [{
-            'id': r.id, 'text': r.text, 'category': r.category, 
-            'role': r.role, 'timestamp': r.timestamp, 'institute_id': r.institute_id
-        } for r in feedbacks[::-1]] # Reverse to show newest first
+            query = query.filter(Feedback.institute_id == institute_id)
+        if category:
+            query = query.filter(Feedback.category == category)
+        if role:
+            query = query.filter(Feedback.role == role)
+        if processed is not None:
+            query = query.filter(Feedback.processed == processed)
+        if start:
+            query = query.filter(Feedback.timestamp >= start)
+        if end:
+            query = query.filter(Feedback.timestamp < end)
+        if cursor:
+            ts, row_id = decode_cursor(cursor)
+            if ts is None:
+                # Already in the rows without a timestamp
+                query = query.filter(Feedback.timestamp.is_(None), Feedback.id < row_id)
+            else:
+                query = query.filter(or_(
+                    Feedback.timestamp < ts,
+                    and_(Feedback.timestamp == ts, Feedback.id < row_id),
+                    Feedback.timestamp.is_(None)
+                ))
+
+        # Fetch one extra row to know whether another page exists
+        rows = query.order_by(Feedback.timestamp.desc().nullslast(), Feedback.id.desc()).limit(limit + 1).all()
+        page = rows[:limit]
+        next_cursor = encode_cursor(page[-1].timestamp, page[-1].id) if len(rows) > limit else None
+
+        return {
+            'items': [{
+                'id': r.id, 'text': r.text, 'category': r.category,
+                'role': r.role, 'timestamp': to_iso(r.timestamp), 'institute_id': r.institute_id,
+                'processed': bool(r.processed), 'duplicate_count': r.duplicate_count or 0
+            } for r in page],
+            'next_cursor': next_cursor
+        }
+
+    # --- Leases ---
+    def claim_feedback(self, owner, institute_id=None, limit=1000, lease_seconds=900, feedback_ids=None):
+        """
+        Leases up to `limit` unprocessed rows to `owner` for lease_seconds and
+        returns them as pipeline dicts. Rows leased to another owner are
+        skipped until their lease expires, so concurrent workers get disjoint
+        batches and a crashed worker's rows are picked up again later.
+
+        One UPDATE ... RETURNING does the claim. On Postgres its subquery
+        locks candidate rows FOR UPDATE SKIP LOCKED, so workers claiming at the
+        same time skip each other's rows instead of waiting on them. SQLite
+        runs the whole statement under its single write lock, which makes the
+        check-and-set atomic.
 
-    def mark_processed(self, feedback_ids):
+        With feedback_ids, re-leases those rows instead (a resumed run taking
+        back its window); rows the owner still holds count as claimable.
+        """
+        now = datetime.now()
+        free = [Feedback.lease_expires.is_(None), Feedback.lease_expires < now]
+        if feedback_ids is not None:
+            free.append(Feedback.lease_owner == owner)
+        claimable = [Feedback.processed == False, or_(*free)]
+        if institute_id:
+            claimable.append(Feedback.institute_id == institute_id)
+        if feedback_ids is not None:
+            if not feedback_ids:
+                return []
+            candidates = select(Feedback.id).where(Feedback.id.in_(feedback_ids), *claimable)
+        else:
+            candidates = select(Feedback.id).where(*claimable).order_by(Feedback.id).limit(limit)
+        candidates = candidates.with_for_update(skip_locked=True)
+        rows = self.db.session.execute(
+            update(Feedback)
+            .where(Feedback.id.in_(candidates), *claimable)
+            .values(lease_owner=owner, lease_expires=now + timedelta(seconds=lease_seconds), status='processing')
+            .returning(Feedback.id, Feedback.text, Feedback.category, Feedback.role,
+                       Feedback.timestamp, Feedback.institute_id)
+            .execution_options(synchronize_session=False)
+        ).all()
+        self.db.session.commit()
+        # RETURNING gives no order guarantee
+        return sorted((self._pipeline_dict(r) for r in rows), key=lambda r: r['id'])
+
+    def release_feedback(self, owner, feedback_ids=None):
+        """Gives back owner's unprocessed leases (all of them, or just feedback_ids) for immediate reclaim."""
+        query = Feedback.query.filter(Feedback.lease_owner == owner, Feedback.processed == False)
+        if feedback_ids is not None:
+            query = query.filter(Feedback.id.in_(feedback_ids))
+        released = query.update(
+            {Feedback.lease_owner: None, Feedback.lease_expires: None, Feedback.status: 'pending'},
+            synchronize_session=False
+        )
+        self.db.session.commit()
+        return released
+
+    def lease_renewer(self, owner, lease_seconds=900):
+        """
+        A function that extends owner's unprocessed leases to lease_seconds from
+        now and returns how many it extended. It runs on its own connection from
+        the engine bound here, so a heartbeat thread can call it without an app
+        context or the caller's session.
+        """
+        engine = self.db.engine
+
+        def renew():
+            with engine.begin() as conn:
+                return conn.execute(
+                    update(Feedback)
+                    .where(Feedback.lease_owner == owner, Feedback.processed == False)
+                    .values(lease_expires=datetime.now() + timedelta(seconds=lease_seconds))
+                ).rowcount
+        return renew
+
+    def mark_processed(self, feedback_ids, owner=None):
+        """
+        Marks rows processed and clears their leases. With an owner, only rows
+        still leased to it change, so a worker whose lease expired and was
+        reclaimed does not finish someone else's rows.
+        """
         if not feedback_ids: return
-        Feedback.query.filter(Feedback.id.in_(feedback_ids)).update(
-            {Feedback.processed: True, Feedback.status: 'processed'},
+        filters = [Feedback.id.in_(feedback_ids), Feedback.processed == False]
+        if owner is not None:
+            filters.append(Feedback.lease_owner == owner)
+        pending = Feedback.query.filter(*filters)
+        # Counter keys of the rows that actually change state
+        transitioned = (self.db.session.query(
+                Feedback.institute_id, func.date(Feedback.timestamp),
+                func.coalesce(Feedback.role, 'Unknown'), func.coalesce(Feedback.category, 'Other'),
+                func.count(Feedback.id))
+            .filter(*filters, Feedback.timestamp.isnot(None))
+            .group_by(Feedback.institute_id, func.date(Feedback.timestamp),
+                      func.coalesce(Feedback.role, 'Unknown'), func.coalesce(Feedback.category, 'Other'))
+            .all())
+        pending.update(
+            {Feedback.processed: True, Feedback.status: 'processed',
+             Feedback.lease_owner: None, Feedback.lease_expires: None},
             synchronize_session=False
         )
+        self._bump_counters({
+            (inst, _as_date(day), role, cat): (0, n) for inst, day, role, cat, n in transitioned
+        })
         self.db.session.commit()
+        self._invalidate({inst for inst, *_ in transitioned})
 
-    def get_feedback_stats(self, institute_id=None):
-        query = Feedback.query
+    # --- Stats counters ---
+    @staticmethod
+    def counter_deltas(rows):
+        """Aggregates new feedback rows into {(institute, day, role, category): (total, processed)}."""
+        deltas = {}
+        for r in rows:
+            key = (r['institute_id'], r['timestamp'].date(), r.get('role') or 'Unknown', r.get('category') or 'Other')
+            total, processed = deltas.get(key, (0, 0))
+            deltas[key] = (total + 1, processed + (1 if r.get('processed') else 0))
+        return deltas
+
+    def _bump_counters(self, deltas):
+        """Adds deltas to feedback_stats inside the caller's transaction (upsert)."""
+        if not deltas:
+            return
+        values = [{'institute_id': k[0], 'day': k[1], 'role': k[2], 'category': k[3],
+                   'total': t, 'processed': p} for k, (t, p) in deltas.items()]
+        dialect = self.db.engine.dialect.name
+        if dialect in ('sqlite', 'postgresql'):
+            dialect_insert = sqlite.insert if dialect == 'sqlite' else postgresql.insert
+            table = FeedbackStat.__table__
+            stmt = dialect_insert(table)
+            stmt = stmt.on_conflict_do_update(
+                index_elements=['institute_id', 'day', 'role', 'category'],
+                set_={'total': table.c.total + stmt.excluded.total,
+                      'processed': table.c.processed + stmt.excluded.processed}
+            )
+            self.db.session.execute(stmt, values)
+        else:
+            for v in values:
+                stat = self.db.session.get(FeedbackStat, (v['institute_id'], v['day'], v['role'], v['category']))
+                if stat:
+                    stat.total += v['total']
+                    stat.processed += v['processed']
+                else:
+                    self.db.session.add(FeedbackStat(**v))
+
+    def _counters_from_feedback(self, institute_ids=None):
+        """SELECT that recomputes feedback_stats rows from the raw feedback table."""
+        day = func.date(Feedback.timestamp)
+        role = func.coalesce(Feedback.role, 'Unknown')
+        category = func.coalesce(Feedback.category, 'Other')
+        query = (select(Feedback.institute_id, day, role, category, func.count(Feedback.id),
+                        func.sum(case((Feedback.processed == True, 1), else_=0)))
+                 .where(Feedback.timestamp.isnot(None))
+                 .group_by(Feedback.institute_id, day, role, category))
+        if institute_ids:
+            query = query.where(Feedback.institute_id.in_(institute_ids))
+        return query
+
+    def reconcile_stat_counters(self, institute_ids=None, repair=True):
+        """
+        Compares feedback_stats with counts recomputed from feedback rows.
+        Returns the number of mismatched keys; with repair=True the counters of
+        the given institutes (default: all) are rebuilt in one transaction.
+        """
+        expected = {(inst, _as_date(day), role, cat): (n, int(p or 0))
+                    for inst, day, role, cat, n, p in self.db.session.execute(self._counters_from_feedback(institute_ids))}
+        query = FeedbackStat.query
+        if institute_ids:
+            query = query.filter(FeedbackStat.institute_id.in_(institute_ids))
+        actual = {(s.institute_id, s.day, s.role, s.category): (s.total, s.processed) for s in query}
+        mismatches = sum(1 for k in expected.keys() | actual.keys() if expected.get(k, (0, 0)) != actual.get(k, (0, 0)))
+
+        if repair and mismatches:
+            query.delete(synchronize_session=False)
+            if expected:
+                self.db.session.execute(insert(FeedbackStat), [
+                    {'institute_id': k[0], 'day': k[1], 'role': k[2], 'category': k[3], 'total': t, 'processed': p}
+                    for k, (t, p) in expected.items()
+                ])
+            self.db.session.commit()
+            self._invalidate(institute_ids or {k[0] for k in expected})
+        return mismatches
+
+    def rebuild_stat_counters(self, institute_ids=None):
+        return self.reconcile_stat_counters(institute_ids, repair=True)
+
+    def get_feedback_stats(self, institute_id=None, start=None, end=None):
+        """Role/category counts and the 5 newest items, optionally within [start, end)."""
+        filters = []
         if institute_id:
-            query = query.filter_by(institute_id=institute_id)
-        
-        feedbacks = query.all()
-        count = len(feedbacks)
-        roles = {}
-        categories = {}
-        
-        for f in feedbacks:
-            r = f.role or 'Unknown'
-            c = f.category or 'Other'
-            roles[r] = roles.get(r, 0) + 1
-            categories[c] = categories.get(c, 0) + 1
-            
+            filters.append(Feedback.institute_id == institute_id)
+        if start:
+            filters.append(Feedback.timestamp >= start)
+        if end:
+            filters.append(Feedback.timestamp < end)
+
+        if _is_day_aligned(start) and _is_day_aligned(end):
+            totals = self._stats_from_counters(institute_id, start, end)
+        else:
+            totals = self._stats_from_feedback(filters)
+
         # Get recent 5
+        latest = Feedback.query.filter(*filters).order_by(Feedback.timestamp.desc()).limit(5).all()
         recent = [{
-            'text': f.text[:50] + '...',
+            'text': (f.text or '')[:50] + '...',
             'role': f.role,
             'category': f.category,
-            'timestamp': f.timestamp
-        } for f in feedbacks[-5:][::-1]]
-
-        return {'total': count, 'roles': roles, 'categories': categories, 'recent': recent}
-
-    def save_clusters(self, institute_id, clusters):
-        new_id = str(uuid.uuid4())
-        res = Result(
-            id=new_id,
-            institute_id=institute_id,
-            clusters=json.dumps(clusters),
-            timestamp=datetime.now().isoformat()
-        )
-        self.db.session.add(res)
+            'timestamp': to_iso(f.timestamp)
+        } for f in latest]
+
+        return dict(totals, recent=recent)
+
+    def _stats_from_counters(self, institute_id=None, start=None, end=None):
+        filters = []
+        if institute_id:
+            filters.append(FeedbackStat.institute_id == institute_id)
+        if start:
+            filters.append(FeedbackStat.day >= start.date())
+        if end:
+            filters.append(FeedbackStat.day < end.date())
+
+        session = self.db.session
+        count, processed = session.query(
+            func.coalesce(func.sum(FeedbackStat.total), 0), func.coalesce(func.sum(FeedbackStat.processed), 0)
+        ).filter(*filters).one()
+        roles = dict(session.query(FeedbackStat.role, func.sum(FeedbackStat.total))
+                     .filter(*filters).group_by(FeedbackStat.role).all())
+        categories = dict(session.query(FeedbackStat.category, func.sum(FeedbackStat.total))
+                          .filter(*filters).group_by(FeedbackStat.category).all())
+        return {'total': int(count), 'processed': int(processed),
+                'roles': {k: int(v) for k, v in roles.items()},
+                'categories': {k: int(v) for k, v in categories.items()}}
+
+    def _stats_from_feedback(self, filters):
+        # Windows that do not start/end on a day boundary cannot use the daily counters
+        session = self.db.session
+        count, processed = session.query(
+            func.count(Feedback.id), func.coalesce(func.sum(case((Feedback.processed == True, 1), else_=0)), 0)
+        ).filter(*filters).one()
+
+        role = func.coalesce(Feedback.role, 'Unknown')
+        roles = dict(session.query(role, func.count(Feedback.id)).filter(*filters).group_by(role).all())
+
+        category = func.coalesce(Feedback.category, 'Other')
+        categories = dict(session.query(category, func.count(Feedback.id)).filter(*filters).group_by(category).all())
+
+        return {'total': count, 'processed': int(processed), 'roles': roles, 'categories': categories}
+
+    def save_clusters(self, institute_id, clusters, run_id=None):
+        """
+        Saves a new Result. With a run_id, the run keeps one Result per
+        institute, updated in place (with a new version) as it saves more windows.
+        """
+        res = None
+        if run_id is not None:
+            res = Result.query.filter_by(run_id=run_id, institute_id=institute_id).first()
+        if res is None:
+            res = Result(id=str(uuid.uuid4()), institute_id=institute_id, run_id=run_id, version=0)
+            self.db.session.add(res)
+        res.version = (res.version or 0) + 1
+        res.clusters = json.dumps(clusters)
+        res.timestamp = datetime.now()
         self.db.session.commit()
+        self._invalidate([institute_id])
 
-    def get_latest_results(self, institute_id=None):
-        query = Result.query
+    def get_latest_result_raw(self, institute_id=None):
+        """
+        Latest result as {'id', 'version', 'clusters'} with clusters still the
+        stored JSON text, so it can be served without a parse/serialize round trip.
+        """
+        query = self.db.session.query(Result.id, Result.version, Result.clusters)
         if institute_id:
-            query = query.filter_by(institute_id=institute_id)
-        
-        res = query.order_by(Result.timestamp.desc()).first()
-        if res:
-            return {'clusters': json.loads(res.clusters)}
-        return {'clusters': []}
+            query = query.filter(Result.institute_id == institute_id)
+        row = query.order_by(Result.timestamp.desc()).first()
+        if row:
+            return {'id': row.id, 'version': row.version or 1, 'clusters': row.clusters or '[]'}
+        return {'id': None, 'version': None, 'clusters': '[]'}
+
+
+    def get_cluster_state(self, institute_id=None):
+        """Saved incremental clustering state as a dict, or None before the first run."""
+        row = self.db.session.get(ClusterState, institute_id or '*')
+        return json.loads(row.state) if row else None
 
+    def update_cluster_state(self, institute_id, update_fn):
+        """
+        Read-modify-write of the saved state under a row lock: update_fn(state
+        saved now, or None) returns the state to store, which is also returned.
+        Workers updating the same institute at once fold their changes in one
+        after another instead of overwriting each other's.
+
+        The row is created first if missing (INSERT ... ON CONFLICT DO NOTHING),
+        then read FOR UPDATE on Postgres. On SQLite that insert already holds
+        the database write lock, which FOR UPDATE does not exist to take.
+        """
+        key = institute_id or '*'
+        dialect = self.db.engine.dialect.name
+        if dialect in ('sqlite', 'postgresql'):
+            dialect_insert = sqlite.insert if dialect == 'sqlite' else postgresql.insert
+            self.db.session.execute(
+                dialect_insert(ClusterState.__table__)
+                .values(institute_id=key, state='null', updated_at=datetime.now())
+                .on_conflict_do_nothing(index_elements=['institute_id'])
+            )
+        row = (ClusterState.query.filter_by(institute_id=key)
+               .with_for_update().populate_existing().first())
+        if row is None:
+            row = ClusterState(institute_id=key, state='null')
+            self.db.session.add(row)
+        state = update_fn(json.loads(row.state))
+        row.state = json.dumps(state)
+        row.updated_at = datetime.now()
+        self.db.session.commit()
+        return state
+
+    # --- Pipeline runs and checkpoints ---
+    def start_pipeline_run(self, run_id, institute_id=None, owner=None):
+        """
+        Creates the run, or re-opens an unfinished one for another attempt.
+        Returns (run dict, resumed). A completed run is left as it is; its dict
+        has status 'completed' and the summary it recorded.
+        """
+        now = datetime.now()
+        run = self.db.session.get(PipelineRun, run_id)
+        resumed = run is not None
+        if run is not None and run.status == 'completed':
+            return {'id': run.id, 'institute_id': run.institute_id, 'attempts': run.attempts, 'status': run.status,
+                    'summary': json.loads(run.summary) if run.summary else None}, resumed
+        if run is None:
+            run = PipelineRun(id=run_id, institute_id=institute_id, attempts=0, created_at=now)
+            self.db.session.add(run)
+        run.owner = owner
+        run.status = 'running'
+        run.attempts += 1
+        run.updated_at = now
+        self.db.session.commit()
+        return {'id': run.id, 'institute_id': run.institute_id, 'attempts': run.attempts, 'status': run.status}, resumed
+
+    def finish_pipeline_run(self, run_id, status, summary=None, keep_checkpoints=False):
+        """Records the outcome and, unless kept for a resume, drops the run's checkpoints."""
+        run = self.db.session.get(PipelineRun, run_id)
+        if run is None:
+            return
+        run.status = status
+        run.summary = json.dumps(summary) if summary is not None else None
+        run.updated_at = datetime.now()
+        if not keep_checkpoints:
+            PipelineCheckpoint.query.filter_by(run_id=run_id).delete(synchronize_session=False)
+        self.db.session.commit()
+
+    def get_checkpoints(self, run_id):
+        rows = PipelineCheckpoint.query.filter_by(run_id=run_id).order_by(
+            PipelineCheckpoint.window, PipelineCheckpoint.institute_id).all()
+        return [{
+            'window': r.window, 'institute_id': r.institute_id, 'stage': r.stage,
+            'feedback_ids': json.loads(r.feedback_ids),
+            'clusters': json.loads(r.clusters) if r.clusters else None,
+            # JSON object keys are strings; cluster indexes are ints
+            'analyses': {int(k): v for k, v in json.loads(r.analyses).items()} if r.analyses else {},
+            'state': json.loads(r.state) if r.state else None
+        } for r in rows]
+
+    def save_checkpoint(self, run_id, window, institute_id, **fields):
+        """Creates or updates a checkpoint; fields are stage, feedback_ids, clusters, analyses and state."""
+        row = self.db.session.get(PipelineCheckpoint, (run_id, window, institute_id))
+        if row is None:
+            row = PipelineCheckpoint(run_id=run_id, window=window, institute_id=institute_id)
+            self.db.session.add(row)
+        for name, value in fields.items():
+            setattr(row, name, value if name == 'stage' else json.dumps(value))
+        row.updated_at = datetime.now()
+        self.db.session.commit()
 
     def get_global_stats(self):
-        # Real-time counts
-        data_points = Feedback.query.count()
+        # Read from the precomputed counters instead of scanning feedback
+        data_points = self.db.session.query(func.coalesce(func.sum(FeedbackStat.total), 0)).scalar()
         institutes_count = Institute.query.count()
         # Estimate students based on feedback or just return total feedback from students
-        active_students = Feedback.query.filter_by(role='Student').count()
+        active_students = self.db.session.query(func.coalesce(func.sum(FeedbackStat.total), 0)).filter(
+            FeedbackStat.role == 'Student').scalar()
 
         return {
-            'data_points': data_points, 
+            'data_points': int(data_points), 
             'institutes': institutes_count, 
-            'students': active_students
+            'students': int(active_students)
         }
 
     def seed_db(self):
@@ -259,7 +827,7 @@ class SQLAlchemyStorage(StorageBase):
                         user_id='Anonymous',
                         user_name='Anonymous',
                         is_verified=False,
-                        timestamp=datetime.now().isoformat(),
+                        timestamp=datetime.now(),
                         processed=False,
                         status='pending',
                         session='2024-SEM1'
@@ -267,6 +835,7 @@ class SQLAlchemyStorage(StorageBase):
                     self.db.session.add(fb)
             
             self.db.session.commit()
+            self.rebuild_stat_counters(['Default'])
             print("Database Seeding Completed.")
         except Exception as e:
             print(f"Seeding Error: {e}")
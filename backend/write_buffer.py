@@ -0,0 +1,190 @@
+import atexit
+import queue
+import threading
+import time
+import uuid
+
+
+class FeedbackWriteBuffer:
+    """
+    Write-behind queue in front of SQLAlchemyStorage.add_feedback.
+
+    Submissions are queued in memory and written by a background thread in
+    group commits (one add_feedback_batch call per flush). A flush happens when
+    `max_batch` records are waiting or `max_delay_ms` has passed since the first
+    queued record, whichever comes first.
+
+    Modes:
+      'direct'   - no buffering, every submission is committed on its own
+      'buffered' - submit() returns the generated id immediately
+      'sync'     - submissions are grouped, but submit() waits for the commit
+
+    submit() validates the text and institute before queueing and raises
+    ValueError if either is bad, so callers can answer 4xx instead of
+    accepting a record the flush would drop.
+    """
+
+    MODES = ('direct', 'buffered', 'sync')
+
+    def __init__(self, app, storage, mode='buffered', max_batch=500, max_delay_ms=5, max_retries=3, on_reject=None):
+        if mode not in self.MODES:
+            raise ValueError(f"Unknown write mode: {mode}")
+        self.app = app
+        self.storage = storage
+        self.mode = mode
+        self.max_batch = max_batch
+        self.max_delay = max_delay_ms / 1000.0
+        self.max_retries = max_retries
+        # on_reject(data, reason) is called for each queued record the flush drops
+        self.on_reject = on_reject
+        self._queue = queue.Queue()
+        self._thread = None
+        # Held across the closed check and the enqueue, so nothing is queued behind the shutdown sentinel
+        self._lock = threading.Lock()
+        self._closed = False
+        self._known_institutes = set()
+        atexit.register(self.close)
+
+    def _put(self, entry):
+        """Queues an entry and returns True, or returns False once the buffer is closed."""
+        with self._lock:
+            if self._closed:
+                return False
+            # Started lazily so that importing the app (scripts, gunicorn preload)
+            # does not spawn a thread before the worker process forks.
+            if not (self._thread and self._thread.is_alive()):
+                self._thread = threading.Thread(target=self._run, name='feedback-writer', daemon=True)
+                self._thread.start()
+            self._queue.put(entry)
+            return True
+
+    def validate(self, data):
+        """Raises ValueError for a submission add_feedback_batch would reject."""
+        text = data.get('text')
+        if not isinstance(text, str) or not text.strip():
+            raise ValueError('Missing text')
+        institute_id = data.get('institute_id', 'Default')
+        # Institutes are never deleted, so a known id stays valid
+        if institute_id in self._known_institutes:
+            return
+        with self.app.app_context():
+            if not self.storage.verify_institute(institute_id)['valid']:
+                raise ValueError(f"Unknown institute: {institute_id}")
+        self._known_institutes.add(institute_id)
+
+    def submit(self, data):
+        """Queues a feedback submission and returns {'id', 'institute_id', 'status'}."""
+        self.validate(data)
+        data = dict(data)
+        data['id'] = data.get('id') or str(uuid.uuid4())
+        entry = {'data': data, 'done': threading.Event() if self.mode == 'sync' else None, 'error': None}
+
+        if self.mode == 'direct' or not self._put(entry):
+            with self.app.app_context():
+                return self.storage.add_feedback(data)
+
+        if entry['done']:
+            entry['done'].wait()
+            if entry['error']:
+                raise RuntimeError(entry['error'])
+        return {'id': data['id'], 'institute_id': data.get('institute_id', 'Default'), 'status': 'pending'}
+
+    def submit_duplicate(self, feedback_id):
+        """Queues a +1 on the duplicate_count of an existing (possibly still queued) row."""
+        entry = {'duplicate_of': feedback_id, 'done': threading.Event() if self.mode == 'sync' else None, 'error': None}
+        if self.mode == 'direct' or not self._put(entry):
+            with self.app.app_context():
+                self.storage.increment_duplicates({feedback_id: 1})
+            return
+        if entry['done']:
+            entry['done'].wait()
+
+    def _run(self):
+        while True:
+            entry = self._queue.get()
+            if entry is None:
+                # Shutdown sentinel: drain whatever is left and stop
+                self._flush(self._drain())
+                return
+
+            batch = [entry]
+            deadline = time.monotonic() + self.max_delay
+            stop = False
+            while len(batch) < self.max_batch:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    nxt = self._queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                if nxt is None:
+                    stop = True
+                    break
+                batch.append(nxt)
+
+            self._flush(batch)
+            if stop:
+                self._flush(self._drain())
+                return
+
+    def _drain(self):
+        batch = []
+        while True:
+            try:
+                entry = self._queue.get_nowait()
+            except queue.Empty:
+                return batch
+            if entry is not None:
+                batch.append(entry)
+
+    def _flush(self, batch):
+        pending = list(batch)
+        attempt = 0
+        while pending:
+            records = [e for e in pending if 'data' in e]
+            duplicates = {}
+            for e in pending:
+                if 'duplicate_of' in e:
+                    duplicates[e['duplicate_of']] = duplicates.get(e['duplicate_of'], 0) + 1
+
+            try:
+                # Records come before the duplicate bumps, so a bump for a row
+                # queued in the same batch lands after its insert
+                with self.app.app_context():
+                    outcome = self.storage.add_feedback_batch([e['data'] for e in records], duplicates)
+            except Exception as e:
+                outcome = {'accepted': [], 'error': str(e), 'rejected': [
+                    {'index': i, 'reason': f'Database error: {e}'} for i in range(len(records))
+                ]}
+
+            if outcome.get('error') and attempt < self.max_retries:
+                attempt += 1
+                time.sleep(0.05 * (2 ** attempt))
+                continue
+
+            for rej in outcome['rejected']:
+                entry = records[rej['index']]
+                print(f"Write buffer: dropped feedback {entry['data']['id']}: {rej['reason']}")
+                entry['error'] = rej['reason']
+                if self.on_reject is not None:
+                    self.on_reject(entry['data'], rej['reason'])
+            if outcome.get('error') and duplicates:
+                print(f"Write buffer: dropped {sum(duplicates.values())} duplicate counts: {outcome['error']}")
+
+            for entry in pending:
+                if entry['done']:
+                    entry['done'].set()
+            return
+
+    def close(self, timeout=30):
+        """Flushes everything still queued. Safe to call more than once."""
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+            thread = self._thread
+            if thread and thread.is_alive():
+                self._queue.put(None)
+        if thread and thread.is_alive():
+            thread.join(timeout)
@@ -0,0 +1,87 @@
+"""
+Clustering time and peak memory at increasing batch sizes, for the standard
+engine (TF-IDF + KMeans) and the large-scale engine (hashing + SVD +
+MiniBatchKMeans). Each measurement runs in a fresh process so peak RSS is
+not inherited from an earlier, larger run.
+
+Usage:
+    python bench_clustering.py                       # 1k, 10k, 100k, 1M
+    python bench_clustering.py --sizes 1000 10000 --modes large
+"""
+import argparse
+import json
+import random
+import resource
+import subprocess
+import sys
+import time
+
+TOPICS = {
+    'wifi': "wifi internet hostel library signal slow dropping router bandwidth connection",
+    'food': "canteen mess food cold quality prices hygiene menu breakfast lunch",
+    'teaching': "teaching pace lectures professor fast notes syllabus exams doubts classes",
+    'transport': "bus timings transport late route crowded parking shuttle driver",
+    'facilities': "hostel rooms water cleaning fans lights repairs washrooms maintenance",
+}
+FILLER = "the is very really always again please our we students campus week today".split()
+# Long tail of rarer words (names, places, typos), drawn with a Zipf-like skew
+RARE_VOCAB = 50000
+
+
+def make_items(n, seed=0):
+    rng = random.Random(seed)
+    topics = [t.split() for t in TOPICS.values()]
+    items = []
+    for i in range(n):
+        rare = [f"x{int(rng.paretovariate(1.0)) % RARE_VOCAB}" for _ in range(3)]
+        words = rng.sample(topics[i % len(topics)], 4) + rng.sample(FILLER, 4) + rare
+        rng.shuffle(words)
+        items.append({'id': str(i), 'text': ' '.join(words)})
+    return items
+
+
+def run_single(size, mode):
+    from ai_module.processor import TextProcessor
+
+    items = make_items(size)
+    rss_before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    start = time.perf_counter()
+    clusters = TextProcessor().cluster_feedback(items, n_clusters=len(TOPICS), large=(mode == 'large'))
+    elapsed = time.perf_counter() - start
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss  # KiB on Linux
+    print(json.dumps({'size': size, 'mode': mode, 'seconds': round(elapsed, 2),
+                      'peak_rss_mb': round(peak / 1024, 1), 'input_rss_mb': round(rss_before / 1024, 1),
+                      'clusters': sorted(len(c['items']) for c in clusters)}))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark clustering engines.')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000, 100000, 1000000])
+    parser.add_argument('--modes', nargs='+', choices=['standard', 'large'], default=['standard', 'large'])
+    parser.add_argument('--standard-max', type=int, default=100000,
+                        help='Skip the standard engine above this size')
+    parser.add_argument('--single', nargs=2, metavar=('SIZE', 'MODE'), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.single:
+        run_single(int(args.single[0]), args.single[1])
+        return
+
+    print(f"{'size':>9} {'mode':>9} {'seconds':>9} {'peak MB':>9} {'input MB':>9}  cluster sizes")
+    for size in args.sizes:
+        for mode in args.modes:
+            if mode == 'standard' and size > args.standard_max:
+                print(f"{size:>9} {mode:>9} {'skipped':>9}")
+                continue
+            out = subprocess.run([sys.executable, __file__, '--single', str(size), mode],
+                                 capture_output=True, text=True)
+            lines = [l for l in out.stdout.splitlines() if l.startswith('{')]
+            if out.returncode or not lines:
+                print(f"{size:>9} {mode:>9} {'failed':>9}  {out.stderr.strip().splitlines()[-1:]}")
+                continue
+            r = json.loads(lines[-1])
+            print(f"{size:>9} {mode:>9} {r['seconds']:>9} {r['peak_rss_mb']:>9} {r['input_rss_mb']:>9}  {r['clusters']}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,49 @@
+"""
+Compares sequential and concurrent per-cluster LLM analysis against a mock
+client that sleeps to simulate network latency. No database or API key needed.
+
+Usage:
+    python bench_llm_concurrency.py --clusters 12 --latency-ms 300 --concurrency 1 4 8
+"""
+import argparse
+import time
+
+from ai_module.llm_client import MockLLMClient
+from ai_module.pipeline import analyze_clusters
+
+TOPICS = ["wifi keeps dropping in the hostel", "canteen food is cold", "teaching pace is too fast",
+          "library closes too early", "projector in lab 2 is broken"]
+
+
+def make_clusters(n):
+    clusters = []
+    for i in range(n):
+        topic = TOPICS[i % len(TOPICS)]
+        items = [{'id': f'{i}-{j}', 'text': f"{topic} ({j})"} for j in range(5)]
+        clusters.append({'cluster_id': i, 'theme': f"Theme {i}", 'items': items})
+    return clusters
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark concurrent LLM calls in the pipeline.')
+    parser.add_argument('--clusters', type=int, default=12)
+    parser.add_argument('--latency-ms', type=float, default=300)
+    parser.add_argument('--concurrency', type=int, nargs='+', default=[1, 2, 4, 8])
+    args = parser.parse_args()
+
+    llm = MockLLMClient(latency=args.latency_ms / 1000)
+    clusters = make_clusters(args.clusters)
+    baseline = None
+
+    print(f"{args.clusters} clusters, 2 calls each, {args.latency_ms:.0f} ms per call")
+    for concurrency in args.concurrency:
+        start = time.perf_counter()
+        results = analyze_clusters(llm, clusters, concurrency=concurrency)
+        elapsed = time.perf_counter() - start
+        baseline = baseline or elapsed
+        ordered = [r['theme'] for r in results] == [c['theme'] for c in clusters]
+        print(f"concurrency={concurrency:<3} {elapsed:7.2f}s  speedup x{baseline / elapsed:4.1f}  ordered={ordered}")
+
+
+if __name__ == '__main__':
+    main()
@@ -500,6 +500,16 @@ async function exportReport(type) {
     }
 }
 
+async function waitForJob(statusUrl, onStage) {
+    while (true) {
+        const res = await fetch(statusUrl);
+        const job = await res.json();
+        if (!res.ok || job.status === 'succeeded' || job.status === 'failed') return job;
+        if (job.stage && onStage) onStage(job.stage);
+        await new Promise(resolve => setTimeout(resolve, 1000));
+    }
+}
+
 async function triggerAnalysis() {
     const btn = event.currentTarget;
     const oldText = btn.innerHTML;
@@ -518,13 +528,26 @@ async function triggerAnalysis() {
         });
 
         const data = await response.json();
-        if (response.ok) {
+        if (!response.ok) {
+            alert("Analysis Failed: " + (data.error || "Unknown Error"));
+            return;
+        }
+
+        // The pipeline runs in the background; poll the job until it finishes
+        const job = await waitForJob(data.status_url, (stage) => {
+            btn.innerHTML = `<i class="fa-solid fa-circle-notch fa-spin"></i> Analyizing (${stage})...`;
+        });
+        if (job.status === 'succeeded') {
             // Reload Dashboard Data
             await fetchLatestResults();
             await fetchStats();
-            alert("Analysis Complete! New insights generated.");
+            if (job.result && job.result.status === 'degraded') {
+                alert(`AI service unavailable for ${job.result.degraded_clusters.length} cluster(s). Their feedback will be analyzed on the next run.`);
+            } else {
+                alert("Analysis Complete! New insights generated.");
+            }
         } else {
-            alert("Analysis Failed: " + (data.error || "Unknown Error"));
+            alert("Analysis Failed: " + (job.error || "Unknown Error"));
         }
     } catch (e) {
         console.error(e);
@@ -0,0 +1,152 @@
+"""
+Local stand-in for the Gemini REST API that injects errors and latency, for
+exercising the retry / rate-limit / circuit-breaker layer (ai_module/resilience.py).
+
+Serve it and point the app at it:
+    python fake_llm_server.py serve --port 8089 --error-rate 0.3 --latency-ms 200
+    GEMINI_API_KEY=fake GEMINI_API_ENDPOINT=http://127.0.0.1:8089 python run_analysis_local.py
+
+Or drive it directly through ResilientCaller (no Gemini SDK needed):
+    python fake_llm_server.py probe --requests 30 --error-rate 0.5 --error-status 503
+"""
+import argparse
+import json
+import random
+import re
+import threading
+import time
+import urllib.request
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from ai_module.resilience import CircuitBreaker, LLMUnavailableError, ResilientCaller, TokenBucket
+
+SOLUTION = {
+    "solution_title": "Fake Solution",
+    "steps": ["1. Investigate.", "2. Fix."],
+    "resources": {"Investment": "₹10,000", "Labor": "Staff", "Support": "Admin"},
+    "total_estimated_cost": "₹10,000",
+    "sentiment": "Neutral"
+}
+
+
+def fake_answer(prompt):
+    clusters = re.findall(r'^\s*Cluster (\d+):', prompt, re.M)
+    if clusters:
+        return json.dumps([{"cluster": int(n), "problem_statement": f"Fake problem statement {n}.",
+                            "solutions": [SOLUTION]} for n in clusters])
+    if 'Problem:' in prompt:
+        return json.dumps([SOLUTION])
+    return "Fake problem statement."
+
+
+class FakeGeminiHandler(BaseHTTPRequestHandler):
+    def log_message(self, fmt, *args):
+        pass
+
+    def _reply(self, status, body):
+        data = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        if self.path.startswith('/stats'):
+            return self._reply(200, self.server.stats)
+        self._reply(404, {'error': {'code': 404, 'message': 'Not found'}})
+
+    def do_POST(self):
+        server = self.server
+        body = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))) or b'{}')
+        with server.lock:
+            server.stats['requests'] += 1
+            n = server.stats['requests']
+        time.sleep(server.latency)
+
+        if n <= server.fail_first or random.random() < server.error_rate:
+            with server.lock:
+                server.stats['errors'] += 1
+            status = server.error_status
+            return self._reply(status, {'error': {'code': status, 'message': 'Injected failure', 'status': 'UNAVAILABLE'}})
+
+        if not self.path.endswith(':generateContent'):
+            return self._reply(404, {'error': {'code': 404, 'message': 'Not found'}})
+        prompt = ' '.join(p.get('text', '') for c in body.get('contents', []) for p in c.get('parts', []))
+        self._reply(200, {'candidates': [{
+            'content': {'parts': [{'text': fake_answer(prompt)}], 'role': 'model'},
+            'finishReason': 'STOP', 'index': 0
+        }]})
+
+
+def make_server(port, error_rate=0.0, error_status=503, latency_ms=0, fail_first=0):
+    server = ThreadingHTTPServer(('127.0.0.1', port), FakeGeminiHandler)
+    server.error_rate = error_rate
+    server.error_status = error_status
+    server.latency = latency_ms / 1000
+    server.fail_first = fail_first
+    server.lock = threading.Lock()
+    server.stats = {'requests': 0, 'errors': 0}
+    return server
+
+
+def probe(server, args):
+    url = f"http://127.0.0.1:{server.server_address[1]}/v1beta/models/fake:generateContent"
+    caller = ResilientCaller(
+        'fake', TokenBucket(args.rate_per_sec, args.rate_per_sec) if args.rate_per_sec else None,
+        CircuitBreaker(args.breaker_failures, args.breaker_reset),
+        max_retries=args.max_retries, base_delay=0.05, max_delay=1.0
+    )
+
+    def post():
+        req = urllib.request.Request(url, data=json.dumps({'contents': [{'parts': [{'text': 'hello'}]}]}).encode(),
+                                     headers={'Content-Type': 'application/json'})
+        with urllib.request.urlopen(req, timeout=10) as resp:
+            return json.loads(resp.read())
+
+    ok = failed = 0
+    start = time.perf_counter()
+    for _ in range(args.requests):
+        try:
+            caller.call(post)
+            ok += 1
+        except LLMUnavailableError as e:
+            failed += 1
+            print(f"  unavailable: {e}")
+    elapsed = time.perf_counter() - start
+    print(f"{ok} ok, {failed} unavailable in {elapsed:.2f}s; server saw {server.stats}; "
+          f"breaker {caller.breaker.state}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Fake Gemini endpoint with injected errors and latency.')
+    parser.add_argument('command', choices=['serve', 'probe'])
+    parser.add_argument('--port', type=int, default=8089)
+    parser.add_argument('--error-rate', type=float, default=0.0, help='Fraction of requests that fail')
+    parser.add_argument('--error-status', type=int, default=503, help='HTTP status of injected failures (429, 500, 503...)')
+    parser.add_argument('--fail-first', type=int, default=0, help='Fail the first N requests')
+    parser.add_argument('--latency-ms', type=float, default=0)
+    # probe only
+    parser.add_argument('--requests', type=int, default=20)
+    parser.add_argument('--max-retries', type=int, default=3)
+    parser.add_argument('--rate-per-sec', type=float, default=0)
+    parser.add_argument('--breaker-failures', type=int, default=5)
+    parser.add_argument('--breaker-reset', type=float, default=2.0)
+    args = parser.parse_args()
+
+    server = make_server(0 if args.command == 'probe' else args.port,
+                         args.error_rate, args.error_status, args.latency_ms, args.fail_first)
+    if args.command == 'serve':
+        print(f"Fake Gemini API on http://127.0.0.1:{args.port}")
+        server.serve_forever()
+        return
+
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    try:
+        probe(server, args)
+    finally:
+        server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
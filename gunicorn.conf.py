@@ -0,0 +1,11 @@
+# Loaded automatically by gunicorn from the working directory (see Procfile).
+
+def post_worker_init(worker):
+    # Pipeline job workers start with the process, so jobs queued before a restart resume
+    from backend.app import job_queue
+    job_queue.start()
+
+def worker_exit(server, worker):
+    # Flush feedback still sitting in the write-behind buffer before the worker goes away
+    from backend.app import write_buffer
+    write_buffer.close()
@@ -0,0 +1,211 @@
+"""
+Streams historical feedback exports into the Feedback table.
+
+Supported inputs:
+  - CSV with a header row (columns named like the Feedback fields)
+  - JSONL / NDJSON, one feedback object per line
+  - the local_db.json format ({"feedback": [...], ...}) used by data/local_db.json
+
+Records are read and written in fixed-size chunks, so memory use does not grow
+with the size of the file. On Postgres each chunk is loaded with COPY; on other
+databases it is a single executemany INSERT. The position in the file is
+saved to the import_checkpoints table in the same transaction as each chunk,
+and --resume continues from there. Ids already in the table, or repeated in
+the file, are skipped.
+
+Usage:
+    python import_feedback.py exports/2023.csv --institute-id INST_ABC123
+    python import_feedback.py exports/2023.jsonl --resume
+    python import_feedback.py data/local_db.json
+"""
+import argparse
+import csv
+import io
+import json
+import os
+import sys
+from datetime import datetime
+from itertools import islice
+
+from sqlalchemy import insert
+
+from backend.app import app, db
+from backend.storage import Feedback, ImportCheckpoint, Institute, SQLAlchemyStorage
+
+COLUMNS = ['id', 'institute_id', 'text', 'category', 'role', 'user_id', 'user_name',
+           'is_verified', 'timestamp', 'processed', 'status', 'session', 'fingerprint', 'duplicate_count']
+
+
+def detect_format(path):
+    ext = os.path.splitext(path)[1].lower()
+    if ext == '.csv':
+        return 'csv'
+    if ext in ('.jsonl', '.ndjson'):
+        return 'jsonl'
+    if ext == '.json':
+        return 'local_db'
+    raise ValueError(f"Cannot detect format of {path}; pass --format")
+
+
+def iter_records(path, fmt):
+    """Yields raw feedback dicts from the source file one at a time."""
+    if fmt == 'csv':
+        with open(path, newline='', encoding='utf-8') as f:
+            yield from csv.DictReader(f)
+    elif fmt == 'jsonl':
+        with open(path, encoding='utf-8') as f:
+            for line in f:
+                line = line.strip()
+                if line:
+                    yield json.loads(line)
+    elif fmt == 'local_db':
+        # The local JSON store is a single document, so it is loaded whole
+        with open(path, encoding='utf-8') as f:
+            yield from json.load(f).get('feedback', [])
+    else:
+        raise ValueError(f"Unknown format: {fmt}")
+
+
+def to_bool(value):
+    if isinstance(value, str):
+        return value.strip().lower() in ('1', 'true', 'yes', 't', 'y')
+    return bool(value)
+
+
+class Checkpoint:
+    """The import_checkpoints row of one source file."""
+
+    def __init__(self, source):
+        self.source = os.path.abspath(source)
+
+    def load(self):
+        row = db.session.get(ImportCheckpoint, self.source)
+        if row is None:
+            return {'records': 0, 'inserted': 0, 'rejected': 0}
+        return {'records': row.records, 'inserted': row.inserted, 'rejected': row.rejected}
+
+    def stage(self, state):
+        """Adds the new position to the open transaction; the chunk's commit writes it."""
+        db.session.merge(ImportCheckpoint(source=self.source, updated_at=datetime.now(), **state))
+
+    def clear(self):
+        db.session.query(ImportCheckpoint).filter_by(source=self.source).delete()
+        db.session.commit()
+
+
+class FeedbackImporter:
+    def __init__(self, storage, institute_id=None, create_institutes=False):
+        self.storage = storage
+        self.institute_id = institute_id
+        self.create_institutes = create_institutes
+        self.known_institutes = set()
+        self.use_copy = db.engine.dialect.name == 'postgresql'
+
+    def normalize(self, record):
+        data = {k: v for k, v in record.items() if v not in (None, '')}
+        if self.institute_id:
+            data['institute_id'] = self.institute_id
+        if not str(data.get('text', '')).strip():
+            return None
+        try:
+            row = self.storage._feedback_row(data)
+        except ValueError:
+            return None
+        row['is_verified'] = to_bool(row['is_verified'])
+        # Keep the archive's processed flag so old surveys are not re-analyzed
+        row['processed'] = to_bool(record.get('processed', False))
+        row['status'] = 'processed' if row['processed'] else 'pending'
+        return row
+
+    def ensure_institutes(self, rows):
+        needed = {r['institute_id'] for r in rows} - self.known_institutes
+        if not needed:
+            return
+        found = {i for (i,) in db.session.query(Institute.id).filter(Institute.id.in_(needed))}
+        missing = needed - found
+        if missing and self.create_institutes:
+            for inst_id in missing:
+                db.session.add(Institute(id=inst_id, name=inst_id, created_at=datetime.now().isoformat()))
+            db.session.commit()
+            found |= missing
+        self.known_institutes |= found
+
+    def drop_existing(self, rows):
+        # Ids from the archive are kept, so skip rows imported by an earlier run
+        # and all but the first of an id repeated within the chunk
+        rows = list({r['id']: r for r in reversed(rows)}.values())[::-1]
+        ids = [r['id'] for r in rows]
+        existing = {i for (i,) in db.session.query(Feedback.id).filter(Feedback.id.in_(ids))} if ids else set()
+        return [r for r in rows if r['id'] not in existing]
+
+    def write_chunk(self, rows):
+        if self.use_copy:
+            buf = io.StringIO()
+            writer = csv.writer(buf)
+            for r in rows:
+                writer.writerow([r[c] for c in COLUMNS])
+            buf.seek(0)
+            cursor = db.session.connection().connection.cursor()
+            cursor.copy_expert(
+                f"COPY feedback ({', '.join(COLUMNS)}) FROM STDIN WITH (FORMAT csv)", buf
+            )
+        else:
+            db.session.execute(insert(Feedback), rows)
+        # Keep the stats counters in step, in the same transaction as the chunk
+        self.storage._bump_counters(self.storage.counter_deltas(rows))
+
+    def run(self, records, checkpoint, chunk_size=5000):
+        state = checkpoint.load()
+        skip = state['records']
+        if skip:
+            print(f"Resuming after {skip} records...")
+        records = islice(records, skip, None)
+
+        while True:
+            chunk = list(islice(records, chunk_size))
+            if not chunk:
+                break
+
+            rows = [r for r in (self.normalize(rec) for rec in chunk) if r]
+            self.ensure_institutes(rows)
+            valid = [r for r in rows if r['institute_id'] in self.known_institutes]
+            valid = self.drop_existing(valid)
+            if valid:
+                self.write_chunk(valid)
+
+            state['records'] += len(chunk)
+            state['inserted'] += len(valid)
+            state['rejected'] += len(chunk) - len(valid)
+            checkpoint.stage(state)
+            db.session.commit()
+            print(f"Imported {state['inserted']} rows ({state['rejected']} rejected, {state['records']} read)")
+
+        return state
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Import historical feedback into Nexus.')
+    parser.add_argument('source', help='CSV, JSONL or local_db.json file')
+    parser.add_argument('--format', choices=['csv', 'jsonl', 'local_db'], help='Input format (default: by extension)')
+    parser.add_argument('--chunk-size', type=int, default=5000, help='Records per transaction')
+    parser.add_argument('--institute-id', help='Assign every record to this institute')
+    parser.add_argument('--create-institutes', action='store_true', help='Create institutes that do not exist yet')
+    parser.add_argument('--resume', action='store_true', help='Continue from the checkpoint instead of starting over')
+    args = parser.parse_args(argv)
+
+    fmt = args.format or detect_format(args.source)
+    checkpoint = Checkpoint(args.source)
+
+    with app.app_context():
+        db.create_all()
+        if not args.resume:
+            checkpoint.clear()
+        importer = FeedbackImporter(SQLAlchemyStorage(db), args.institute_id, args.create_institutes)
+        state = importer.run(iter_records(args.source, fmt), checkpoint, args.chunk_size)
+
+    print(f"Import Complete. {state['inserted']} inserted, {state['rejected']} rejected.")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,27 @@
+import argparse
+
+from backend.app import app, db
+from backend.storage import SQLAlchemyStorage
+
+def rebuild_stats():
+    """
+    Recomputes the feedback_stats counters from the raw feedback rows.
+    Run after bulk imports, manual SQL edits, or if the counters look wrong.
+    """
+    parser = argparse.ArgumentParser(description='Rebuild or check the feedback_stats counters.')
+    parser.add_argument('--institute-id', action='append', help='Limit to this institute (repeatable)')
+    parser.add_argument('--check', action='store_true', help='Only report mismatches, do not rewrite')
+    args = parser.parse_args()
+
+    with app.app_context():
+        storage = SQLAlchemyStorage(db)
+        mismatches = storage.reconcile_stat_counters(args.institute_id, repair=not args.check)
+        if not mismatches:
+            print("Counters are consistent with feedback.")
+        elif args.check:
+            print(f"{mismatches} counter rows differ from feedback. Run without --check to rebuild.")
+        else:
+            print(f"Rebuilt counters ({mismatches} rows were out of date).")
+
+if __name__ == "__main__":
+    rebuild_stats()
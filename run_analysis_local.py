@@ -1,9 +1,11 @@
 
+import sys
+
 from backend.storage import SQLAlchemyStorage, db
 from ai_module.pipeline import run_pipeline
 from backend.app import app
 
-def regenerate_insights():
+def regenerate_insights(bypass_cache=False):
     with app.app_context():
         print("Initializing Storage...")
         storage = SQLAlchemyStorage(db)
@@ -26,14 +28,16 @@ def regenerate_insights():
         print("Resetting 'processed' flags to force regeneration...")
         count = Feedback.query.update({Feedback.processed: False})
         db.session.commit()
+        storage.rebuild_stat_counters()
         print(f"Marked {count} items as unprocessed.")
 
 
         print("Running Pipeline with Gemini...")
-        result = run_pipeline(storage, institute_id=None) # Process all or default
+        # Unchanged clusters are answered from the LLM cache; --no-cache forces fresh calls
+        result = run_pipeline(storage, institute_id=None, bypass_cache=bypass_cache) # Process all or default
         
         print("Pipeline Result:", result)
         print("Done. Insights regenerated.")
 
 if __name__ == "__main__":
-    regenerate_insights()
+    regenerate_insights(bypass_cache='--no-cache' in sys.argv)
@@ -1,5 +1,5 @@
 from backend.app import app, db
-from backend.storage import Feedback, Result, Institute
+from backend.storage import Feedback, Result, Institute, SQLAlchemyStorage
 import uuid
 from datetime import datetime
 import json
@@ -58,6 +58,7 @@ def seed_sql_data():
             db.session.add(fb)
         
         db.session.commit()
+        SQLAlchemyStorage(db).rebuild_stat_counters(['Default'])
         print("Seeding Complete.")
 
 if __name__ == "__main__":
@@ -0,0 +1,52 @@
+"""
+Shared fixtures. The app is imported against a throwaway SQLite database with
+the mock LLM and no caches, so tests never touch a configured DATABASE_URL.
+"""
+import os
+import sys
+import tempfile
+import uuid
+
+_tmp = tempfile.mkdtemp(prefix='nexus-tests-')
+os.environ.update({
+    'DATABASE_URL': f"sqlite:///{os.path.join(_tmp, 'test.db')}",
+    'JOBS_DB': os.path.join(_tmp, 'jobs.db'),
+    'GEMINI_API_KEY': '',
+    'GOOGLE_CLOUD_PROJECT': '',
+    'LLM_CACHE': 'off',
+    'VECTOR_STORE': 'off',
+    'CACHE_BACKEND': 'none',
+    'FEEDBACK_WRITE_MODE': 'direct',
+})
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest
+
+from backend.app import app as flask_app, storage as app_storage
+
+
+@pytest.fixture
+def app():
+    with flask_app.app_context():
+        yield flask_app
+
+
+@pytest.fixture
+def storage(app):
+    return app_storage
+
+
+@pytest.fixture
+def institute(storage):
+    """A fresh institute id, so tests do not see each other's feedback."""
+    code = f"T{uuid.uuid4().hex[:8]}"
+    storage.register_institute({'code': code, 'name': code})
+    return code
+
+
+@pytest.fixture
+def no_backlog(storage):
+    """Marks every other test's feedback processed, for runs over all institutes."""
+    from backend.storage import Feedback, db
+    Feedback.query.filter_by(processed=False).update({'processed': True})
+    db.session.commit()
@@ -0,0 +1,37 @@
+from ai_module import pipeline
+from ai_module.llm_client import MockLLMClient
+from ai_module.processor import TextProcessor
+
+
+def _items(prefix, texts):
+    return [{'id': f'{prefix}{i}', 'text': t} for i, t in enumerate(texts)]
+
+
+def _totals(state):
+    return state['n_docs'], sum(c['count'] for c in state['clusters'])
+
+
+def test_concurrent_updates_are_both_kept(storage, institute, monkeypatch):
+    llm, processor = MockLLMClient(), TextProcessor()
+    wifi = ['wifi is slow in the hostel', 'hostel wifi keeps dropping', 'no wifi signal in rooms']
+    bus = ['bus is always late', 'college bus is overcrowded', 'bus timings are wrong']
+    library = ['library closes too early', 'library has no seats', 'library books are outdated']
+    canteen = ['canteen food is cold', 'canteen prices are high', 'canteen food is stale']
+    pipeline.incremental_update(storage, llm, processor, institute, _items('a', wifi + bus), concurrency=1, batch=False)
+    assert _totals(storage.get_cluster_state(institute)) == (6, 6)
+
+    # A second worker reads the state before the first one saves its next batch;
+    # both open a new cluster, so both pick the same next cluster id
+    stale = storage.get_cluster_state(institute)
+    pipeline.incremental_update(storage, llm, processor, institute, _items('b', wifi + library), concurrency=1,
+                                batch=False)
+    monkeypatch.setattr(storage, 'get_cluster_state', lambda institute_id=None: stale)
+    pipeline.incremental_update(storage, llm, processor, institute, _items('c', bus + canteen), concurrency=1,
+                                batch=False)
+    monkeypatch.undo()
+
+    state = storage.get_cluster_state(institute)
+    assert _totals(state) == (18, 18)
+    ids = [c['cluster_id'] for c in state['clusters']]
+    assert len(ids) == len(set(ids))
+    assert state['next_cluster_id'] > max(ids)
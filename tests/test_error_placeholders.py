@@ -0,0 +1,40 @@
+from ai_module import pipeline
+from ai_module.llm_client import ERROR_SOLUTION_TITLES, PROBLEM_STATEMENT_ERROR, MockLLMClient
+from backend.storage import Feedback
+
+
+class PlaceholderClient(MockLLMClient):
+    """Answers like a real client whose replies could not be parsed."""
+
+    def generate_problem_statement(self, texts):
+        return PROBLEM_STATEMENT_ERROR
+
+    def suggest_solutions(self, problem_statement):
+        return [{'solution_title': ERROR_SOLUTION_TITLES[1], 'steps': [], 'resources': {}}]
+
+
+class BadSolutionsClient(MockLLMClient):
+    def suggest_solutions(self, problem_statement):
+        return [{'solution_title': ERROR_SOLUTION_TITLES[0], 'steps': [], 'resources': {}}]
+
+
+def _cluster():
+    return {'cluster_id': 0, 'theme': 'Wifi', 'items': [{'id': '1', 'text': 'wifi is slow'}]}
+
+
+def test_placeholders_are_degraded():
+    for client in (PlaceholderClient(), BadSolutionsClient()):
+        [entry] = pipeline.analyze_clusters(client, [_cluster()], concurrency=1, batch=False)
+        assert entry['degraded'] is True
+        assert entry['problem_statement'] is None
+
+
+def test_placeholder_feedback_stays_unprocessed(storage, institute, monkeypatch):
+    monkeypatch.setattr(pipeline, 'get_llm_client', PlaceholderClient)
+    storage.add_feedback_batch([{'text': f'wifi is slow in block {i}', 'institute_id': institute} for i in range(6)])
+
+    result = pipeline.run_pipeline(storage, institute, incremental=False)
+    assert result['status'] == 'degraded'
+    assert result['clusters'] == []
+    assert Feedback.query.filter_by(institute_id=institute, processed=False).count() == 6
+    assert storage.get_latest_result_raw(institute)['id'] is None
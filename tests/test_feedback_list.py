@@ -0,0 +1,21 @@
+from backend.storage import Feedback, db
+
+
+def test_rows_without_timestamp_are_listed_last(storage, institute):
+    storage.add_feedback_batch([{'text': f'complaint {i}', 'institute_id': institute} for i in range(5)])
+    # Legacy rows: migration 2 leaves empty timestamps as NULL
+    legacy = [r.id for r in Feedback.query.filter_by(institute_id=institute).limit(2)]
+    Feedback.query.filter(Feedback.id.in_(legacy)).update({'timestamp': None}, synchronize_session=False)
+    db.session.commit()
+
+    seen, cursor = [], None
+    while True:
+        page = storage.list_feedback(institute_id=institute, limit=2, cursor=cursor)
+        seen.extend(page['items'])
+        cursor = page['next_cursor']
+        if cursor is None:
+            break
+
+    assert sorted(r['id'] for r in seen) == sorted(r.id for r in Feedback.query.filter_by(institute_id=institute))
+    assert [r['timestamp'] is None for r in seen] == [False, False, False, True, True]
+    assert [r['id'] for r in seen[3:]] == sorted(legacy, reverse=True)
@@ -0,0 +1,26 @@
+from ai_module.incremental import IncrementalClusterer
+from ai_module.processor import GENERAL_THEME, TextProcessor
+
+
+def _items(n, text='wifi is slow in the hostel'):
+    return [{'id': str(i), 'text': text} for i in range(n)]
+
+
+def test_single_auto_cluster_is_general_feedback():
+    processor = TextProcessor()
+    # Too few items to choose between counts, and items select_k puts in one cluster
+    for n in (2, 8):
+        [cluster] = processor.cluster_feedback(_items(n), n_clusters='auto')
+        assert cluster['theme'] == GENERAL_THEME
+
+
+def test_single_incremental_cluster_keeps_general_feedback():
+    clusterer = IncrementalClusterer(TextProcessor(), None, n_clusters='auto')
+    [group] = clusterer.assign(_items(8))
+    assert group['theme'] == GENERAL_THEME
+    clusterer.apply(group, {'problem_statement': 'Slow wifi', 'solutions': [], 'sample_texts': []})
+
+    # Feedback merged into it later does not rename it
+    [group] = clusterer.assign(_items(4))
+    assert not group['is_new']
+    assert group['theme'] == GENERAL_THEME
@@ -0,0 +1,27 @@
+from ai_module.incremental import IncrementalClusterer
+from ai_module.processor import TextProcessor
+
+
+def _items(texts):
+    return [{'id': str(i), 'text': t} for i, t in enumerate(texts)]
+
+
+def test_assign_without_any_terms_joins_an_existing_cluster():
+    clusterer = IncrementalClusterer(TextProcessor())
+    # Stop words only: the vocabulary stays empty
+    for group in clusterer.assign(_items(['the', 'and a', 'it is', 'of the'])):
+        clusterer.apply(group)
+    assert len(clusterer.clusters) == 1 and clusterer.vocabulary == []
+
+    groups = clusterer.assign(_items(['the', 'a']))
+    assert [(g['cluster_id'], g['is_new'], len(g['items'])) for g in groups] == [(0, False, 2)]
+
+
+def test_assign_leaves_the_state_alone():
+    clusterer = IncrementalClusterer(TextProcessor())
+    for group in clusterer.assign(_items(['wifi is slow', 'wifi drops often', 'slow wifi in hostel'])):
+        clusterer.apply(group)
+    before = (list(clusterer.vocabulary), list(clusterer.df), clusterer.n_docs, clusterer.next_cluster_id)
+
+    clusterer.assign(_items(['bus is late', 'late bus again', 'bus never on time', 'wifi is slow']))
+    assert (clusterer.vocabulary, clusterer.df, clusterer.n_docs, clusterer.next_cluster_id) == before
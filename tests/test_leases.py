@@ -0,0 +1,45 @@
+import time
+
+import pytest
+
+from ai_module import pipeline
+from ai_module.llm_client import MockLLMClient
+from backend.storage import Feedback
+
+
+def test_leases_are_renewed_while_analysis_runs(storage, institute, monkeypatch):
+    monkeypatch.setattr(pipeline, 'FEEDBACK_LEASE_SECONDS', 2)
+    stolen = []
+
+    class SlowClient(MockLLMClient):
+        def generate_problem_statement(self, texts):
+            if not stolen:
+                # Longer than the lease: without renewal the window would be up for grabs
+                time.sleep(3.5)
+                stolen.append(storage.claim_feedback('intruder', institute_id=institute, lease_seconds=60))
+            return super().generate_problem_statement(texts)
+
+    monkeypatch.setattr(pipeline, 'get_llm_client', SlowClient)
+    storage.add_feedback_batch([{'text': f'wifi is slow in block {i}', 'institute_id': institute} for i in range(4)])
+
+    pipeline.run_pipeline(storage, institute, incremental=False, concurrency=1)
+    assert stolen == [[]]
+    assert Feedback.query.filter_by(institute_id=institute, processed=False).count() == 0
+
+
+def test_leases_are_released_when_resuming_fails(storage, institute, monkeypatch):
+    storage.add_feedback_batch([{'text': f'bus is late on route {i}', 'institute_id': institute} for i in range(5)])
+
+    def fail(*args, **kwargs):
+        raise RuntimeError('disk full')
+    monkeypatch.setattr(pipeline, '_save_run', fail)
+    run_id = 'resume-fails'
+    with pytest.raises(RuntimeError):
+        pipeline.run_pipeline(storage, institute, incremental=False, run_id=run_id)
+    # Resuming re-leases the open window and fails again before any new window is claimed
+    with pytest.raises(RuntimeError):
+        pipeline.run_pipeline(storage, institute, incremental=False, run_id=run_id)
+
+    rows = Feedback.query.filter_by(institute_id=institute).all()
+    assert [r.lease_owner for r in rows] == [None] * 5
+    assert all(not r.processed for r in rows)
@@ -0,0 +1,50 @@
+import json
+
+from ai_module import pipeline
+from ai_module.llm_cache import CachedLLMClient, LLMResponseCache
+from ai_module.llm_client import BATCH_OUTPUT_TOKENS, BatchingLLMClient
+from ai_module.resilience import LLMUnavailableError
+
+
+class FlakyBatchClient(BatchingLLMClient):
+    """Answers the first `ok_batches` batched requests, then reports the service as unavailable."""
+    model_name = 'flaky'
+    # Two clusters per batch
+    max_output_tokens = 2 * BATCH_OUTPUT_TOKENS
+
+    def __init__(self, ok_batches=1):
+        super().__init__()
+        self.ok_batches = ok_batches
+        self.requests = 0
+
+    def _generate(self, prompt, **kwargs):
+        self.requests += 1
+        if self.requests > self.ok_batches:
+            raise LLMUnavailableError('rate limited')
+        n = prompt.count('Cluster ')
+        reply = [{'cluster': i + 1, 'problem_statement': f'Problem {i + 1}',
+                  'solutions': [{'solution_title': 'Fix it'}]} for i in range(n)]
+        return json.dumps(reply), None
+
+
+def _clusters(n):
+    return [{'cluster_id': i, 'theme': f'Theme {i}', 'items': [{'id': str(i), 'text': f'complaint {i}'}]}
+            for i in range(n)]
+
+
+def test_failed_batch_keeps_earlier_batches():
+    entries = pipeline.analyze_clusters(FlakyBatchClient(ok_batches=1), _clusters(4), batch=True)
+    assert [e.get('degraded', False) for e in entries] == [False, False, True, True]
+    assert entries[0]['problem_statement'] == 'Problem 1'
+    assert entries[2]['problem_statement'] is None
+
+
+def test_failed_batch_is_not_cached(tmp_path):
+    client = CachedLLMClient(FlakyBatchClient(ok_batches=1), LLMResponseCache(str(tmp_path / 'cache.db')))
+    results = client.analyze_clusters([[f'complaint {i}'] for i in range(4)])
+    assert [isinstance(r, LLMUnavailableError) for r in results] == [False, False, True, True]
+
+    retry = CachedLLMClient(FlakyBatchClient(ok_batches=0), client.cache)
+    results = retry.analyze_clusters([[f'complaint {i}'] for i in range(4)])
+    # The first two come from the cache; the others failed and were never stored
+    assert [isinstance(r, LLMUnavailableError) for r in results] == [False, False, True, True]
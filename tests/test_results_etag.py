@@ -0,0 +1,37 @@
+import uuid
+
+from ai_module import pipeline
+
+
+def _etag(client, institute_id):
+    return client.get(f'/api/results?institute_id={institute_id}').headers['ETag']
+
+
+def test_etag_changes_when_a_run_saves_again(app, storage, institute):
+    client = app.test_client()
+    run_id = str(uuid.uuid4())
+    storage.save_clusters(institute, [{'theme': 'A', 'count': 5}], run_id=run_id)
+    first = _etag(client, institute)
+    assert client.get(f'/api/results?institute_id={institute}', headers={'If-None-Match': first}).status_code == 304
+
+    storage.save_clusters(institute, [{'theme': 'A', 'count': 10}], run_id=run_id)
+    response = client.get(f'/api/results?institute_id={institute}', headers={'If-None-Match': first})
+    assert response.status_code == 200
+    assert response.json['clusters'][0]['count'] == 10
+    assert response.headers['ETag'] != first
+
+
+def test_every_window_save_gets_a_new_etag(app, storage, institute, monkeypatch):
+    client = app.test_client()
+    texts = ['wifi is slow in the hostel', 'bus is always late', 'mess food is cold', 'library closes early']
+    storage.add_feedback_batch([{'text': f'{texts[i % 4]} {i}', 'institute_id': institute} for i in range(17)])
+
+    etags, save = [], storage.save_clusters
+    def save_and_poll(*args, **kwargs):
+        save(*args, **kwargs)
+        etags.append(_etag(client, institute))
+    monkeypatch.setattr(storage, 'save_clusters', save_and_poll)
+
+    pipeline.run_pipeline(storage, institute, window_size=5, incremental=False)
+    assert len(etags) == 4
+    assert len(set(etags)) == 4
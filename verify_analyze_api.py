@@ -35,7 +35,7 @@ def verify_analyze():
         
         # 3. Trigger Analysis (The Button Click)
         print("[INFO] Triggering Analysis (Clicking 'Analyze')...")
-        r = requests.post(f"{BASE_URL}/api/process", json={"institute_id": code})
+        r = requests.post(f"{BASE_URL}/api/process", json={"institute_id": code, "wait": True})
         
         if r.status_code == 200:
             print("[SUCCESS] Analysis Complete!")
@@ -24,7 +24,7 @@ def verify():
     # 2. Trigger Processing
     print("2. Triggering processing...")
     try:
-        res = requests.post(f"{BASE_URL}/api/process")
+        res = requests.post(f"{BASE_URL}/api/process", json={"wait": True})
         res.raise_for_status()
         print("   Processing triggered successfully.")
     except Exception as e: